@@ -1,26 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
-from typing import List
-from app.db.models import WebhookDelivery, DeliveryAttempt 
-from app.db.base import get_db
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional
+from app.config import settings
+from app.db.base import get_async_db, AsyncSessionLocal, engine, async_engine
+from app.db.pool import pool_status
 from app.db.crud import (
     get_webhook_delivery, get_delivery_attempts,
-    get_recent_delivery_attempts, get_subscription
+    get_recent_delivery_attempts, get_subscription,
+    get_subscription_deliveries,
+    export_deliveries_query, export_attempts_query,
+    get_metrics_rollups, get_attempts
 )
+from app.db.models import DeliveryStatus, AttemptStatus
+from app.core.cache import get_cache_stats
+from app.core.fair_queue import queue_depths
+from app.core.export import CSV, MEDIA_TYPES, csv_header, encode_rows
+from app.core.rollups import summarize
+from app.core.pagination import decode_cursor, next_cursor, NEXT_CURSOR_HEADER
 from app.schemas.webhook import DeliveryResponse, DeliveryDetailResponse, DeliveryAttemptResponse
 
 router = APIRouter()
 
 @router.get("/deliveries/{delivery_id}", response_model=DeliveryDetailResponse)
-def get_delivery_status(delivery_id: uuid.UUID, db: Session = Depends(get_db)):
+async def get_delivery_status(delivery_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
     # Get delivery
-    delivery = get_webhook_delivery(db, delivery_id)
+    delivery = await db.run_sync(get_webhook_delivery, delivery_id)
     if not delivery:
         raise HTTPException(status_code=404, detail="Delivery not found")
     
     # Get all attempts for this delivery
-    attempts = get_delivery_attempts(db, delivery_id)
+    attempts = await db.run_sync(get_delivery_attempts, delivery_id)
     
     # Combine into response
     return {
@@ -28,30 +41,200 @@ def get_delivery_status(delivery_id: uuid.UUID, db: Session = Depends(get_db)):
         "attempts": attempts
     }
 
+@router.get("/deliveries/{delivery_id}/attempts", response_model=List[DeliveryAttemptResponse])
+async def list_delivery_attempts(
+    delivery_id: uuid.UUID,
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Keyset page over (delivery_id, attempt_number); the next cursor is returned in a header
+    after = decode_cursor(cursor, int)
+    attempts = await db.run_sync(get_delivery_attempts, delivery_id, limit=limit, after=after[0] if after else None)
+    
+    token = next_cursor(attempts, limit, "attempt_number")
+    if token:
+        response.headers[NEXT_CURSOR_HEADER] = token
+    return attempts
+
+@router.get("/attempts", response_model=List[DeliveryAttemptResponse])
+async def list_attempts(
+    response: Response,
+    min_latency_ms: Optional[float] = Query(None, ge=0),
+    max_latency_ms: Optional[float] = Query(None, ge=0),
+    subscription_id: Optional[uuid.UUID] = None,
+    status: Optional[AttemptStatus] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Newest attempts first, e.g. ?min_latency_ms=2000 to find slow receivers; keyset-paginated like the other lists
+    attempts = await db.run_sync(
+        get_attempts, limit, decode_cursor(cursor), min_latency_ms, max_latency_ms, subscription_id, status, start, end
+    )
+    
+    token = next_cursor(attempts, limit, "timestamp", "id")
+    if token:
+        response.headers[NEXT_CURSOR_HEADER] = token
+    return attempts
+
 @router.get("/subscriptions/{subscription_id}/deliveries", response_model=List[DeliveryResponse])
-def get_recent_deliveries(subscription_id: uuid.UUID, limit: int = 20, db: Session = Depends(get_db)):
+async def get_recent_deliveries(
+    subscription_id: uuid.UUID,
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     # Verify subscription exists
-    subscription = get_subscription(db, subscription_id)
+    subscription = await db.run_sync(get_subscription, subscription_id)
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
     
-    # Query WebhookDelivery directly
-    deliveries = db.query(WebhookDelivery) \
-        .filter(WebhookDelivery.subscription_id == subscription_id) \
-        .order_by(WebhookDelivery.created_at.desc()) \
-        .limit(limit) \
-        .all()
+    # Keyset page over (subscription_id, created_at, id), newest first
+    deliveries = await db.run_sync(get_subscription_deliveries, subscription_id, limit, before=decode_cursor(cursor))
     
+    token = next_cursor(deliveries, limit, "created_at", "id")
+    if token:
+        response.headers[NEXT_CURSOR_HEADER] = token
     return deliveries
 
 @router.get("/subscriptions/{subscription_id}/attempts", response_model=List[DeliveryAttemptResponse])
-def get_recent_attempts(subscription_id: uuid.UUID, limit: int = 20, db: Session = Depends(get_db)):
+async def get_recent_attempts(
+    subscription_id: uuid.UUID,
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     # Verify subscription exists
-    subscription = get_subscription(db, subscription_id)
+    subscription = await db.run_sync(get_subscription, subscription_id)
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
     
-    # Get recent attempts
-    attempts = get_recent_delivery_attempts(db, subscription_id, limit)
+    # Get recent attempts, continuing after the cursor if one was given
+    attempts = await db.run_sync(get_recent_delivery_attempts, subscription_id, limit, before=decode_cursor(cursor))
+    
+    token = next_cursor(attempts, limit, "timestamp", "id")
+    if token:
+        response.headers[NEXT_CURSOR_HEADER] = token
+    return attempts
+
+@router.get("/cache")
+async def get_subscription_cache_stats():
+    # Hit/miss counters for the two-tier subscription cache used by delivery workers
+    return await run_in_threadpool(get_cache_stats)
+
+@router.get("/db-pool")
+async def get_db_pool_stats():
+    # Pool usage for this API process: the async pool serves requests, the sync one startup and fallbacks
+    return {"async": pool_status(async_engine), "sync": pool_status(engine)}
+
+@router.get("/fair-queues")
+async def get_fair_queue_depths(limit: int = Query(100, ge=1, le=1000)):
+    # Per-subscription backlog under fair scheduling, in round-robin order
+    return await run_in_threadpool(queue_depths, limit)
+
+
+async def _stream_export(query, fmt: str) -> AsyncIterator[bytes]:
+    # Own session: the export outlives the request handler while the body streams
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.EXPORT_YIELD_PER))
+        fields = list(result.keys())
+        if fmt == CSV:
+            yield csv_header(fields)
+        async for rows in result.partitions():
+            yield encode_rows(rows, fields, fmt)
+
+@router.get("/export")
+async def export_logs(
+    kind: str = Query("deliveries", pattern="^(deliveries|attempts)$"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    subscription_id: Optional[uuid.UUID] = None,
+    event_type: Optional[str] = None,
+    status: Optional[str] = None
+):
+    # Stream deliveries or attempts in [start, end) through a server-side cursor, in constant memory
+    status_enum = DeliveryStatus if kind == "deliveries" else AttemptStatus
+    try:
+        status_filter = status_enum(status.upper()) if status else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown {kind} status: {status}")
+    
+    build_query = export_deliveries_query if kind == "deliveries" else export_attempts_query
+    query = build_query(start, end, subscription_id, event_type, status_filter)
+    return StreamingResponse(
+        _stream_export(query, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'}
+    )
+
+
+def _summary_window(start: Optional[datetime], end: Optional[datetime]):
+    # Rollup buckets are UTC; naive bounds are taken as UTC too. Defaults to the last hour.
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(hours=1)
+    return tuple(value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in (start, end))
+
+@router.get("/summary")
+async def get_delivery_summary(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    subscription_id: Optional[uuid.UUID] = None,
+    event_type: Optional[str] = None,
+    group_by: Optional[str] = Query(None, pattern="^(subscription_id|event_type)$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Success rate, status code classes and latency percentiles from the per-minute rollups, not raw attempts
+    start, end = _summary_window(start, end)
+    [totals] = await db.run_sync(get_metrics_rollups, start, end, subscription_id, event_type)
+    summary = {"start": start, "end": end, **summarize(totals)}
+    if group_by:
+        groups = await db.run_sync(get_metrics_rollups, start, end, subscription_id, event_type, [group_by])
+        summary["groups"] = [{group_by: group[group_by], **summarize(group)} for group in groups]
+    return summary
+
+@router.get("/summary/timeseries")
+async def get_delivery_timeseries(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    subscription_id: Optional[uuid.UUID] = None,
+    event_type: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # One point per minute that had attempts
+    start, end = _summary_window(start, end)
+    buckets = await db.run_sync(get_metrics_rollups, start, end, subscription_id, event_type, ["bucket"])
+    return {
+        "start": start,
+        "end": end,
+        "points": [{"bucket": bucket["bucket"], **summarize(bucket)} for bucket in buckets]
+    }
+
+@router.get("/subscriptions/{subscription_id}/summary")
+async def get_subscription_summary(
+    subscription_id: uuid.UUID,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Verify subscription exists
+    subscription = await db.run_sync(get_subscription, subscription_id)
+    if not subscription:
+        raise HTTPException(status_code=404, detail="Subscription not found")
     
-    return attempts
\ No newline at end of file
+    start, end = _summary_window(start, end)
+    [totals] = await db.run_sync(get_metrics_rollups, start, end, subscription_id)
+    by_event_type = await db.run_sync(get_metrics_rollups, start, end, subscription_id, None, ["event_type"])
+    return {
+        "subscription_id": subscription_id,
+        "start": start,
+        "end": end,
+        **summarize(totals),
+        "event_types": [{"event_type": group["event_type"] or None, **summarize(group)} for group in by_event_type]
+    }
@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import uuid
 import logging
-from app.db.base import get_db
+from app.db.base import get_async_db
 from app.db.crud import (
     create_subscription, get_subscription, get_subscriptions,
-    update_subscription, delete_subscription
+    update_subscription, delete_subscription, delete_subscription_logs,
+    update_subscription_event_types as update_event_types
 )
-from app.db.models import WebhookDelivery, Subscription, DeliveryAttempt
+from app.core.routing import publish_subscription_change
+from app.core.cache import write_through_subscription, invalidate_subscription_cache
+from app.core.fair_queue import set_subscription_weight
+from app.core.pagination import decode_cursor, next_cursor, NEXT_CURSOR_HEADER
 from app.schemas.subscription import (
     SubscriptionCreate, SubscriptionResponse, SubscriptionUpdate
 )
@@ -21,28 +26,45 @@ logger.setLevel(logging.INFO)  # Set log level to INFO
 
 
 @router.post("/", response_model=SubscriptionResponse, status_code=status.HTTP_201_CREATED)
-def create_subscription_api(subscription: SubscriptionCreate, db: Session = Depends(get_db)):
+async def create_subscription_api(subscription: SubscriptionCreate, db: AsyncSession = Depends(get_async_db)):
     # Create subscription in database
-    new_subscription = create_subscription(
-        db=db,
+    new_subscription = await db.run_sync(
+        create_subscription,
         name=subscription.name,
         target_url=str(subscription.target_url),
-        secret_key=subscription.secret_key
+        secret_key=subscription.secret_key,
+        rate_limit_per_second=subscription.rate_limit_per_second,
+        rate_limit_burst=subscription.rate_limit_burst,
+        delivery_weight=subscription.delivery_weight
     )
+    await run_in_threadpool(publish_subscription_change, new_subscription)
+    if new_subscription.delivery_weight:
+        await run_in_threadpool(set_subscription_weight, new_subscription.id, new_subscription.delivery_weight)
     
     return new_subscription
 
 
 @router.get("/", response_model=List[SubscriptionResponse])
-def read_subscriptions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    subscriptions = get_subscriptions(db, skip=skip, limit=limit)
+async def read_subscriptions(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Prefer the cursor from the X-Next-Cursor header over skip for deep pages
+    subscriptions = await db.run_sync(get_subscriptions, skip=skip, limit=limit, after=decode_cursor(cursor))
+    
+    token = next_cursor(subscriptions, limit, "created_at", "id")
+    if token:
+        response.headers[NEXT_CURSOR_HEADER] = token
     return subscriptions
 
 
 @router.get("/{subscription_id}", response_model=SubscriptionResponse)
-def read_subscription(subscription_id: uuid.UUID, db: Session = Depends(get_db)):
+async def read_subscription(subscription_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
     logger.info(f"Fetching subscription {subscription_id} from DB")
-    db_subscription = get_subscription(db, subscription_id=subscription_id)
+    db_subscription = await db.run_sync(get_subscription, subscription_id=subscription_id)
     if db_subscription is None:
         raise HTTPException(status_code=404, detail="Subscription not found")
     
@@ -50,20 +72,14 @@ def read_subscription(subscription_id: uuid.UUID, db: Session = Depends(get_db))
 
 
 @router.put("/{subscription_id}", response_model=SubscriptionResponse)
-def update_subscription_api(
+async def update_subscription_api(
     subscription_id: uuid.UUID,
     subscription: SubscriptionUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         logger.info(f"Updating subscription with ID: {subscription_id}")
         
-        # First get the existing subscription
-        db_subscription = db.query(Subscription).get(subscription_id)
-        if not db_subscription:
-            logger.warning(f"Subscription {subscription_id} not found")
-            raise HTTPException(status_code=404, detail="Subscription not found")
-        
         # Get update data
         update_data = subscription.dict(exclude_unset=True)
         
@@ -71,45 +87,38 @@ def update_subscription_api(
         if "target_url" in update_data and update_data["target_url"] is not None:
             update_data["target_url"] = str(update_data["target_url"])
         
-        # Update fields
-        for field, value in update_data.items():
-            setattr(db_subscription, field, value)
+        # Update fields and commit
+        db_subscription = await db.run_sync(update_subscription, subscription_id, update_data)
+        if not db_subscription:
+            logger.warning(f"Subscription {subscription_id} not found")
+            raise HTTPException(status_code=404, detail="Subscription not found")
         
-        # Commit changes
-        db.add(db_subscription)
-        db.commit()
-        db.refresh(db_subscription)
+        await run_in_threadpool(write_through_subscription, db_subscription)
+        await run_in_threadpool(publish_subscription_change, db_subscription)
+        if "delivery_weight" in update_data:
+            await run_in_threadpool(set_subscription_weight, subscription_id, db_subscription.delivery_weight)
         
         logger.info(f"Subscription {subscription_id} updated successfully")
         return db_subscription
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error updating subscription {subscription_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 @router.delete("/{subscription_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_subscription_api(subscription_id: uuid.UUID, db: Session = Depends(get_db)):
-    # Step 1: Get all delivery IDs related to the subscription
-    delivery_ids = db.query(WebhookDelivery.id).filter(
-        WebhookDelivery.subscription_id == subscription_id
-    ).subquery()
+async def delete_subscription_api(subscription_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
+    # Delete the subscription's delivery attempts and deliveries first
+    await db.run_sync(delete_subscription_logs, subscription_id)
 
-    # Step 2: Delete all related delivery attempts
-    db.query(DeliveryAttempt).filter(
-        DeliveryAttempt.delivery_id.in_(delivery_ids)
-    ).delete(synchronize_session=False)
-
-    # Step 3: Delete all related webhook deliveries
-    db.query(WebhookDelivery).filter(
-        WebhookDelivery.subscription_id == subscription_id
-    ).delete(synchronize_session=False)
-
-    # Step 4: Delete the subscription
-    success = delete_subscription(db, subscription_id=subscription_id)
+    # Then the subscription itself
+    success = await db.run_sync(delete_subscription, subscription_id=subscription_id)
     if not success:
         raise HTTPException(status_code=404, detail="Subscription not found")
+    await run_in_threadpool(invalidate_subscription_cache, str(subscription_id))
+    await run_in_threadpool(publish_subscription_change, subscription_id=subscription_id)
+    await run_in_threadpool(set_subscription_weight, subscription_id, None)
     
     return None
 
@@ -117,14 +126,12 @@ def delete_subscription_api(subscription_id: uuid.UUID, db: Session = Depends(ge
 async def update_subscription_event_types(
     subscription_id: uuid.UUID,
     event_types: list[str],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    subscription = get_subscription(db, subscription_id)
+    subscription = await db.run_sync(update_event_types, subscription_id, event_types)
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
-    
-    subscription.event_types = event_types
-    db.commit()
+    await run_in_threadpool(publish_subscription_change, subscription)
     
     return {"id": str(subscription.id), "event_types": subscription.event_types}
 
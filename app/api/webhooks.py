@@ -1,77 +1,314 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
 import uuid
-from typing import Dict, Any, List
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 
-from app.db.base import get_db
+from app.db.base import get_async_db
 from app.db.crud import (
     create_webhook_delivery, 
+    create_webhook_deliveries,
+    create_idempotent_deliveries,
+    create_batch_deliveries,
     get_subscription,
+    get_subscriptions_by_ids,
     get_subscriptions_for_event_type,
     update_subscription_event_types
 )
-from app.tasks.delivery import process_webhook
+from app.core.routing import subscription_router, publish_subscription_change, receives
+from app.core.ingest_buffer import buffer_deliveries
+from app.core.payloads import parse_json, serialize_payload
+from app.core.idempotency import (
+    IDEMPOTENCY_HEADER, IN_PROGRESS,
+    claim_idempotency_key, remember_idempotency_key, release_idempotency_key
+)
+from app.db.models import ALL_EVENT_TYPES
+from app.schemas.webhook import BatchIngestItem
+from app.config import settings
+from app.tasks.delivery import enqueue_deliveries
 
 router = APIRouter()
 
+async def _ingest_idempotent(
+    db: AsyncSession,
+    scope: str,
+    idempotency_key: str,
+    subscription_ids: List[uuid.UUID],
+    body: bytes,
+    event_type: Optional[str]
+) -> Tuple[List[str], str]:
+    """
+    Accept an ingest carrying an Idempotency-Key. Returns the delivery ids and
+    how they were accepted: "created" (caller enqueues), "buffered" or "duplicate".
+    """
+    # Redis SET NX answers most retries without touching the database
+    original = await run_in_threadpool(claim_idempotency_key, scope, idempotency_key)
+    if original is IN_PROGRESS:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+    if original:
+        return original, "duplicate"
+    
+    try:
+        outcome = "buffered"
+        # Buffered events are deduplicated by the Redis key alone
+        delivery_ids = None
+        if settings.INGEST_BUFFER_ENABLED:
+            delivery_ids = await run_in_threadpool(buffer_deliveries, subscription_ids, body, event_type)
+        if not delivery_ids:
+            # The key's unique index makes concurrent or post-Redis-expiry retries converge on one set of deliveries
+            created_ids, created = await db.run_sync(
+                create_idempotent_deliveries, scope, idempotency_key, subscription_ids, body, event_type
+            )
+            delivery_ids = [str(delivery_id) for delivery_id in created_ids]
+            outcome = "created" if created else "duplicate"
+    except Exception:
+        await run_in_threadpool(release_idempotency_key, scope, idempotency_key)
+        raise
+    
+    await run_in_threadpool(remember_idempotency_key, scope, idempotency_key, delivery_ids)
+    return delivery_ids, outcome
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+async def _batch_records(request: Request) -> AsyncIterator[Any]:
+    """
+    Records of a batch body: a JSON array, or NDJSON parsed line by line as the
+    body streams in. A line that isn't valid JSON yields its ValueError in
+    place of the record so the rest of the batch still goes through.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in NDJSON_CONTENT_TYPES:
+        try:
+            records = parse_json(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        for record in records:
+            yield record
+        return
+    
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield parse_json(line)
+                except ValueError as e:
+                    yield e
+    if pending.strip():
+        try:
+            yield parse_json(pending)
+        except ValueError as e:
+            yield e
+
+@router.post("/ingest/batch", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_webhook_batch(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ingest many events in one request, as a JSON array or NDJSON
+    (``Content-Type: application/x-ndjson``) of ``{event_type, payload, subscription_id?}``
+    records. Records with a ``subscription_id`` go to that subscription only,
+    the rest fan out by event type. Returns one result per record, in order.
+    """
+    results: List[Dict[str, Any]] = []
+    items: List[Tuple[int, BatchIngestItem]] = []
+    async for record in _batch_records(request):
+        if len(results) >= settings.INGEST_BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"A batch may contain at most {settings.INGEST_BATCH_MAX_ITEMS} events"
+            )
+        results.append(None)
+        index = len(results) - 1
+        if isinstance(record, ValueError):
+            results[index] = {"index": index, "status": "rejected", "error": f"Invalid JSON: {str(record)}"}
+            continue
+        try:
+            items.append((index, BatchIngestItem.model_validate(record)))
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "rejected", "error": str(e.errors(include_url=False))}
+    
+    # Resolve every distinct target once: targeted subscriptions in one query, fan-outs per event type
+    targeted = {item.subscription_id for _, item in items if item.subscription_id}
+    routes = {}
+    if subscription_router.ready:
+        routes = {subscription_id: subscription_router.get(subscription_id) for subscription_id in targeted}
+    # The router only holds active subscriptions; ask the DB about the rest
+    unresolved = [subscription_id for subscription_id in targeted if not routes.get(subscription_id)]
+    if unresolved:
+        for subscription in await db.run_sync(get_subscriptions_by_ids, unresolved):
+            routes[subscription.id] = subscription
+    
+    fan_out = {}
+    for event_type in {item.event_type for _, item in items if not item.subscription_id}:
+        if subscription_router.ready:
+            fan_out[event_type] = [route.id for route in subscription_router.route(event_type)]
+        else:
+            fan_out[event_type] = [
+                subscription.id
+                for subscription in await db.run_sync(get_subscriptions_for_event_type, event_type)
+                if receives(subscription.event_types, event_type)
+            ]
+    
+    events = []
+    accepted = []
+    for index, item in items:
+        if item.subscription_id:
+            route = routes.get(item.subscription_id)
+            if not route:
+                results[index] = {"index": index, "status": "rejected", "error": "Subscription not found"}
+                continue
+            if not getattr(route, "is_active", True):
+                results[index] = {"index": index, "status": "rejected", "error": "Subscription is not active"}
+                continue
+            if item.event_type and route.event_types and item.event_type not in route.event_types:
+                results[index] = {
+                    "index": index,
+                    "status": "skipped",
+                    "message": f"Subscription is not interested in {item.event_type} events"
+                }
+                continue
+            subscription_ids = [item.subscription_id]
+        else:
+            subscription_ids = fan_out[item.event_type]
+            if not subscription_ids:
+                results[index] = {"index": index, "status": "accepted", "delivery_ids": [], "message": "No matching subscriptions"}
+                continue
+        events.append((subscription_ids, serialize_payload(item.payload), item.event_type))
+        accepted.append(index)
+    
+    # One payload upsert, one multi-row INSERT and one commit for the whole batch
+    created = await db.run_sync(create_batch_deliveries, events)
+    delivery_ids = []
+    delivery_subscription_ids = [subscription_id for subscription_ids, _, _ in events for subscription_id in subscription_ids]
+    for index, event_delivery_ids in zip(accepted, created):
+        event_delivery_ids = [str(delivery_id) for delivery_id in event_delivery_ids]
+        delivery_ids.extend(event_delivery_ids)
+        results[index] = {"index": index, "status": "accepted", "delivery_ids": event_delivery_ids}
+    
+    if delivery_ids:
+        background_tasks.add_task(enqueue_deliveries, delivery_ids, delivery_subscription_ids)
+    
+    return {
+        "status": "accepted",
+        "accepted": sum(1 for result in results if result["status"] == "accepted"),
+        "delivery_count": len(delivery_ids),
+        "results": results
+    }
+
 @router.post("/ingest/{subscription_id}", status_code=status.HTTP_202_ACCEPTED)
 async def ingest_webhook(
     subscription_id: uuid.UUID,
     payload: Dict[str, Any],
+    request: Request,
     background_tasks: BackgroundTasks,
     event_type: str = Query(None, description="Type of event being delivered (e.g., order.created)"),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER, max_length=255),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Verify subscription exists
-    subscription = get_subscription(db, subscription_id)
-    if not subscription:
-        raise HTTPException(status_code=404, detail="Subscription not found")
-    
-    if not subscription.is_active:
-        raise HTTPException(status_code=400, detail="Subscription is not active")
+    # Resolve from the in-process router; fall back to the DB for unknown or inactive subscriptions
+    route = subscription_router.get(subscription_id) if subscription_router.ready else None
+    if route:
+        subscription_event_types = route.event_types
+    else:
+        # Verify subscription exists
+        subscription = await db.run_sync(get_subscription, subscription_id)
+        if not subscription:
+            raise HTTPException(status_code=404, detail="Subscription not found")
+        
+        if not subscription.is_active:
+            raise HTTPException(status_code=400, detail="Subscription is not active")
+        subscription_event_types = subscription.event_types
     
     # If event_type is specified, check if subscription is interested in this event
-    if event_type and subscription.event_types and len(subscription.event_types) > 0:
-        if event_type not in subscription.event_types:
+    if event_type and subscription_event_types and len(subscription_event_types) > 0:
+        if event_type not in subscription_event_types:
             # The subscription doesn't want this event type, so we don't deliver it
             return {"status": "skipped", "message": f"Subscription is not interested in {event_type} events"}
     
+    # Persist the body exactly as received; workers sign and send these bytes
+    body = await request.body()
+    
+    # Retried requests get the original delivery back instead of a new one
+    if idempotency_key:
+        delivery_ids, outcome = await _ingest_idempotent(
+            db, str(subscription_id), idempotency_key, [subscription_id], body, event_type
+        )
+        if outcome == "created":
+            background_tasks.add_task(enqueue_deliveries, delivery_ids, [subscription_id])
+        return {"status": "accepted", "delivery_id": delivery_ids[0], "duplicate": outcome == "duplicate"}
+    
+    # Buffered mode: acknowledge once the event is in the Redis Stream; the flusher persists and enqueues it
+    if settings.INGEST_BUFFER_ENABLED:
+        delivery_ids = await run_in_threadpool(buffer_deliveries, [subscription_id], body, event_type)
+        if delivery_ids:
+            return {"status": "accepted", "delivery_id": delivery_ids[0]}
+    
     # Create webhook delivery record
-    delivery = create_webhook_delivery(db, subscription_id, payload, event_type)
+    delivery = await db.run_sync(create_webhook_delivery, subscription_id, body, event_type)
     
     # Queue webhook processing task
-    background_tasks.add_task(process_webhook.delay, str(delivery.id))
+    background_tasks.add_task(enqueue_deliveries, [str(delivery.id)], [subscription_id])
     
     return {"status": "accepted", "delivery_id": str(delivery.id)}
 
 @router.post("/ingest", status_code=status.HTTP_202_ACCEPTED)
 async def ingest_webhook_to_all(
     payload: Dict[str, Any],
+    request: Request,
     background_tasks: BackgroundTasks,
     event_type: str = Query(None, description="Type of event being delivered (e.g., order.created)"),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER, max_length=255),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        # Find all subscriptions matching this event type
-        subscriptions = get_subscriptions_for_event_type(db, event_type)
+        if subscription_router.ready:
+            # Dict lookup in the in-process router, no SQL
+            subscription_ids = [route.id for route in subscription_router.route(event_type)]
+        else:
+            # Find all subscriptions matching this event type, by the same rule as the router
+            subscription_ids = [
+                subscription.id
+                for subscription in await db.run_sync(get_subscriptions_for_event_type, event_type)
+                if receives(subscription.event_types, event_type)
+            ]
         
-        if not subscriptions:
+        if not subscription_ids:
             return {"status": "accepted", "message": "No matching subscriptions"}
         
-        delivery_ids = []
+        body = await request.body()
+        
+        if idempotency_key:
+            delivery_ids, outcome = await _ingest_idempotent(
+                db, ALL_EVENT_TYPES, idempotency_key, subscription_ids, body, event_type
+            )
+            if outcome == "created":
+                background_tasks.add_task(enqueue_deliveries, delivery_ids)
+            return {
+                "status": "accepted",
+                "delivery_count": len(delivery_ids),
+                "delivery_ids": delivery_ids,
+                "duplicate": outcome == "duplicate"
+            }
+        
+        if settings.INGEST_BUFFER_ENABLED:
+            delivery_ids = await run_in_threadpool(buffer_deliveries, subscription_ids, body, event_type)
+            if delivery_ids:
+                return {"status": "accepted", "delivery_count": len(delivery_ids), "delivery_ids": delivery_ids}
+        
+        # Create all deliveries in a single multi-row insert and transaction
+        created = await db.run_sync(create_webhook_deliveries, subscription_ids, body, event_type)
+        delivery_ids = [str(delivery_id) for delivery_id in created]
         
-        # Create webhook delivery for each matching subscription
-        for subscription in subscriptions:
-            # Double-check if subscription wants this event type
-            if subscription.event_types and len(subscription.event_types) > 0:
-                if event_type not in subscription.event_types:
-                    continue  # Skip this subscription
-                    
-            delivery = create_webhook_delivery(db, subscription.id, payload, event_type)
-            delivery_ids.append(str(delivery.id))
-            
-            # Queue webhook processing task
-            background_tasks.add_task(process_webhook.delay, str(delivery.id))
+        # Queue all webhook processing tasks as one batch
+        background_tasks.add_task(enqueue_deliveries, delivery_ids, subscription_ids)
         
         return {"status": "accepted", "delivery_count": len(delivery_ids), "delivery_ids": delivery_ids}
     except Exception as e:
@@ -82,13 +319,14 @@ async def ingest_webhook_to_all(
 async def update_subscription_events(
     subscription_id: uuid.UUID,
     event_types: List[str],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    subscription = get_subscription(db, subscription_id)
+    subscription = await db.run_sync(get_subscription, subscription_id)
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
     
-    updated_subscription = update_subscription_event_types(db, subscription_id, event_types)
+    updated_subscription = await db.run_sync(update_subscription_event_types, subscription_id, event_types)
+    await run_in_threadpool(publish_subscription_change, updated_subscription)
     
     return {
         "id": str(updated_subscription.id),
@@ -3,12 +3,110 @@ from pydantic import ConfigDict
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+
+    # Connection pool policy per process role: "api", "worker" or "beat"
+    DB_PROCESS_ROLE: str = "api"
+    DB_POOL_SIZE_API: int = 10
+    DB_MAX_OVERFLOW_API: int = 10
+    DB_POOL_SIZE_WORKER: int = 10
+    DB_MAX_OVERFLOW_WORKER: int = 30
+    # Worker threads (Celery --pool threads); the worker pool's overflow grows to one connection per thread
+    WORKER_CONCURRENCY: int = 64
+    DB_POOL_SIZE_BEAT: int = 1
+    DB_MAX_OVERFLOW_BEAT: int = 1
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 300  # Reconnect before the server or pooler drops idle connections
+    DB_POOL_PRE_PING: bool = True
+    # Behind PgBouncer/Neon pooler (transaction mode): NullPool for worker and beat, no prepared statement cache
+    DB_EXTERNAL_POOLER: bool = False
     REDIS_URL: str = "redis://redis:6379/0"  # Default fallback
     MAX_RETRY_ATTEMPTS: int = 5
     LOG_RETENTION_HOURS: int = 72
+    CLEANUP_BATCH_SIZE: int = 5000
+    CLEANUP_MAX_SECONDS: float = 200.0  # Stay under the task soft time limit
+
+    # Range-partition the log tables by time (PostgreSQL only; applies when the tables are created)
+    DB_PARTITIONING_ENABLED: bool = False
+    DB_PARTITION_INTERVAL: str = "day"  # "hour" or "day"
+    DB_PARTITION_PREMAKE: int = 3
     WEBHOOK_TIMEOUT: int = 10
     SECRET_KEY: str = "changeme"  # Add this if you plan to use signature verification
 
+    # In-process subscription router (kept in sync over Redis pub/sub)
+    SUBSCRIPTION_ROUTER_ENABLED: bool = True
+    ROUTER_RESUBSCRIBE_SECONDS: int = 5
+
+    # Two-tier subscription cache used by delivery workers
+    SUBSCRIPTION_CACHE_TTL: int = 1800
+    SUBSCRIPTION_LOCAL_CACHE_SIZE: int = 10000
+    SUBSCRIPTION_LOCAL_CACHE_TTL: int = 30
+    CACHE_STATS_FLUSH_SECONDS: int = 10
+
+    # Pooled async delivery client
+    WEBHOOK_HTTP2: bool = True
+    DELIVERY_MAX_CONNECTIONS: int = 500
+    DELIVERY_MAX_KEEPALIVE_CONNECTIONS: int = 100
+    DELIVERY_KEEPALIVE_EXPIRY: float = 30.0
+    DELIVERY_PER_HOST_CONCURRENCY: int = 20
+    DELIVERY_PER_HOST_MIN_CONCURRENCY: int = 1
+    DELIVERY_PER_HOST_MAX_CONCURRENCY: int = 100
+    DELIVERY_RESPONSE_MAX_BYTES: int = 4096  # Receiver body bytes read per attempt; the rest is never downloaded
+    DELIVERY_RESPONSE_TEXT_LIMIT: int = 1000  # Characters of it stored on the attempt
+
+    # Per-host circuit breaker shared through Redis
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_OPEN_SECONDS: int = 30
+    CIRCUIT_STATE_TTL: int = 86400
+
+    # Per-subscription delivery rate limits (token bucket in Redis); longest Retry-After honoured
+    RATE_LIMIT_MAX_RETRY_AFTER: int = 3600
+
+    # Batch delivery mode: process_webhook_batch with bulk attempt/status writes
+    DELIVERY_BATCH_MODE: bool = False
+    DELIVERY_BATCH_SIZE: int = 100
+
+    # Fair scheduling: per-subscription queues drained by deficit round-robin instead of one FIFO
+    FAIR_SCHEDULING_ENABLED: bool = False
+    FAIR_DEFAULT_WEIGHT: int = 1  # Deliveries per turn for subscriptions without a delivery_weight
+    FAIR_INFLIGHT_TIMEOUT: int = 300  # Task time limit; taken deliveries older than this are requeued
+    FAIR_RECLAIM_INTERVAL: float = 60.0
+
+    # Content-addressed payload store
+    PAYLOAD_COMPRESSION: str = "gzip"  # "gzip", "zstd" (needs the zstandard package) or "identity"
+    PAYLOAD_COMPRESSION_MIN_BYTES: int = 1024
+    PAYLOAD_CACHE_SIZE: int = 256
+    PAYLOAD_CACHE_TTL: int = 300
+    PAYLOAD_FAST_JSON: bool = True  # Serialize with orjson when installed
+
+    # Idempotency-Key dedup window for ingest
+    IDEMPOTENCY_WINDOW_SECONDS: int = 86400
+    IDEMPOTENCY_LOCK_SECONDS: int = 30
+
+    # Write-ahead ingest buffer: accept into a Redis Stream, persist to the DB in batches
+    INGEST_BUFFER_ENABLED: bool = False
+    INGEST_FLUSH_BATCH_SIZE: int = 1000
+    INGEST_FLUSH_BLOCK_MS: int = 500  # Must stay below the Redis client's socket timeout
+    INGEST_CLAIM_IDLE_MS: int = 60000
+    INGEST_DRAIN_SECONDS: float = 10.0
+
+    # Batch ingest (/api/webhooks/ingest/batch)
+    INGEST_BATCH_MAX_ITEMS: int = 10000
+
+    # Streaming log export: rows fetched per round trip from the server-side cursor
+    EXPORT_YIELD_PER: int = 1000
+
+    # Per-minute delivery metrics rollups (delivery_metrics), kept longer than the raw logs
+    METRICS_ROLLUP_ENABLED: bool = True
+    METRICS_ROLLUP_RETENTION_DAYS: int = 30
+
+    # Prometheus exporter in the Celery worker's main process (the API serves /metrics); 0 disables
+    METRICS_WORKER_PORT: int = 9100
+
+    # Retry scheduler (Redis sorted set drained by celery beat)
+    RETRY_SCHEDULER_INTERVAL: float = 1.0
+    RETRY_SCHEDULER_BATCH_SIZE: int = 1000
+    RETRY_SCHEDULER_MAX_PER_RUN: int = 50000
+
     model_config = ConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -1,14 +1,21 @@
 import json
+import threading
+import time
+from collections import OrderedDict
 from redis import Redis
 from redis.exceptions import RedisError
 import pickle
-from typing import Any, Optional, Dict, Union
+from typing import Any, Callable, Optional, Dict, Union
 import logging
 from app.config import settings
+from app.core.metrics import CACHE_LOOKUPS
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Pub/sub channel on which subscription changes are broadcast to every process
+SUBSCRIPTION_CHANGES_CHANNEL = "subscriptions:changed"
+
 # Connect to Redis
 redis_client = Redis.from_url(
     settings.REDIS_URL, 
@@ -138,17 +145,16 @@ def get_subscription_field(subscription_id: str, field: str) -> Optional[str]:
 def invalidate_subscription_cache(subscription_id: str):
     """
     Invalidate subscription cache including all related fields.
+    Also evicts the entry from this process's local tier.
     """
+    local_subscription_cache.pop(str(subscription_id))
     try:
-        # Get all keys matching this subscription pattern
-        pattern = f"subscription:{subscription_id}*"
-        keys = redis_client.keys(pattern)
-        
-        if keys:
-            redis_client.delete(*keys)
-            logger.info(f"Invalidated all cache entries for subscription ID {subscription_id}, {len(keys)} keys removed")
-        else:
-            logger.debug(f"No cache entries found for subscription ID {subscription_id}")
+        # Delete the known keys directly instead of a KEYS scan over the whole keyspace
+        keys = [f"subscription:{subscription_id}"] + [
+            f"subscription:{subscription_id}:{field}" for field in ("target_url", "secret_key", "active")
+        ]
+        removed = redis_client.delete(*keys)
+        logger.info(f"Invalidated all cache entries for subscription ID {subscription_id}, {removed} keys removed")
     except RedisError as e:
         logger.warning(f"Failed to invalidate cache for subscription {subscription_id}: {str(e)}")
         # Fallback to single key deletion
@@ -194,4 +200,169 @@ def cache_all_subscriptions(subscriptions: list, ttl: int = 1800):
         logger.info(f"Cached {len(subscriptions)} subscriptions in a single pipeline operation")
     except RedisError as e:
         logger.warning(f"Failed to cache all subscriptions: {str(e)}")
-        # Don't use fallback - if Redis is down, we'll just bypass the cache
\ No newline at end of file
+        # Don't use fallback - if Redis is down, we'll just bypass the cache
+
+
+class LocalTTLCache:
+    """
+    Small thread-safe LRU cache with a per-entry TTL.
+    Used as the in-process tier in front of Redis.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_subscription_cache = LocalTTLCache(
+    maxsize=settings.SUBSCRIPTION_LOCAL_CACHE_SIZE,
+    ttl=settings.SUBSCRIPTION_LOCAL_CACHE_TTL
+)
+
+# Hit/miss counters for this process, flushed periodically to a shared Redis hash
+CACHE_STATS_KEY = "cache:stats:subscription"
+_cache_stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+_cache_stats_lock = threading.Lock()
+_cache_stats_flushed_at = time.monotonic()
+
+def _record_cache_stat(name: str):
+    global _cache_stats_flushed_at
+    CACHE_LOOKUPS.labels(name).inc()
+    with _cache_stats_lock:
+        _cache_stats[name] += 1
+        if time.monotonic() - _cache_stats_flushed_at < settings.CACHE_STATS_FLUSH_SECONDS:
+            return
+        pending = dict(_cache_stats)
+        for key in _cache_stats:
+            _cache_stats[key] = 0
+        _cache_stats_flushed_at = time.monotonic()
+
+    try:
+        pipeline = redis_client.pipeline()
+        for key, value in pending.items():
+            if value:
+                pipeline.hincrby(CACHE_STATS_KEY, key, value)
+        pipeline.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to flush cache stats: {str(e)}")
+
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Subscription cache hit/miss counters across all processes
+    (as last flushed to Redis) plus this process's unflushed counts.
+    """
+    with _cache_stats_lock:
+        stats = dict(_cache_stats)
+    try:
+        for key, value in redis_client.hgetall(CACHE_STATS_KEY).items():
+            key = key.decode() if isinstance(key, bytes) else key
+            stats[key] = stats.get(key, 0) + int(value)
+    except RedisError as e:
+        logger.warning(f"Failed to read cache stats: {str(e)}")
+
+    lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["local_hits"] + stats["redis_hits"]) / lookups if lookups else None
+    return stats
+
+def subscription_cache_data(subscription) -> Dict:
+    """The subscription fields webhook delivery needs."""
+    return {
+        "target_url": subscription.target_url,
+        "secret_key": subscription.secret_key,
+        "is_active": subscription.is_active,
+        "rate_limit_per_second": subscription.rate_limit_per_second,
+        "rate_limit_burst": subscription.rate_limit_burst,
+    }
+
+def get_subscription_for_delivery(subscription_id: str, loader: Callable[[], Any]) -> Optional[Dict]:
+    """
+    Read-through lookup of delivery fields: local LRU, then Redis, then ``loader``.
+    ``loader`` returns the ORM subscription (or None) and is only called on a miss.
+    """
+    subscription_id = str(subscription_id)
+    data = local_subscription_cache.get(subscription_id)
+    if data is not None:
+        _record_cache_stat("local_hits")
+        return data
+
+    data = get_cached_subscription(subscription_id)
+    if data is not None:
+        _record_cache_stat("redis_hits")
+        local_subscription_cache.set(subscription_id, data)
+        return data
+
+    _record_cache_stat("misses")
+    subscription = loader()
+    if subscription is None:
+        return None
+    data = subscription_cache_data(subscription)
+    cache_subscription(subscription_id, data, ttl=settings.SUBSCRIPTION_CACHE_TTL)
+    local_subscription_cache.set(subscription_id, data)
+    return data
+
+def write_through_subscription(subscription):
+    """
+    Refresh both tiers after a subscription update.
+    Other processes evict their local tier when they see the change on pub/sub.
+    """
+    subscription_id = str(subscription.id)
+    data = subscription_cache_data(subscription)
+    cache_subscription(subscription_id, data, ttl=settings.SUBSCRIPTION_CACHE_TTL)
+    local_subscription_cache.set(subscription_id, data)
+
+def start_local_cache_invalidation() -> threading.Event:
+    """
+    Evict local-tier entries when a subscription change is published.
+    If Redis is unreachable the local TTL bounds staleness instead.
+    Returns an Event that stops the listener when set.
+    """
+    stop = threading.Event()
+
+    def listen():
+        while not stop.is_set():
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(SUBSCRIPTION_CHANGES_CHANNEL)
+                # Anything cached before (re)subscribing may have missed an eviction
+                local_subscription_cache.clear()
+                while not stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        local_subscription_cache.pop(json.loads(message["data"])["id"])
+            except (RedisError, ValueError, KeyError) as e:
+                logger.warning(f"Local cache invalidation listener error: {str(e)}")
+                stop.wait(settings.ROUTER_RESUBSCRIBE_SECONDS)
+            finally:
+                pubsub.close()
+
+    threading.Thread(target=listen, name="local-cache-invalidation", daemon=True).start()
+    return stop
@@ -0,0 +1,92 @@
+import time
+import logging
+from urllib.parse import urlsplit
+from redis.exceptions import RedisError
+from app.config import settings
+from app.core.cache import redis_client
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# States stored in the per-host hash at circuit:{host}
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Returns 0 if the caller may send, otherwise seconds until it should try again.
+# An expired open circuit moves to half-open and lets exactly one probe through;
+# a probe that never reports back is replaced after ARGV[3] seconds.
+_CHECK_SCRIPT = redis_client.register_script("""
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state or state == 'closed' then
+    return 0
+end
+local now = tonumber(ARGV[1])
+if state == 'open' then
+    local remaining = tonumber(redis.call('HGET', KEYS[1], 'opened_at')) + tonumber(ARGV[2]) - now
+    if remaining > 0 then
+        return math.ceil(remaining)
+    end
+    redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_at', now)
+    return 0
+end
+if now - tonumber(redis.call('HGET', KEYS[1], 'probe_at')) >= tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[1], 'probe_at', now)
+    return 0
+end
+return math.ceil(tonumber(ARGV[3]))
+""")
+
+# Records an outcome. Success closes the circuit; a failed probe re-opens it and
+# consecutive failures beyond the threshold open it. Returns the new state.
+_RECORD_SCRIPT = redis_client.register_script("""
+if ARGV[1] == '1' then
+    redis.call('DEL', KEYS[1])
+    return 'closed'
+end
+local now = ARGV[2]
+local state = redis.call('HGET', KEYS[1], 'state')
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if state == 'half_open' or (state ~= 'open' and failures >= tonumber(ARGV[3])) then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', now, 'failures', 0)
+    return 'open'
+end
+return state or 'closed'
+""")
+
+
+def host_for(url: str) -> str:
+    """Circuit key component: the receiver's host[:port]."""
+    return urlsplit(url).netloc
+
+
+def check_circuit(host: str) -> int:
+    """
+    Return 0 if a delivery to ``host`` may be sent now, otherwise the number of
+    seconds to defer it. Fails open if Redis is unavailable.
+    """
+    try:
+        return int(_CHECK_SCRIPT(
+            keys=[f"circuit:{host}"],
+            args=[time.time(), settings.CIRCUIT_OPEN_SECONDS, settings.WEBHOOK_TIMEOUT * 2]
+        ))
+    except RedisError as e:
+        logger.warning(f"Circuit check failed for {host}: {str(e)}")
+        return 0
+
+
+def record_outcome(host: str, success: bool) -> str:
+    """Feed a delivery outcome into the circuit for ``host`` and return its state."""
+    try:
+        state = _RECORD_SCRIPT(
+            keys=[f"circuit:{host}"],
+            args=[1 if success else 0, time.time(), settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_STATE_TTL]
+        )
+        state = state.decode() if isinstance(state, bytes) else state
+        if state == OPEN and not success:
+            logger.warning(f"Circuit open for {host}; deferring deliveries for {settings.CIRCUIT_OPEN_SECONDS}s")
+        return state
+    except RedisError as e:
+        logger.warning(f"Circuit update failed for {host}: {str(e)}")
+        return CLOSED
@@ -0,0 +1,59 @@
+"""
+Encoding of streamed log exports (NDJSON or CSV).
+
+Rows arrive in partitions from a server-side cursor and each partition is
+encoded into one chunk, so an export of any size holds at most
+``EXPORT_YIELD_PER`` rows in memory.
+"""
+import csv
+import enum
+import io
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, List, Sequence
+from app.core.payloads import ORJSON_AVAILABLE
+
+if ORJSON_AVAILABLE:
+    import orjson
+else:
+    import json
+
+NDJSON = "ndjson"
+CSV = "csv"
+
+MEDIA_TYPES = {
+    NDJSON: "application/x-ndjson",
+    CSV: "text/csv",
+}
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def csv_header(fields: Sequence[str]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(fields)
+    return buffer.getvalue().encode()
+
+
+def encode_rows(rows: Iterable[Sequence[Any]], fields: Sequence[str], fmt: str) -> bytes:
+    """One chunk of the export body for a partition of rows."""
+    if fmt == CSV:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([["" if value is None else _value(value) for value in row] for row in rows])
+        return buffer.getvalue().encode()
+
+    lines: List[bytes] = []
+    for row in rows:
+        record = {field: _value(value) for field, value in zip(fields, row)}
+        lines.append(orjson.dumps(record) if ORJSON_AVAILABLE else json.dumps(record).encode())
+    lines.append(b"")
+    return b"\n".join(lines)
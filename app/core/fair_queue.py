@@ -0,0 +1,202 @@
+"""
+Fair delivery scheduling across subscriptions.
+
+With ``FAIR_SCHEDULING_ENABLED`` deliveries wait in one Redis list per
+subscription instead of the Celery queue. Every enqueued delivery still
+publishes one task, but the task doesn't name a delivery: the worker that runs
+it takes whichever delivery is next in a deficit round-robin over the
+subscriptions with work queued. A subscription with weight ``w`` gets up to
+``w`` deliveries per turn, so a broadcast that queues 10,000 deliveries for
+one subscription delays another subscription's delivery by at most one round.
+
+Weights live in Redis for the round-robin script. They are written when a
+subscription changes and restored from ``Subscription.delivery_weight`` by the
+scheduler tick whenever Redis has lost them (e.g. after a flush or failover).
+
+Taken deliveries are recorded in an in-flight set until the worker finishes.
+Entries left there by a crashed worker are pushed back after
+``FAIR_INFLIGHT_TIMEOUT`` seconds; a delivery that is sent twice this way is
+skipped the second time, as replayed retries are.
+"""
+import time
+import uuid
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from redis.exceptions import RedisError
+from app.config import settings
+from app.core.cache import redis_client
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+QUEUE_PREFIX = "fair:queue:"
+RING_KEY = "fair:ring"  # Subscriptions with queued deliveries, in turn order
+ACTIVE_KEY = "fair:active"  # Same members as the ring, for O(1) membership checks
+DEFICITS_KEY = "fair:deficits"  # Deliveries left in the current turn of each subscription
+WEIGHTS_KEY = "fair:weights"
+WEIGHTS_LOADED_KEY = "fair:weights:loaded"  # Present once WEIGHTS_KEY was filled from the database
+INFLIGHT_KEY = "fair:inflight"  # "subscription_id:delivery_id" scored by the time it was taken
+
+# ARGV: queue prefix, then (subscription_id, delivery_id) pairs
+_PUSH_SCRIPT = redis_client.register_script("""
+for i = 2, #ARGV, 2 do
+    redis.call('RPUSH', ARGV[1] .. ARGV[i], ARGV[i + 1])
+    if redis.call('SADD', KEYS[2], ARGV[i]) == 1 then
+        redis.call('RPUSH', KEYS[1], ARGV[i])
+    end
+end
+return (#ARGV - 1) / 2
+""")
+
+# Takes up to ARGV[2] deliveries. The subscription at the head of the ring
+# serves its weight in deliveries, then moves to the back; drained queues leave
+# the ring until their next push.
+_TAKE_SCRIPT = redis_client.register_script("""
+local prefix = ARGV[1]
+local count = tonumber(ARGV[2])
+local default_weight = tonumber(ARGV[4])
+local taken = {}
+while #taken < count do
+    local sid = redis.call('LINDEX', KEYS[1], 0)
+    if not sid then
+        break
+    end
+    local queue = prefix .. sid
+    local delivery_id = redis.call('LPOP', queue)
+    if delivery_id then
+        local entry = sid .. ':' .. delivery_id
+        redis.call('ZADD', KEYS[5], ARGV[3], entry)
+        taken[#taken + 1] = entry
+        local deficit = tonumber(redis.call('HGET', KEYS[3], sid))
+            or tonumber(redis.call('HGET', KEYS[4], sid)) or default_weight
+        deficit = deficit - 1
+        if deficit > 0 and redis.call('LLEN', queue) > 0 then
+            redis.call('HSET', KEYS[3], sid, deficit)
+        else
+            redis.call('HDEL', KEYS[3], sid)
+            if redis.call('LLEN', queue) > 0 then
+                redis.call('LMOVE', KEYS[1], KEYS[1], 'LEFT', 'RIGHT')
+            else
+                redis.call('LPOP', KEYS[1])
+                redis.call('SREM', KEYS[2], sid)
+            end
+        end
+    else
+        redis.call('LPOP', KEYS[1])
+        redis.call('SREM', KEYS[2], sid)
+        redis.call('HDEL', KEYS[3], sid)
+    end
+end
+return taken
+""")
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def push_deliveries(pairs: Iterable[Tuple[uuid.UUID, str]]) -> bool:
+    """
+    Queue ``(subscription_id, delivery_id)`` pairs behind their subscriptions in one
+    round trip. Returns False if Redis is unavailable so callers can publish directly.
+    """
+    args = [QUEUE_PREFIX]
+    for subscription_id, delivery_id in pairs:
+        args.extend((str(subscription_id), str(delivery_id)))
+    if len(args) == 1:
+        return True
+    try:
+        _PUSH_SCRIPT(keys=[RING_KEY, ACTIVE_KEY], args=args)
+        return True
+    except RedisError as e:
+        logger.warning(f"Failed to queue {len(args) // 2} deliveries fairly: {str(e)}")
+        return False
+
+
+def take_deliveries(count: int = 1) -> List[str]:
+    """
+    Take up to ``count`` deliveries in round-robin order. Returns in-flight
+    entries; pass them to ``delivery_id`` and, once handled, ``complete_deliveries``.
+    """
+    entries = _TAKE_SCRIPT(
+        keys=[RING_KEY, ACTIVE_KEY, DEFICITS_KEY, WEIGHTS_KEY, INFLIGHT_KEY],
+        args=[QUEUE_PREFIX, count, time.time(), settings.FAIR_DEFAULT_WEIGHT]
+    )
+    return [_decode(entry) for entry in entries]
+
+
+def delivery_id(entry: str) -> str:
+    return entry.split(":", 1)[1]
+
+
+def complete_deliveries(entries: List[str]):
+    if entries:
+        try:
+            redis_client.zrem(INFLIGHT_KEY, *entries)
+        except RedisError as e:
+            # Left in flight, they are pushed back later and skipped as already finished
+            logger.warning(f"Failed to clear {len(entries)} in-flight deliveries: {str(e)}")
+
+
+def reclaim_stalled(limit: int, now: Optional[float] = None) -> int:
+    """Push deliveries taken more than FAIR_INFLIGHT_TIMEOUT seconds ago back onto their queues."""
+    now = time.time() if now is None else now
+    entries = [_decode(entry) for entry in redis_client.zrangebyscore(
+        INFLIGHT_KEY, "-inf", now - settings.FAIR_INFLIGHT_TIMEOUT, start=0, num=limit
+    )]
+    if not entries:
+        return 0
+    # Push before removing: a crash in between queues a delivery twice rather than losing it
+    _PUSH_SCRIPT(keys=[RING_KEY, ACTIVE_KEY], args=[QUEUE_PREFIX] + [part for entry in entries for part in entry.split(":", 1)])
+    redis_client.zrem(INFLIGHT_KEY, *entries)
+    return len(entries)
+
+
+def set_subscription_weight(subscription_id: uuid.UUID, weight: Optional[int]):
+    """Deliveries a subscription gets per round-robin turn; None restores the default."""
+    try:
+        if weight:
+            redis_client.hset(WEIGHTS_KEY, str(subscription_id), weight)
+        else:
+            redis_client.hdel(WEIGHTS_KEY, str(subscription_id))
+    except RedisError as e:
+        logger.warning(f"Failed to store delivery weight for subscription {subscription_id}: {str(e)}")
+
+
+def weights_loaded() -> bool:
+    try:
+        return bool(redis_client.exists(WEIGHTS_LOADED_KEY))
+    except RedisError as e:
+        # Nothing could be loaded into Redis now anyway; try again on the next tick
+        logger.warning(f"Failed to check delivery weights: {str(e)}")
+        return True
+
+
+def load_subscription_weights(weights: Dict[uuid.UUID, int]):
+    """Restore weights from the database; a weight written since (HSETNX) is kept."""
+    try:
+        pipeline = redis_client.pipeline()
+        for subscription_id, weight in weights.items():
+            pipeline.hsetnx(WEIGHTS_KEY, str(subscription_id), weight)
+        pipeline.set(WEIGHTS_LOADED_KEY, 1)
+        pipeline.execute()
+        logger.info(f"Loaded delivery weights for {len(weights)} subscriptions")
+    except RedisError as e:
+        logger.warning(f"Failed to load delivery weights: {str(e)}")
+
+
+def queue_depths(limit: int = 100) -> dict:
+    """Queued deliveries per subscription currently in the rotation."""
+    try:
+        subscription_ids = [_decode(member) for member in redis_client.lrange(RING_KEY, 0, limit - 1)]
+        pipeline = redis_client.pipeline()
+        for subscription_id in subscription_ids:
+            pipeline.llen(QUEUE_PREFIX + subscription_id)
+        return {
+            "subscriptions": redis_client.llen(RING_KEY),
+            "in_flight": redis_client.zcard(INFLIGHT_KEY),
+            "queues": dict(zip(subscription_ids, pipeline.execute())),
+        }
+    except RedisError as e:
+        logger.warning(f"Failed to read fair queue depths: {str(e)}")
+        return {}
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
+from urllib.parse import urlsplit
+import httpx
+from app.config import settings
+from app.core.metrics import DELIVERY_DURATION
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 support in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class AdaptiveLimit:
+    """
+    Per-host concurrency limit that adapts AIMD-style: every receiver failure
+    halves the limit, and each success adds 1/limit, so a healthy host regains
+    one slot per full window of successes.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, success: bool):
+        if success:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+# Response extension with the timing and body prefix of a delivery (see ``attempt_fields``)
+DELIVERY_EXTENSION = "delivery"
+
+
+def is_receiver_failure(response: Optional[httpx.Response] = None, error: Optional[Exception] = None) -> bool:
+    """Transport errors, 5xx and 429 count against a receiver; other 4xx mean it is up."""
+    if error is not None:
+        return True
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class DeliveryEngine:
+    """
+    Shared async HTTP client for webhook delivery.
+
+    One ``httpx.AsyncClient`` per process runs on a dedicated event loop thread,
+    so connections (and TLS sessions) are pooled and kept alive across
+    deliveries, and many deliveries can be in flight at once. Concurrency per
+    receiver host is capped, and the cap shrinks while a host is failing, so
+    one slow host can't take every connection.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, AdaptiveLimit] = {}
+        self._pid = None
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        # A forked worker child can't reuse the parent's loop thread, so start one per process
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="delivery-engine", daemon=True).start()
+                self._loop = loop
+                self._client = None
+                self._host_limits = {}
+                self._pid = os.getpid()
+        return self._loop
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Only ever called on the engine loop, so no locking is needed
+        if self._client is None:
+            http2 = settings.WEBHOOK_HTTP2 and HTTP2_AVAILABLE
+            if settings.WEBHOOK_HTTP2 and not HTTP2_AVAILABLE:
+                logger.warning("WEBHOOK_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                timeout=settings.WEBHOOK_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.DELIVERY_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.DELIVERY_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.DELIVERY_KEEPALIVE_EXPIRY,
+                ),
+                transport=self._transport,
+            )
+        return self._client
+
+    def host_limit(self, url: str) -> AdaptiveLimit:
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = AdaptiveLimit(
+                settings.DELIVERY_PER_HOST_CONCURRENCY,
+                settings.DELIVERY_PER_HOST_MIN_CONCURRENCY,
+                settings.DELIVERY_PER_HOST_MAX_CONCURRENCY,
+            )
+        return limit
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        """
+        POST to ``url`` through the shared pool, respecting the adaptive per-host limit.
+
+        Only the first ``DELIVERY_RESPONSE_MAX_BYTES`` of the response body are
+        read, so a huge error page is never downloaded. The response comes back
+        closed; use ``attempt_fields`` rather than ``response.text``.
+        """
+        limit = self.host_limit(url)
+        async with limit:
+            client = self._get_client()
+            # Measured inside the host limit, so time spent queued for a slot isn't counted
+            started_at = datetime.now(timezone.utc)
+            started = time.monotonic()
+            try:
+                response = await client.send(client.build_request("POST", url, **kwargs), stream=True)
+                try:
+                    prefix = bytearray()
+                    complete = True
+                    async for chunk in response.aiter_bytes():
+                        prefix += chunk
+                        if len(prefix) >= settings.DELIVERY_RESPONSE_MAX_BYTES:
+                            # Closing mid-body drops this connection instead of draining the rest
+                            complete = False
+                            break
+                finally:
+                    await response.aclose()
+            except Exception as e:
+                limit.record(not is_receiver_failure(error=e))
+                raise
+            latency = time.monotonic() - started
+            content_length = response.headers.get("content-length")
+            response.extensions[DELIVERY_EXTENSION] = {
+                "started_at": started_at,
+                "completed_at": datetime.now(timezone.utc),
+                "latency": latency,
+                "body_prefix": bytes(prefix[:settings.DELIVERY_RESPONSE_MAX_BYTES]),
+                "response_bytes": int(content_length) if content_length and content_length.isdigit()
+                                  else len(prefix) if complete else None,
+            }
+            DELIVERY_DURATION.labels(urlsplit(url).netloc).observe(latency)
+            limit.record(not is_receiver_failure(response))
+            return response
+
+    async def post_many(self, requests: List[Dict[str, Any]]) -> List[Union[httpx.Response, Exception]]:
+        """
+        Send many requests concurrently. Each item holds ``url`` plus any
+        ``httpx`` keyword arguments. Failures are returned in place, not raised.
+        """
+        return await asyncio.gather(
+            *(self.post(**request) for request in requests),
+            return_exceptions=True
+        )
+
+    def run(self, coro):
+        """Run a coroutine on the engine loop and block until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started()).result()
+
+    def send(self, url: str, **kwargs) -> httpx.Response:
+        """Blocking POST for synchronous callers such as Celery tasks."""
+        return self.run(self.post(url, **kwargs))
+
+    def send_many(self, requests: List[Dict[str, Any]]) -> List[Union[httpx.Response, Exception]]:
+        """Blocking variant of ``post_many``."""
+        return self.run(self.post_many(requests))
+
+    def close(self):
+        """Close pooled connections and stop the loop thread."""
+        with self._lock:
+            loop, client = self._loop, self._client
+            if loop is None or self._pid != os.getpid():
+                return
+            if client is not None:
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._loop = None
+            self._client = None
+
+
+def attempt_fields(response: httpx.Response) -> Dict[str, Any]:
+    """DeliveryAttempt columns for a response returned by ``DeliveryEngine``."""
+    delivery = response.extensions.get(DELIVERY_EXTENSION, {})
+    latency = delivery.get("latency")
+    prefix = delivery.get("body_prefix", b"")
+    try:
+        text = prefix.decode(response.charset_encoding or "utf-8", errors="replace")
+    except LookupError:
+        text = prefix.decode("utf-8", errors="replace")
+    return {
+        "status_code": response.status_code,
+        "response": text[:settings.DELIVERY_RESPONSE_TEXT_LIMIT],
+        "latency_ms": round(latency * 1000, 3) if latency is not None else None,
+        "response_bytes": delivery.get("response_bytes"),
+        "started_at": delivery.get("started_at"),
+        "completed_at": delivery.get("completed_at"),
+    }
+
+
+delivery_engine = DeliveryEngine()
@@ -0,0 +1,57 @@
+import json
+import logging
+from typing import List, Optional
+from redis.exceptions import RedisError
+from app.config import settings
+from app.core.cache import redis_client
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# Stored while the first request with a key is still creating its deliveries
+IN_PROGRESS = b"in_progress"
+
+
+def _redis_key(scope: str, key: str) -> str:
+    return f"idempotency:{scope}:{key}"
+
+
+def claim_idempotency_key(scope: str, key: str):
+    """
+    Fast-path dedup with SET NX. Returns None if this request is the first to
+    use the key (or Redis is unavailable and the DB index has to decide),
+    IN_PROGRESS if the first request hasn't finished yet, or the delivery ids
+    the first request created.
+    """
+    redis_key = _redis_key(scope, key)
+    try:
+        # Short-lived claim so a crashed request doesn't block the key for the whole window
+        if redis_client.set(redis_key, IN_PROGRESS, nx=True, ex=settings.IDEMPOTENCY_LOCK_SECONDS):
+            return None
+        value = redis_client.get(redis_key)
+    except RedisError as e:
+        logger.warning(f"Idempotency check unavailable for {redis_key}: {str(e)}")
+        return None
+    if value is None:
+        return None
+    if value == IN_PROGRESS:
+        return IN_PROGRESS
+    return json.loads(value)
+
+
+def remember_idempotency_key(scope: str, key: str, delivery_ids: List[str]):
+    """Record the deliveries created for a key for the rest of the dedup window."""
+    try:
+        redis_client.set(_redis_key(scope, key), json.dumps(delivery_ids), ex=settings.IDEMPOTENCY_WINDOW_SECONDS)
+    except RedisError as e:
+        logger.warning(f"Failed to record idempotency key {key}: {str(e)}")
+
+
+def release_idempotency_key(scope: str, key: str):
+    """Drop a claim whose request failed, so a retry can go through."""
+    try:
+        redis_client.delete(_redis_key(scope, key))
+    except RedisError as e:
+        logger.warning(f"Failed to release idempotency key {key}: {str(e)}")
@@ -0,0 +1,213 @@
+"""
+Write-ahead ingest buffer on a Redis Stream.
+
+With ``INGEST_BUFFER_ENABLED`` the ingest endpoints assign delivery ids, append
+one stream entry per request and return 202 without touching Postgres. A
+flusher in every API process reads the stream through a consumer group,
+inserts the deliveries in one multi-row INSERT per batch and only then
+enqueues them for delivery and acknowledges the entries.
+
+Durability: an accepted event is as durable as Redis itself (AOF with
+``appendfsync everysec`` may lose up to a second on a Redis crash). Entries
+are processed at least once: anything not acknowledged, e.g. after a crash
+between the INSERT and the XACK, is reclaimed by another flusher once idle for
+``INGEST_CLAIM_IDLE_MS`` and replayed; replays are no-ops because inserts skip
+existing ids and workers skip finished deliveries. If Redis can't take the
+entry, ingest falls back to writing the deliveries synchronously.
+
+An entry the database rejects (e.g. its subscription was deleted while it
+sat in the stream) is moved to ``INGEST_DEAD_LETTER_KEY`` with the error and
+acknowledged, so it can't block the rest of the buffer. Any other database
+error (an outage, a failover) leaves the whole batch pending for a later flush.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy.exc import DataError, IntegrityError
+from app.config import settings
+from app.core.cache import redis_client
+from app.db.crud import insert_buffered_deliveries
+
+# Errors about the rows themselves, as opposed to the database being unreachable
+REJECTED_ROW_ERRORS = (IntegrityError, DataError)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+INGEST_STREAM_KEY = "ingest:deliveries"
+INGEST_GROUP = "ingest-flushers"
+INGEST_DEAD_LETTER_KEY = "ingest:dead-letter"
+INGEST_DEAD_LETTER_MAXLEN = 100000
+
+
+def buffer_deliveries(subscription_ids: List[uuid.UUID], body: bytes, event_type: Optional[str]) -> Optional[List[str]]:
+    """
+    Append an ingested event (its raw body bytes) and its target subscriptions to the stream.
+    Returns the new delivery ids, or None if Redis is unavailable and the
+    caller should persist synchronously instead.
+    """
+    delivery_ids = [str(uuid.uuid4()) for _ in subscription_ids]
+    entry = {
+        "deliveries": json.dumps([[delivery_id, str(sub_id)] for delivery_id, sub_id in zip(delivery_ids, subscription_ids)]),
+        "payload": body,
+        "event_type": event_type or "",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        redis_client.xadd(INGEST_STREAM_KEY, entry)
+        return delivery_ids
+    except RedisError as e:
+        logger.warning(f"Ingest buffer unavailable, writing deliveries synchronously: {str(e)}")
+        return None
+
+
+def _entry_rows(fields: dict) -> List[dict]:
+    fields = {key.decode(): value for key, value in fields.items()}
+    payload = fields.pop("payload")
+    fields = {key: value.decode() for key, value in fields.items()}
+    created_at = datetime.fromisoformat(fields["created_at"])
+    return [
+        {
+            "id": uuid.UUID(delivery_id),
+            "subscription_id": uuid.UUID(subscription_id),
+            "payload": payload,
+            "event_type": fields["event_type"] or None,
+            "created_at": created_at,
+        }
+        for delivery_id, subscription_id in json.loads(fields["deliveries"])
+    ]
+
+
+class IngestFlusher:
+    """Consumer-group reader that moves buffered deliveries into Postgres in batches."""
+
+    def __init__(self, session_factory, enqueue, consumer: Optional[str] = None):
+        self.session_factory = session_factory
+        self.enqueue = enqueue
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def ensure_group(self):
+        try:
+            redis_client.xgroup_create(INGEST_STREAM_KEY, INGEST_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _read(self, block_ms: Optional[int], pending: bool = False) -> list:
+        if pending:
+            # This consumer's own delivered-but-unacked entries
+            response = redis_client.xreadgroup(
+                INGEST_GROUP, self.consumer, {INGEST_STREAM_KEY: "0"},
+                count=settings.INGEST_FLUSH_BATCH_SIZE
+            )
+            return response[0][1] if response else []
+        # Entries left pending by a crashed flusher come before new ones
+        _, claimed, *_ = redis_client.xautoclaim(
+            INGEST_STREAM_KEY, INGEST_GROUP, self.consumer,
+            min_idle_time=settings.INGEST_CLAIM_IDLE_MS, start_id="0-0",
+            count=settings.INGEST_FLUSH_BATCH_SIZE
+        )
+        if claimed:
+            return claimed
+        response = redis_client.xreadgroup(
+            INGEST_GROUP, self.consumer, {INGEST_STREAM_KEY: ">"},
+            count=settings.INGEST_FLUSH_BATCH_SIZE, block=block_ms
+        )
+        return response[0][1] if response else []
+
+    def flush_once(self, block_ms: Optional[int] = None, pending: bool = False) -> int:
+        """Persist, enqueue and acknowledge one batch. Returns the number of entries handled."""
+        entries = self._read(block_ms, pending)
+        if not entries:
+            return 0
+
+        parsed = []
+        entry_ids = []
+        for entry_id, fields in entries:
+            try:
+                parsed.append((entry_id, fields, _entry_rows(fields or {})))
+            except (KeyError, ValueError) as e:
+                # A malformed entry would be reclaimed forever; drop it loudly
+                logger.error(f"Dropping malformed ingest entry {entry_id}: {str(e)}")
+            entry_ids.append(entry_id)
+
+        rows = [row for _, _, entry_rows in parsed for row in entry_rows]
+        try:
+            with self.session_factory() as db:
+                insert_buffered_deliveries(db, rows)
+        except REJECTED_ROW_ERRORS as e:
+            # Find the entries the database rejects instead of retrying the whole batch forever
+            logger.warning(f"Ingest batch insert failed, retrying entry by entry: {str(e)}")
+            rows = []
+            for entry_id, fields, entry_rows in parsed:
+                try:
+                    with self.session_factory() as db:
+                        insert_buffered_deliveries(db, entry_rows)
+                    rows.extend(entry_rows)
+                except REJECTED_ROW_ERRORS as entry_error:
+                    self._dead_letter(entry_id, fields, entry_error)
+        # Only enqueue once the rows are committed, and only ack once enqueued
+        self.enqueue([str(row["id"]) for row in rows])
+        redis_client.xack(INGEST_STREAM_KEY, INGEST_GROUP, *entry_ids)
+        redis_client.xdel(INGEST_STREAM_KEY, *entry_ids)
+        return len(entry_ids)
+
+    def _dead_letter(self, entry_id, fields: dict, error: Exception):
+        logger.error(f"Moving ingest entry {entry_id} to {INGEST_DEAD_LETTER_KEY}: {str(error)}")
+        redis_client.xadd(
+            INGEST_DEAD_LETTER_KEY,
+            {**fields, b"entry_id": entry_id, b"error": str(error)[:1000].encode()},
+            maxlen=INGEST_DEAD_LETTER_MAXLEN, approximate=True
+        )
+
+    def drain(self, timeout: float = None) -> int:
+        """Flush this consumer's pending entries and everything unread, for up to ``timeout`` seconds."""
+        deadline = time.monotonic() + (settings.INGEST_DRAIN_SECONDS if timeout is None else timeout)
+        flushed = 0
+        while time.monotonic() < deadline:
+            count = self.flush_once(pending=True) or self.flush_once()
+            if not count:
+                break
+            flushed += count
+        return flushed
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.ensure_group()
+                # Pick up anything this consumer read but didn't ack before a restart
+                while self.flush_once(pending=True):
+                    pass
+                while not self._stop.is_set():
+                    self.flush_once(block_ms=settings.INGEST_FLUSH_BLOCK_MS)
+            except RedisError as e:
+                logger.warning(f"Ingest flusher lost Redis: {str(e)}")
+                self._stop.wait(settings.ROUTER_RESUBSCRIBE_SECONDS)
+            except Exception as e:
+                # Unacked entries stay pending and are retried once reclaimable
+                logger.error(f"Ingest flush failed: {str(e)}")
+                self._stop.wait(1.0)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="ingest-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop reading new entries, then drain what this process has buffered."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=settings.INGEST_FLUSH_BLOCK_MS / 1000 + 1)
+        try:
+            flushed = self.drain()
+            logger.info(f"Ingest flusher drained {flushed} buffered entries on shutdown")
+        except Exception as e:
+            logger.error(f"Ingest buffer drain failed; entries remain in the stream: {str(e)}")
@@ -0,0 +1,165 @@
+"""
+Prometheus metrics for the API and the Celery workers.
+
+Set ``PROMETHEUS_MULTIPROC_DIR`` (a fresh, empty directory per deployment)
+for processes with more than one worker process, e.g. ``uvicorn --workers``
+or a prefork Celery pool. prometheus_client then keeps the counters and
+histograms in per-process files that every scrape aggregates. The API serves
+``/metrics``. Workers serve the same format on ``METRICS_WORKER_PORT``.
+
+DB pool gauges come from the pools of the process that answers the scrape.
+"""
+import os
+import time
+from typing import Dict, Optional
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST,
+    generate_latest, multiprocess, start_http_server
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from app.config import settings
+from app.db.pool import pool_status
+
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROCESS_DIR:
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+
+# Header stamped on every published task so workers can measure time spent queued
+ENQUEUED_AT_HEADER = "enqueued_at"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "API request latency by handler; ingest is handler=~\"ingest_.*\"",
+    ["method", "handler", "status"],
+    buckets=LATENCY_BUCKETS
+)
+TASK_QUEUE_WAIT = Histogram(
+    "celery_task_queue_wait_seconds",
+    "Time from publishing a task (or its ETA) to a worker starting it",
+    ["task"],
+    buckets=LATENCY_BUCKETS + (60.0, 300.0)
+)
+DELIVERY_DURATION = Histogram(
+    "webhook_delivery_duration_seconds",
+    "HTTP delivery latency per receiver host, from sending the request to reading the response",
+    ["host"],
+    buckets=LATENCY_BUCKETS
+)
+DELIVERY_ATTEMPTS = Counter(
+    "webhook_delivery_attempts_total",
+    "Delivery attempts by outcome: success, failure (non-2xx) or error (no response)",
+    ["outcome"]
+)
+DELIVERY_RETRIES = Counter(
+    "webhook_delivery_retries_total",
+    "Deliveries scheduled for another attempt, by reason: failed, circuit_open or rate_limited",
+    ["reason"]
+)
+DB_COMMIT_DURATION = Histogram(
+    "db_commit_duration_seconds",
+    "Session commit time (flush included) by process role",
+    ["role"],
+    buckets=LATENCY_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    "subscription_cache_lookups_total",
+    "Subscription cache lookups by result: local_hits, redis_hits or misses",
+    ["result"]
+)
+
+
+def observe_since(histogram, started: float, *labels):
+    histogram.labels(*labels).observe(time.perf_counter() - started)
+
+
+def record_attempt(status_code: Optional[int], success: bool):
+    DELIVERY_ATTEMPTS.labels("success" if success else "error" if status_code is None else "failure").inc()
+
+
+class PoolCollector:
+    """Gauges for the DB pools of this process, read at scrape time."""
+
+    def __init__(self, engines: Dict[str, object]):
+        self.engines = engines
+
+    def collect(self):
+        gauges = {
+            name: GaugeMetricFamily(f"db_pool_{name}", f"Connections {name.replace('_', ' ')}", labels=["engine", "role"])
+            for name in ("size", "checked_out", "overflow")
+        }
+        waits = CounterMetricFamily("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", labels=["engine", "role"])
+        timeouts = CounterMetricFamily("db_pool_checkout_timeouts", "Checkouts that timed out waiting for a connection", labels=["engine", "role"])
+        for label, engine in self.engines.items():
+            status = pool_status(engine)
+            labels = [label, status["role"]]
+            for name, gauge in gauges.items():
+                if name in status:
+                    gauge.add_metric(labels, status[name])
+            if "wait_seconds_total" in status:
+                waits.add_metric(labels, status["wait_seconds_total"])
+                timeouts.add_metric(labels, status["timeouts"])
+        yield from gauges.values()
+        yield waits
+        yield timeouts
+
+
+class _DefaultRegistry:
+    # Lets the single-process registry be combined with the pool collector per scrape
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def metrics_registry(engines: Dict[str, object]) -> CollectorRegistry:
+    """Registry for a scrape: every process's metrics in multiprocess mode, plus this process's pools."""
+    registry = CollectorRegistry()
+    if MULTIPROCESS_DIR:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(_DefaultRegistry())
+    registry.register(PoolCollector(engines))
+    return registry
+
+
+def render_metrics(engines: Dict[str, object]):
+    """Body and content type for a /metrics response."""
+    return generate_latest(metrics_registry(engines)), CONTENT_TYPE_LATEST
+
+
+def start_worker_exporter(engines: Dict[str, object]):
+    """Serve /metrics from a Celery worker's main process on METRICS_WORKER_PORT (0 disables)."""
+    if settings.METRICS_WORKER_PORT:
+        start_http_server(settings.METRICS_WORKER_PORT, registry=metrics_registry(engines))
+
+
+def mark_process_dead(pid: int):
+    # Drops a finished process's live gauges from the multiprocess files
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by the endpoint that handled it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched endpoint in the scope; the function name keeps label cardinality bounded
+            handler = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            observe_since(HTTP_REQUEST_DURATION, started, scope["method"], handler, status[0])
@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+from fastapi import HTTPException
+
+# Response header carrying the opaque cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(*values) -> str:
+    """
+    Encode the sort key of the last row on a page as an opaque, URL-safe token.
+    Datetimes are tagged so they round-trip as datetimes.
+    """
+    encoded = [{"dt": value.isoformat()} if isinstance(value, datetime) else str(value) for value in values]
+    return base64.urlsafe_b64encode(json.dumps(encoded).encode()).decode().rstrip("=")
+
+def decode_cursor(token: Optional[str], *types: Callable) -> Optional[Tuple]:
+    """
+    Decode a token produced by ``encode_cursor``, converting each value with
+    ``types`` when given (e.g. ``decode_cursor(token, int)``).
+    Raises a 400 for tokens that weren't issued by us.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        decoded = tuple(
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in values
+        )
+        if types:
+            if len(decoded) != len(types):
+                raise ValueError(f"Expected {len(types)} cursor values, got {len(decoded)}")
+            decoded = tuple(convert(value) for convert, value in zip(types, decoded))
+        return decoded
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+def next_cursor(items: list, limit: int, *fields: str) -> Optional[str]:
+    """Cursor for the page after ``items``, or None when this was the last page."""
+    if len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(*(getattr(last, field) for field in fields))
@@ -0,0 +1,96 @@
+"""
+Encoding for the content-addressed payload store (``webhook_payloads``).
+
+A payload is stored once per distinct body, keyed by the SHA-256 of its
+bytes, and compressed when it is larger than ``PAYLOAD_COMPRESSION_MIN_BYTES``.
+Deliveries reference it by hash, so an event fanned out to many subscriptions
+is written, kept and deleted once.
+
+The stored bytes are the request body exactly as it was ingested; workers sign
+and send those same bytes, so receivers can verify the signature over the raw
+body they get.
+"""
+import gzip
+import hashlib
+import json
+import logging
+from typing import Any, Dict, NamedTuple, Union
+from app.config import settings
+from app.core.cache import LocalTTLCache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+IDENTITY = "identity"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+
+class EncodedPayload(NamedTuple):
+    hash: str
+    encoding: str
+    body: bytes
+    size: int
+
+
+def serialize_payload(payload: Dict[str, Any]) -> bytes:
+    """Compact, key-sorted JSON bytes for payloads that arrive without a raw body."""
+    if ORJSON_AVAILABLE and settings.PAYLOAD_FAST_JSON:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def parse_json(data: bytes) -> Any:
+    """Parse a JSON document, with orjson when enabled."""
+    if ORJSON_AVAILABLE and settings.PAYLOAD_FAST_JSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _compression() -> str:
+    if settings.PAYLOAD_COMPRESSION == ZSTD and not ZSTD_AVAILABLE:
+        logger.warning("PAYLOAD_COMPRESSION is zstd but the 'zstandard' package is not installed; using gzip")
+        return GZIP
+    return settings.PAYLOAD_COMPRESSION
+
+
+def encode_payload(payload: Union[bytes, Dict[str, Any]]) -> EncodedPayload:
+    """Hash and (if large enough) compress a raw body, or a serialized payload, for the store."""
+    raw = payload if isinstance(payload, bytes) else serialize_payload(payload)
+    digest = hashlib.sha256(raw).hexdigest()
+    encoding = _compression() if len(raw) >= settings.PAYLOAD_COMPRESSION_MIN_BYTES else IDENTITY
+    if encoding == GZIP:
+        body = gzip.compress(raw, compresslevel=6)
+    elif encoding == ZSTD:
+        body = zstandard.ZstdCompressor().compress(raw)
+    else:
+        encoding, body = IDENTITY, raw
+    return EncodedPayload(digest, encoding, body, len(raw))
+
+
+def decode_payload(encoding: str, body: bytes) -> bytes:
+    """The original body bytes of a stored payload."""
+    if encoding == GZIP:
+        return gzip.decompress(body)
+    if encoding == ZSTD:
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
+
+
+# Stored payloads never change, so decompressed bodies can be reused by every delivery of a fan-out
+decoded_payload_cache = LocalTTLCache(
+    maxsize=settings.PAYLOAD_CACHE_SIZE,
+    ttl=settings.PAYLOAD_CACHE_TTL
+)
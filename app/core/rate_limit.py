@@ -0,0 +1,116 @@
+import math
+import uuid
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+import httpx
+from redis.exceptions import RedisError
+from app.config import settings
+from app.core.cache import redis_client
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Token bucket per subscription in the hash at ratelimit:{subscription_id}.
+# Takes up to ARGV[3] tokens and returns {granted, milliseconds until the next token}.
+# Time comes from Redis so the workers' clocks don't have to agree. A bucket
+# blocked by a receiver's Retry-After grants nothing until the block ends.
+_ACQUIRE_SCRIPT = redis_client.register_script("""
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'blocked_until')
+local blocked_until = tonumber(bucket[3]) or 0
+if blocked_until > now then
+    return {0, math.ceil((blocked_until - now) * 1000)}
+end
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+if granted < requested then
+    return {granted, math.ceil((1 - tokens) * 1000 / rate)}
+end
+return {granted, 0}
+""")
+
+# Empties the bucket and blocks it for ARGV[1] seconds; refilling starts when the block ends
+_PENALIZE_SCRIPT = redis_client.register_script("""
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local blocked_until = now + tonumber(ARGV[1])
+if blocked_until > (tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0) then
+    redis.call('HSET', KEYS[1], 'tokens', 0, 'updated_at', tostring(blocked_until), 'blocked_until', tostring(blocked_until))
+end
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + tonumber(ARGV[2]))
+return 1
+""")
+
+
+def subscription_limit(subscription: Dict) -> Optional[Tuple[float, int]]:
+    """``(rate, burst)`` of a subscription's delivery rate limit, or None when it has none."""
+    rate = subscription.get("rate_limit_per_second")
+    if not rate:
+        return None
+    return rate, subscription.get("rate_limit_burst") or max(1, math.ceil(rate))
+
+
+def _ttl(rate: float, burst: int) -> int:
+    # A bucket left alone this long is full again, the same as a missing one
+    return math.ceil(burst / rate) + 60
+
+
+def acquire(subscription_id: uuid.UUID, rate: float, burst: int, count: int = 1) -> Tuple[int, float]:
+    """
+    Take up to ``count`` delivery tokens for a subscription. Returns how many
+    were granted and the seconds until the next token. Fails open if Redis is
+    unavailable.
+    """
+    try:
+        granted, wait_ms = _ACQUIRE_SCRIPT(
+            keys=[f"ratelimit:{subscription_id}"],
+            args=[rate, burst, count, _ttl(rate, burst)]
+        )
+        return int(granted), int(wait_ms) / 1000
+    except RedisError as e:
+        logger.warning(f"Rate limit check failed for subscription {subscription_id}: {str(e)}")
+        return count, 0.0
+
+
+def penalize(subscription_id: uuid.UUID, seconds: float, rate: float, burst: int):
+    """Hold a subscription's deliveries for ``seconds``, e.g. after a 429 with Retry-After."""
+    try:
+        _PENALIZE_SCRIPT(keys=[f"ratelimit:{subscription_id}"], args=[seconds, _ttl(rate, burst)])
+        logger.warning(f"Subscription {subscription_id} rate limited by its receiver; holding deliveries for {seconds:.0f}s")
+    except RedisError as e:
+        logger.warning(f"Rate limit update failed for subscription {subscription_id}: {str(e)}")
+
+
+def deferral_delays(granted: int, wait: float, rate: float, count: int) -> List[int]:
+    """
+    Per-delivery delays for ``count`` deliveries sharing one acquire: 0 for the
+    granted ones, then one token interval apart so deferred deliveries don't
+    all come back at once.
+    """
+    return [0] * granted + [max(1, math.ceil(wait + index / rate)) for index in range(count - granted)]
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Seconds a receiver asked us to wait (``Retry-After`` as seconds or an HTTP date), capped."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), settings.RATE_LIMIT_MAX_RETRY_AFTER)
@@ -0,0 +1,72 @@
+import time
+import logging
+from typing import Iterable, List, Tuple
+from redis.exceptions import RedisError
+from app.core.cache import redis_client
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Sorted set of delivery ids scored by the unix time their next attempt is due
+RETRY_SCHEDULE_KEY = "deliveries:retry_schedule"
+
+# Removes the members in ARGV[2..] whose score is still <= ARGV[1]. A delivery
+# rescheduled since it was read (e.g. it already ran again and failed) keeps its
+# new, later entry.
+_REMOVE_DUE_SCRIPT = redis_client.register_script("""
+local removed = 0
+for i = 2, #ARGV do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score and tonumber(score) <= tonumber(ARGV[1]) then
+        removed = removed + redis.call('ZREM', KEYS[1], ARGV[i])
+    end
+end
+return removed
+""")
+
+
+def schedule_retries(retries: Iterable[Tuple[str, int]]) -> bool:
+    """
+    Add ``(delivery_id, delay_seconds)`` pairs to the retry schedule in one round trip.
+    Returns False if Redis is unavailable so callers can fall back to a countdown.
+    """
+    now = time.time()
+    mapping = {str(delivery_id): now + delay for delivery_id, delay in retries}
+    if not mapping:
+        return True
+    try:
+        redis_client.zadd(RETRY_SCHEDULE_KEY, mapping)
+        return True
+    except RedisError as e:
+        logger.warning(f"Failed to schedule {len(mapping)} retries: {str(e)}")
+        return False
+
+
+def schedule_retry(delivery_id: str, delay: int) -> bool:
+    """Schedule a single delivery retry ``delay`` seconds from now."""
+    return schedule_retries([(delivery_id, delay)])
+
+
+def get_due_retries(limit: int, now: float = None) -> List[str]:
+    """Return up to ``limit`` delivery ids whose retry is due, oldest first."""
+    now = time.time() if now is None else now
+    members = redis_client.zrangebyscore(RETRY_SCHEDULE_KEY, "-inf", now, start=0, num=limit)
+    return [member.decode() if isinstance(member, bytes) else member for member in members]
+
+
+def remove_retries(delivery_ids: List[str], due_before: float):
+    """
+    Remove delivery ids from the schedule once they have been re-enqueued,
+    unless they were rescheduled past ``due_before`` in the meantime.
+    """
+    if delivery_ids:
+        _REMOVE_DUE_SCRIPT(keys=[RETRY_SCHEDULE_KEY], args=[due_before, *delivery_ids], client=redis_client)
+
+
+def pending_retry_count() -> int:
+    """Number of retries waiting in the schedule."""
+    try:
+        return redis_client.zcard(RETRY_SCHEDULE_KEY)
+    except RedisError as e:
+        logger.warning(f"Failed to count scheduled retries: {str(e)}")
+        return 0
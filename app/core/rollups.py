@@ -0,0 +1,113 @@
+"""
+Delivery metrics rollups (``delivery_metrics``).
+
+Workers turn the attempts they record into per-minute counter increments,
+aggregated in memory first so a batch of attempts costs one upsert row per
+(subscription, event type, minute). Summaries add the counters back up and
+estimate latency percentiles from the histogram buckets.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+from app.db.models import AttemptStatus, LATENCY_BUCKETS_MS
+
+LATENCY_COLUMNS = [f"latency_le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["latency_le_inf"]
+
+COUNTER_COLUMNS = [
+    "attempts", "successes", "failures",
+    "status_2xx", "status_3xx", "status_4xx", "status_5xx", "errors",
+    "latency_count", "latency_sum_ms",
+] + LATENCY_COLUMNS
+
+PERCENTILES = (50, 90, 99)
+
+
+def minute_bucket(timestamp: Optional[datetime] = None) -> datetime:
+    timestamp = timestamp or datetime.now(timezone.utc)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc).replace(second=0, microsecond=0)
+
+
+def _latency_column(latency_ms: float) -> str:
+    for bound, column in zip(LATENCY_BUCKETS_MS, LATENCY_COLUMNS):
+        if latency_ms <= bound:
+            return column
+    return LATENCY_COLUMNS[-1]
+
+
+def rollup_rows(samples: Iterable[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Counter increments for recorded attempts. Each sample carries
+    ``subscription_id``, ``event_type``, ``status``, ``status_code``, ``latency``
+    (seconds, or None when no response arrived) and optionally ``timestamp``.
+    Rows come back sorted by key so concurrent upserts lock rows in the same order.
+    """
+    rows: Dict[Tuple, Dict[str, Any]] = {}
+    for sample in samples:
+        key = (sample["subscription_id"], sample.get("event_type") or "", minute_bucket(sample.get("timestamp")))
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {
+                "subscription_id": key[0], "event_type": key[1], "bucket": key[2],
+                **{column: 0 for column in COUNTER_COLUMNS}
+            }
+        row["attempts"] += 1
+        if sample["status"] == AttemptStatus.SUCCESS:
+            row["successes"] += 1
+        else:
+            row["failures"] += 1
+        status_code = sample.get("status_code")
+        if status_code is None:
+            row["errors"] += 1
+        elif 200 <= status_code < 600:
+            row[f"status_{status_code // 100}xx"] += 1
+        if sample.get("latency") is not None:
+            latency_ms = sample["latency"] * 1000
+            row["latency_count"] += 1
+            row["latency_sum_ms"] += latency_ms
+            row[_latency_column(latency_ms)] += 1
+    return [rows[key] for key in sorted(rows, key=lambda key: (str(key[0]), key[1], key[2]))]
+
+
+def _percentile(histogram: List[int], total: int, percentile: float) -> Optional[float]:
+    # Linear interpolation inside the bucket holding the rank, as Prometheus' histogram_quantile does
+    if not total:
+        return None
+    rank = total * percentile / 100
+    lower = 0.0
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS, histogram):
+        if count and seen + count >= rank:
+            return round(lower + (bound - lower) * (rank - seen) / count, 1)
+        seen += count
+        lower = bound
+    # Beyond the last finite bucket there is no upper bound to interpolate to
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+def summarize(totals: Mapping[str, Any]) -> Dict[str, Any]:
+    """Rates and latency percentiles from summed rollup counters."""
+    attempts = totals.get("attempts") or 0
+    latency_count = totals.get("latency_count") or 0
+    histogram = [totals.get(column) or 0 for column in LATENCY_COLUMNS]
+    return {
+        "attempts": attempts,
+        "successes": totals.get("successes") or 0,
+        "failures": totals.get("failures") or 0,
+        "success_rate": round((totals.get("successes") or 0) / attempts, 4) if attempts else None,
+        "status_codes": {
+            "2xx": totals.get("status_2xx") or 0,
+            "3xx": totals.get("status_3xx") or 0,
+            "4xx": totals.get("status_4xx") or 0,
+            "5xx": totals.get("status_5xx") or 0,
+            "errors": totals.get("errors") or 0,
+        },
+        "latency_ms": {
+            "avg": round(totals["latency_sum_ms"] / latency_count, 1) if latency_count else None,
+            **{f"p{p}": _percentile(histogram, latency_count, p) for p in PERCENTILES},
+            "histogram": {
+                **{f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, histogram)},
+                "le_inf": histogram[-1],
+            },
+        },
+    }
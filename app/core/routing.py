@@ -0,0 +1,191 @@
+import json
+import uuid
+import logging
+import threading
+from collections import namedtuple
+from typing import Dict, Optional, Tuple
+from redis.exceptions import RedisError
+from app.config import settings
+from app.core.cache import redis_client, SUBSCRIPTION_CHANGES_CHANNEL
+from app.db.models import Subscription, ALL_EVENT_TYPES
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Compact, immutable routing entry for an active subscription
+Route = namedtuple("Route", ["id", "target_url", "event_types"])
+
+
+class SubscriptionRouter:
+    """
+    In-memory event_type -> active subscriptions map for the ingest hot path.
+
+    Lookups are lock-free dict reads; writers rebuild only the tuples of the
+    event types touched by a change and swap them in under a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id: Dict[str, Route] = {}
+        self._routes: Dict[str, Tuple[Route, ...]] = {}
+        self.ready = False
+
+    def load(self, db):
+        """Build the routing table from all active subscriptions."""
+        by_id = {}
+        for subscription in db.query(Subscription).filter(Subscription.is_active == True).all():
+            route = _to_route(subscription.id, subscription.target_url, subscription.event_types)
+            by_id[str(route.id)] = route
+
+        routes = {}
+        for route in by_id.values():
+            for event_type in route.event_types or (ALL_EVENT_TYPES,):
+                routes.setdefault(event_type, []).append(route)
+
+        with self._lock:
+            self._by_id = by_id
+            self._routes = {event_type: tuple(items) for event_type, items in routes.items()}
+            self.ready = True
+        logger.info(f"Loaded subscription router with {len(by_id)} active subscriptions")
+
+    def get(self, subscription_id) -> Optional[Route]:
+        """Return the route for an active subscription, or None if unknown/inactive."""
+        return self._by_id.get(str(subscription_id))
+
+    def route(self, event_type: Optional[str]) -> Tuple[Route, ...]:
+        """Return every active subscription that should receive ``event_type``."""
+        catch_all = self._routes.get(ALL_EVENT_TYPES, ())
+        typed = self._routes.get(event_type, ()) if event_type else ()
+        if not typed or not catch_all:
+            return typed or catch_all
+        # Each subscription once, even if it is both typed and catch-all
+        typed_ids = {route.id for route in typed}
+        return typed + tuple(route for route in catch_all if route.id not in typed_ids)
+
+    def upsert(self, subscription_id, target_url: str, is_active: bool, event_types):
+        """Apply a created/updated subscription."""
+        if not is_active:
+            self.remove(subscription_id)
+            return
+
+        route = _to_route(subscription_id, target_url, event_types)
+        with self._lock:
+            previous = self._by_id.get(str(route.id))
+            self._by_id[str(route.id)] = route
+            self._rebuild(previous, route)
+
+    def remove(self, subscription_id):
+        """Drop a deleted or deactivated subscription."""
+        with self._lock:
+            previous = self._by_id.pop(str(subscription_id), None)
+            if previous:
+                self._rebuild(previous, None)
+
+    def _rebuild(self, previous: Optional[Route], current: Optional[Route]):
+        # Only the event types the old or new route touches need new tuples
+        touched = set()
+        for route in (previous, current):
+            if route:
+                touched.update(route.event_types or (ALL_EVENT_TYPES,))
+
+        for event_type in touched:
+            items = tuple(
+                route for route in self._by_id.values()
+                if event_type in (route.event_types or (ALL_EVENT_TYPES,))
+            )
+            if items:
+                self._routes[event_type] = items
+            else:
+                self._routes.pop(event_type, None)
+
+    def apply_message(self, message: dict):
+        """Apply a change message published by ``publish_subscription_change``."""
+        if message.get("deleted"):
+            self.remove(message["id"])
+        else:
+            self.upsert(message["id"], message["target_url"], message["is_active"], message["event_types"])
+
+
+def receives(event_types, event_type: Optional[str]) -> bool:
+    """
+    Whether a subscription with ``event_types`` gets an ``event_type`` event; the
+    rule ``SubscriptionRouter.route`` applies, for routing without the router.
+    """
+    if not event_types or ALL_EVENT_TYPES in event_types:
+        return True
+    return bool(event_type) and event_type in event_types
+
+
+def _to_route(subscription_id, target_url, event_types) -> Route:
+    # One entry per event type, as in the routing table; '*' already covers every other type
+    event_types = tuple(dict.fromkeys(event_types or ()))
+    if ALL_EVENT_TYPES in event_types:
+        event_types = (ALL_EVENT_TYPES,)
+    return Route(uuid.UUID(str(subscription_id)), target_url, event_types)
+
+
+subscription_router = SubscriptionRouter()
+
+
+def publish_subscription_change(subscription=None, subscription_id=None):
+    """
+    Broadcast a subscription change to every API worker.
+    Pass the updated ORM object, or only ``subscription_id`` for deletes.
+    The local router is updated immediately; other workers catch up via pub/sub.
+    """
+    if subscription is not None:
+        message = {
+            "id": str(subscription.id),
+            "target_url": subscription.target_url,
+            "is_active": bool(subscription.is_active),
+            "event_types": list(subscription.event_types or []),
+        }
+    else:
+        message = {"id": str(subscription_id), "deleted": True}
+
+    if subscription_router.ready:
+        subscription_router.apply_message(message)
+
+    try:
+        redis_client.publish(SUBSCRIPTION_CHANGES_CHANNEL, json.dumps(message))
+    except RedisError as e:
+        logger.warning(f"Failed to publish subscription change for {message['id']}: {str(e)}")
+
+
+def start_router_listener(session_factory) -> threading.Event:
+    """
+    Load the router and keep it in sync from pub/sub in a daemon thread.
+    Any missed messages (e.g. after a Redis disconnect) are covered by a full reload.
+    Returns an Event that stops the listener when set.
+    """
+    stop = threading.Event()
+
+    def reload():
+        with session_factory() as db:
+            subscription_router.load(db)
+
+    def listen():
+        while not stop.is_set():
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(SUBSCRIPTION_CHANGES_CHANNEL)
+                # Reload after (re)subscribing so no change can fall in between
+                reload()
+                while not stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        subscription_router.apply_message(json.loads(message["data"]))
+            except RedisError as e:
+                # Without invalidations the table may go stale, so fall back to the DB until resubscribed
+                subscription_router.ready = False
+                logger.warning(f"Subscription router lost Redis pub/sub: {str(e)}. Falling back to DB routing.")
+                stop.wait(settings.ROUTER_RESUBSCRIBE_SECONDS)
+            except Exception as e:
+                logger.error(f"Subscription router listener error: {str(e)}")
+                stop.wait(settings.ROUTER_RESUBSCRIBE_SECONDS)
+            finally:
+                pubsub.close()
+
+    reload()
+    threading.Thread(target=listen, name="subscription-router", daemon=True).start()
+    return stop
@@ -1,12 +1,49 @@
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
+from app.db.pool import engine_options
+from app.core.metrics import DB_COMMIT_DURATION, observe_since
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=True, bind=engine)
+
+def _async_url(url: str):
+    """Map the sync DATABASE_URL onto its async driver (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        query = dict(url.query)
+        # asyncpg takes ``ssl`` instead of libpq's ``sslmode``
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+
+class TimedSession(Session):
+    """Session that reports commit time (flush included) to the db_commit_duration_seconds histogram."""
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            observe_since(DB_COMMIT_DURATION, started, settings.DB_PROCESS_ROLE)
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=True, bind=engine, class_=TimedSession)
+
+# Used by the FastAPI routes so DB round trips don't block the event loop;
+# Celery workers and startup code keep the sync engine above
+ASYNC_DATABASE_URL = _async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=True, expire_on_commit=False, sync_session_class=TimedSession)
 
 Base = declarative_base()
 
@@ -21,3 +58,13 @@ def get_db():
         raise e  # Reraise the exception to propagate the error
     finally:
         db.close()  # Always close the session
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise e
@@ -1,53 +1,110 @@
 from sqlalchemy.orm import Session
-from app.db.models import Subscription, WebhookDelivery, DeliveryAttempt, DeliveryStatus, AttemptStatus
+from app.db.models import (
+    Subscription, SubscriptionEventType, WebhookDelivery, WebhookPayload, DeliveryAttempt, IngestIdempotencyKey,
+    DeliveryMetricsRollup, DeliveryStatus, AttemptStatus, ALL_EVENT_TYPES, PARTITIONED, utcnow
+)
+import time
 import uuid
 from datetime import datetime, timedelta
 from app.config import settings
-from typing import List, Optional
-from sqlalchemy import or_, cast, String
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from sqlalchemy import insert, delete, select, update, func, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from app.core.payloads import encode_payload, decode_payload, serialize_payload, decoded_payload_cache
+from app.core.rollups import COUNTER_COLUMNS, rollup_rows
+from app.db.partitions import retention_cutoff
 
 # Subscription CRUD operations
-def create_subscription(db: Session, name: str, target_url: str, secret_key: Optional[str] = None, event_types: Optional[List[str]] = None):
+def create_subscription(
+    db: Session,
+    name: str,
+    target_url: str,
+    secret_key: Optional[str] = None,
+    event_types: Optional[List[str]] = None,
+    rate_limit_per_second: Optional[float] = None,
+    rate_limit_burst: Optional[int] = None,
+    delivery_weight: Optional[int] = None
+):
     subscription = Subscription(
         name=name,
         target_url=target_url,
         secret_key=secret_key,
+        rate_limit_per_second=rate_limit_per_second,
+        rate_limit_burst=rate_limit_burst,
+        delivery_weight=delivery_weight,
         event_types=event_types if event_types else []
     )
     db.add(subscription)
+    db.flush()
+    _set_subscription_event_types(db, subscription.id, subscription.event_types)
     db.commit()
     db.refresh(subscription)
     return subscription
 
+def _set_subscription_event_types(db: Session, subscription_id: uuid.UUID, event_types: Optional[List[str]]):
+    """Replace the routing rows for a subscription (caller commits)"""
+    db.execute(delete(SubscriptionEventType).where(SubscriptionEventType.subscription_id == subscription_id))
+    rows = [
+        {"subscription_id": subscription_id, "event_type": event_type}
+        for event_type in (set(event_types) if event_types else {ALL_EVENT_TYPES})
+    ]
+    db.execute(insert(SubscriptionEventType), rows)
+
+def backfill_subscription_event_types(db: Session):
+    """Create routing rows for subscriptions that predate the subscription_event_types table"""
+    missing = db.query(Subscription).filter(
+        ~select(SubscriptionEventType.subscription_id)
+        .where(SubscriptionEventType.subscription_id == Subscription.id)
+        .exists()
+    ).all()
+    for subscription in missing:
+        _set_subscription_event_types(db, subscription.id, subscription.event_types)
+    db.commit()
+    return len(missing)
+
 def get_subscription(db: Session, subscription_id: uuid.UUID):
     subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
     return subscription
 
-def get_subscriptions(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Subscription).offset(skip).limit(limit).all()
+def get_subscriptions_by_ids(db: Session, subscription_ids: Iterable[uuid.UUID]) -> List[Subscription]:
+    return db.query(Subscription).filter(Subscription.id.in_(list(subscription_ids))).all()
+
+def get_subscriptions(db: Session, skip: int = 0, limit: int = 100, after: Optional[tuple] = None):
+    """Subscriptions oldest first; pass ``after=(created_at, id)`` for keyset pagination instead of ``skip``"""
+    query = db.query(Subscription)
+    if after:
+        query = query.filter(tuple_(Subscription.created_at, Subscription.id) > after)
+    elif skip:
+        query = query.offset(skip)
+    return query.order_by(Subscription.created_at, Subscription.id).limit(limit).all()
 
 def get_subscriptions_for_event_type(db: Session, event_type: Optional[str] = None):
     """Get all active subscriptions that match the given event type or have no event type preferences"""
     query = db.query(Subscription).filter(Subscription.is_active == True)
 
     if event_type:
-        # Use a text-based approach that works regardless of JSON structure
-        query = query.filter(
-            or_(
-                Subscription.event_types.is_(None),  # No event types specified (accepts all)
-                cast(Subscription.event_types, String) == '[]',  # Empty array as string
-                cast(Subscription.event_types, String).like(f'%"{event_type}"%')  # String contains the event_type
-            )
+        # Index lookup on subscription_event_types; '*' rows accept every event type
+        matching_ids = select(SubscriptionEventType.subscription_id).where(
+            SubscriptionEventType.event_type.in_([event_type, ALL_EVENT_TYPES])
         )
+        query = query.filter(Subscription.id.in_(matching_ids))
 
     return query.all()
 
+def get_subscription_weights(db: Session) -> Dict[uuid.UUID, int]:
+    """Fair-scheduling weight of every subscription that has one"""
+    return dict(db.execute(
+        select(Subscription.id, Subscription.delivery_weight).where(Subscription.delivery_weight.isnot(None))
+    ).all())
+
 def update_subscription(db: Session, subscription_id: uuid.UUID, data: dict):
     subscription = get_subscription(db, subscription_id)
     if subscription:
         for key, value in data.items():
             setattr(subscription, key, value)
+        if "event_types" in data:
+            _set_subscription_event_types(db, subscription_id, data["event_types"])
         subscription.updated_at = datetime.now()
         db.commit()
         db.refresh(subscription)
@@ -60,6 +117,7 @@ def update_subscription_event_types(db: Session, subscription_id: uuid.UUID, eve
     if subscription:
         subscription.event_types = event_types
         subscription.updated_at = datetime.now()
+        _set_subscription_event_types(db, subscription_id, event_types)
         db.commit()
         db.refresh(subscription)
     
@@ -68,19 +126,26 @@ def update_subscription_event_types(db: Session, subscription_id: uuid.UUID, eve
 def delete_subscription(db: Session, subscription_id: uuid.UUID):
     subscription = get_subscription(db, subscription_id)
     if subscription:
+        db.execute(delete(SubscriptionEventType).where(SubscriptionEventType.subscription_id == subscription_id))
         db.delete(subscription)
         db.commit()
         return True
     return False
 
+def delete_subscription_logs(db: Session, subscription_id: uuid.UUID):
+    """Delete a subscription's delivery attempts and deliveries (not committed)."""
+    delivery_ids = select(WebhookDelivery.id).where(WebhookDelivery.subscription_id == subscription_id)
+    db.execute(delete(DeliveryAttempt).where(DeliveryAttempt.delivery_id.in_(delivery_ids)))
+    db.execute(delete(WebhookDelivery).where(WebhookDelivery.subscription_id == subscription_id))
+
 # Webhook Delivery CRUD operations
-def create_webhook_delivery(db: Session, subscription_id: uuid.UUID, payload: dict, event_type: str = None):
+def create_webhook_delivery(db: Session, subscription_id: uuid.UUID, payload: Union[bytes, dict], event_type: str = None):
     # Calculate expiration time (72 hours from now)
-    expires_at = datetime.now() + timedelta(hours=settings.LOG_RETENTION_HOURS)
+    expires_at = utcnow() + timedelta(hours=settings.LOG_RETENTION_HOURS)
     
     delivery = WebhookDelivery(
         subscription_id=subscription_id,
-        payload=payload,
+        payload_hash=store_payload(db, payload, expires_at),
         status=DeliveryStatus.PENDING,
         event_type=event_type,
         expires_at=expires_at
@@ -90,9 +155,235 @@ def create_webhook_delivery(db: Session, subscription_id: uuid.UUID, payload: di
     db.refresh(delivery)
     return delivery
 
+def create_webhook_deliveries(db: Session, subscription_ids: List[uuid.UUID], payload: Union[bytes, dict], event_type: str = None):
+    """Fan a single event out to many subscriptions with one multi-row INSERT and one commit.
+
+    Ids are generated client-side so no RETURNING/refresh round trip is needed.
+    Returns the new delivery ids in the same order as ``subscription_ids``.
+    """
+    if not subscription_ids:
+        return []
+
+    rows = _delivery_rows(db, subscription_ids, payload, event_type)
+    db.execute(insert(WebhookDelivery), rows)
+    db.commit()
+    return [row["id"] for row in rows]
+
+def _delivery_rows(db: Session, subscription_ids: List[uuid.UUID], payload: Union[bytes, dict], event_type: Optional[str]) -> List[dict]:
+    # The payload is stored once, however many subscriptions the event fans out to
+    expires_at = utcnow() + timedelta(hours=settings.LOG_RETENTION_HOURS)
+    payload_hash = store_payload(db, payload, expires_at)
+    return [
+        {
+            "id": uuid.uuid4(),
+            "subscription_id": subscription_id,
+            "payload_hash": payload_hash,
+            "status": DeliveryStatus.PENDING,
+            "event_type": event_type,
+            "expires_at": expires_at,
+            "attempts_count": 0,
+        }
+        for subscription_id in subscription_ids
+    ]
+
+def create_batch_deliveries(db: Session, events: List[Tuple[List[uuid.UUID], bytes, Optional[str]]]) -> List[List[uuid.UUID]]:
+    """Create the deliveries for a batch of ``(subscription_ids, payload, event_type)`` events.
+
+    All payloads go in one upsert and all deliveries in one multi-row INSERT,
+    committed together. Returns each event's delivery ids, in order.
+    """
+    expires_at = utcnow() + timedelta(hours=settings.LOG_RETENTION_HOURS)
+    payload_hashes = store_payloads(db, [payload for _, payload, _ in events], expires_at) if events else []
+    rows = []
+    delivery_ids = []
+    for (subscription_ids, _, event_type), payload_hash in zip(events, payload_hashes):
+        event_rows = [
+            {
+                "id": uuid.uuid4(),
+                "subscription_id": subscription_id,
+                "payload_hash": payload_hash,
+                "status": DeliveryStatus.PENDING,
+                "event_type": event_type,
+                "expires_at": expires_at,
+                "attempts_count": 0,
+            }
+            for subscription_id in subscription_ids
+        ]
+        rows.extend(event_rows)
+        delivery_ids.append([row["id"] for row in event_rows])
+    if rows:
+        db.execute(insert(WebhookDelivery), rows)
+    db.commit()
+    return delivery_ids
+
+def get_idempotent_deliveries(db: Session, scope: str, key: str) -> Optional[List[str]]:
+    """Delivery ids recorded for an unexpired idempotency key, or None."""
+    return db.execute(
+        select(IngestIdempotencyKey.delivery_ids).where(
+            IngestIdempotencyKey.scope == scope,
+            IngestIdempotencyKey.key == key,
+            IngestIdempotencyKey.expires_at > utcnow()
+        )
+    ).scalar_one_or_none()
+
+def create_idempotent_deliveries(db: Session, scope: str, key: str, subscription_ids: List[uuid.UUID],
+                                 payload: Union[bytes, dict], event_type: str = None) -> Tuple[List[uuid.UUID], bool]:
+    """Create deliveries and record them under an idempotency key in one transaction.
+
+    The key's primary key is the dedup index: if another request already holds
+    it, nothing is inserted and that request's delivery ids are returned.
+    Returns ``(delivery_ids, created)``.
+    """
+    now = utcnow()
+    # A key past its dedup window may be reused
+    db.execute(delete(IngestIdempotencyKey).where(
+        IngestIdempotencyKey.scope == scope,
+        IngestIdempotencyKey.key == key,
+        IngestIdempotencyKey.expires_at <= now
+    ))
+    try:
+        rows = _delivery_rows(db, subscription_ids, payload, event_type)
+        db.execute(insert(IngestIdempotencyKey).values(
+            scope=scope,
+            key=key,
+            delivery_ids=[str(row["id"]) for row in rows],
+            created_at=now,
+            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_WINDOW_SECONDS)
+        ))
+        if rows:
+            db.execute(insert(WebhookDelivery), rows)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        existing = get_idempotent_deliveries(db, scope, key)
+        if existing is None:
+            raise
+        return [uuid.UUID(delivery_id) for delivery_id in existing], False
+    return [row["id"] for row in rows], True
+
+def insert_buffered_deliveries(db: Session, rows: List[dict]):
+    """Persist deliveries accepted through the ingest buffer in one multi-row INSERT.
+
+    Rows carry ids and timestamps assigned at ingest, and ids that already exist
+    are skipped, so replaying a buffer entry after a crash is harmless.
+    """
+    if not rows:
+        return
+    # Rows of one buffered entry share a payload object; store each distinct one once
+    payload_hashes = {}
+    deliveries = []
+    for row in rows:
+        row = dict(row)
+        payload = row.pop("payload")
+        expires_at = row["created_at"] + timedelta(hours=settings.LOG_RETENTION_HOURS)
+        if id(payload) not in payload_hashes:
+            payload_hashes[id(payload)] = store_payload(db, payload, expires_at)
+        deliveries.append({
+            **row,
+            "payload_hash": payload_hashes[id(payload)],
+            "status": DeliveryStatus.PENDING,
+            "expires_at": expires_at,
+            "attempts_count": 0,
+        })
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        # No ON CONFLICT here: skip ids a previous flush of the same entry already inserted
+        existing = set(db.execute(
+            select(WebhookDelivery.id).where(WebhookDelivery.id.in_([delivery["id"] for delivery in deliveries]))
+        ).scalars())
+        deliveries = [delivery for delivery in deliveries if delivery["id"] not in existing]
+        if deliveries:
+            db.execute(insert(WebhookDelivery), deliveries)
+    else:
+        db.execute(dialect_insert(WebhookDelivery).on_conflict_do_nothing(), deliveries)
+    db.commit()
+
+def _dialect_insert(db: Session):
+    """The dialect's INSERT construct with ON CONFLICT support, or None."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+# Payload store operations
+def store_payload(db: Session, payload: Union[bytes, dict], expires_at: datetime) -> str:
+    """Add a payload to the content-addressed store (caller commits) and return its hash.
+
+    Pass the raw request body where there is one; it is stored, signed and sent as is.
+
+    Storing a payload that already exists only pushes its expiry out to the
+    newest delivery referencing it.
+    """
+    return store_payloads(db, [payload], expires_at)[0]
+
+def store_payloads(db: Session, payloads: List[Union[bytes, dict]], expires_at: datetime) -> List[str]:
+    """Store many payloads with one multi-row upsert (caller commits); returns their hashes in order."""
+    encoded_payloads = [encode_payload(payload) for payload in payloads]
+    # A hash may appear only once per upsert statement
+    rows = {
+        encoded.hash: {
+            "hash": encoded.hash,
+            "encoding": encoded.encoding,
+            "body": encoded.body,
+            "size": encoded.size,
+            "expires_at": expires_at,
+        }
+        for encoded in encoded_payloads
+    }
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        for payload_hash, row in rows.items():
+            existing = db.get(WebhookPayload, payload_hash)
+            if existing:
+                existing.expires_at = max(existing.expires_at, expires_at)
+            else:
+                db.add(WebhookPayload(**row))
+        db.flush()
+    else:
+        stmt = dialect_insert(WebhookPayload).values(list(rows.values()))
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[WebhookPayload.hash],
+            set_={"expires_at": stmt.excluded.expires_at},
+            where=WebhookPayload.expires_at < stmt.excluded.expires_at
+        ))
+    return [encoded.hash for encoded in encoded_payloads]
+
+def load_payloads(db: Session, payload_hashes: Iterable[str]) -> Dict[str, bytes]:
+    """Payload bytes by hash, from the in-process cache or one query for the rest."""
+    payloads = {}
+    missing = set()
+    for payload_hash in set(payload_hashes):
+        payload = decoded_payload_cache.get(payload_hash)
+        if payload is None:
+            missing.add(payload_hash)
+        else:
+            payloads[payload_hash] = payload
+    if missing:
+        for stored in db.execute(select(WebhookPayload).where(WebhookPayload.hash.in_(missing))).scalars():
+            payload = decode_payload(stored.encoding, stored.body)
+            decoded_payload_cache.set(stored.hash, payload)
+            payloads[stored.hash] = payload
+    return payloads
+
+def get_delivery_payload(db: Session, delivery: WebhookDelivery) -> bytes:
+    """The delivery's body bytes, whether stored inline (older rows) or in the payload store."""
+    if not delivery.payload_hash:
+        return serialize_payload(delivery.payload)
+    return load_payloads(db, [delivery.payload_hash])[delivery.payload_hash]
+
 def get_webhook_delivery(db: Session, delivery_id: uuid.UUID):
     return db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery_id).first()
 
+def get_delivery_subscription_ids(db: Session, delivery_ids: List[uuid.UUID]) -> Dict[uuid.UUID, uuid.UUID]:
+    """Subscription of each existing delivery, in one query."""
+    return dict(db.execute(
+        select(WebhookDelivery.id, WebhookDelivery.subscription_id).where(WebhookDelivery.id.in_(delivery_ids))
+    ).all())
+
 def update_delivery_status(db: Session, delivery_id: uuid.UUID, status: DeliveryStatus):
     delivery = get_webhook_delivery(db, delivery_id)
     if delivery:
@@ -106,7 +397,13 @@ def update_delivery_status(db: Session, delivery_id: uuid.UUID, status: Delivery
 # Delivery Attempt CRUD operations
 def create_delivery_attempt(db: Session, delivery_id: uuid.UUID, attempt_number: int, status: AttemptStatus, 
                            status_code: Optional[int] = None, response: Optional[str] = None, 
-                           error: Optional[str] = None, next_retry_at: Optional[datetime] = None):
+                           error: Optional[str] = None, next_retry_at: Optional[datetime] = None,
+                           delivery: Optional[WebhookDelivery] = None, **timing):
+    """Record an attempt; pass its ``delivery`` to count it in the metrics rollups.
+
+    ``timing`` takes the started_at, completed_at, latency_ms, request_bytes and
+    response_bytes columns (see ``app.core.http.attempt_fields``).
+    """
     attempt = DeliveryAttempt(
         delivery_id=delivery_id,
         attempt_number=attempt_number,
@@ -114,52 +411,355 @@ def create_delivery_attempt(db: Session, delivery_id: uuid.UUID, attempt_number:
         status_code=status_code,
         response=response,
         error=error,
-        next_retry_at=next_retry_at
+        next_retry_at=next_retry_at,
+        **timing
     )
     db.add(attempt)
+    if delivery is not None:
+        latency_ms = timing.get("latency_ms")
+        record_attempt_rollups(db, [{
+            "subscription_id": delivery.subscription_id,
+            "event_type": delivery.event_type,
+            "status": status,
+            "status_code": status_code,
+            "latency": latency_ms / 1000 if latency_ms is not None else None,
+        }])
     db.commit()
     db.refresh(attempt)
     return attempt
 
-def get_delivery_attempts(db: Session, delivery_id: uuid.UUID):
-    return db.query(DeliveryAttempt).filter(DeliveryAttempt.delivery_id == delivery_id).order_by(DeliveryAttempt.attempt_number).all()
+# Batch delivery operations
+def claim_deliveries(db: Session, delivery_ids: List[uuid.UUID]):
+    """Mark the PENDING deliveries among ``delivery_ids`` PROCESSING and bump attempts_count in one UPDATE.
 
-def get_recent_delivery_attempts(db: Session, subscription_id: uuid.UUID, limit: int = 20):
-    return db.query(DeliveryAttempt)\
+    Returns only the rows this call claimed. The same ids can reach two workers
+    (at-least-once retries, reclaimed fair-queue entries); rows another worker
+    holds are skipped rather than sent twice.
+    """
+    # SKIP LOCKED on PostgreSQL; other backends drop the FOR UPDATE and rely on the status guard
+    pending = (
+        select(WebhookDelivery.id)
+        .where(WebhookDelivery.id.in_(delivery_ids), WebhookDelivery.status == DeliveryStatus.PENDING)
+        .with_for_update(skip_locked=True)
+    )
+    claim = (
+        update(WebhookDelivery)
+        .where(WebhookDelivery.id.in_(pending), WebhookDelivery.status == DeliveryStatus.PENDING)
+        .values(attempts_count=WebhookDelivery.attempts_count + 1, status=DeliveryStatus.PROCESSING)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        claimed_ids = db.execute(claim.returning(WebhookDelivery.id)).scalars().all()
+    else:
+        claimed_ids = db.execute(pending).scalars().all()
+        db.execute(claim.where(WebhookDelivery.id.in_(claimed_ids)))
+    db.commit()
+    if not claimed_ids:
+        return []
+    return db.query(WebhookDelivery).filter(WebhookDelivery.id.in_(claimed_ids)).all()
+
+def record_delivery_results(db: Session, attempts: List[dict], statuses: List[dict], rollups: Optional[List[dict]] = None):
+    """Bulk insert DeliveryAttempt rows, bulk update delivery statuses and add ``rollups`` samples in a single transaction"""
+    if attempts:
+        db.execute(insert(DeliveryAttempt), attempts)
+    if statuses:
+        db.execute(update(WebhookDelivery), statuses)
+    if rollups:
+        record_attempt_rollups(db, rollups)
+    db.commit()
+
+# Delivery metrics rollups
+def record_attempt_rollups(db: Session, samples: List[dict]):
+    """Add attempts to the per-minute delivery_metrics counters with one upsert (caller commits).
+
+    See ``app.core.rollups.rollup_rows`` for the sample fields.
+    """
+    if not settings.METRICS_ROLLUP_ENABLED:
+        return
+    rows = rollup_rows(samples)
+    if not rows:
+        return
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        for row in rows:
+            existing = db.get(DeliveryMetricsRollup, (row["subscription_id"], row["event_type"], row["bucket"]))
+            if existing:
+                for column in COUNTER_COLUMNS:
+                    setattr(existing, column, getattr(existing, column) + row[column])
+            else:
+                db.add(DeliveryMetricsRollup(**row))
+        db.flush()
+        return
+    stmt = dialect_insert(DeliveryMetricsRollup).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[DeliveryMetricsRollup.subscription_id, DeliveryMetricsRollup.event_type, DeliveryMetricsRollup.bucket],
+        set_={column: getattr(DeliveryMetricsRollup, column) + getattr(stmt.excluded, column) for column in COUNTER_COLUMNS}
+    ))
+
+def get_metrics_rollups(db: Session, start: datetime, end: datetime, subscription_id: Optional[uuid.UUID] = None,
+                        event_type: Optional[str] = None, group_by: Iterable[str] = ()) -> List[dict]:
+    """Summed rollup counters for minutes in ``[start, end)``, one dict per group.
+
+    ``group_by`` takes column names of delivery_metrics: subscription_id, event_type, bucket.
+    """
+    group_columns = [getattr(DeliveryMetricsRollup, column) for column in group_by]
+    query = select(
+        *group_columns,
+        *(func.sum(getattr(DeliveryMetricsRollup, column)).label(column) for column in COUNTER_COLUMNS)
+    ).where(DeliveryMetricsRollup.bucket >= start, DeliveryMetricsRollup.bucket < end)
+    if subscription_id:
+        query = query.where(DeliveryMetricsRollup.subscription_id == subscription_id)
+    if event_type is not None:
+        query = query.where(DeliveryMetricsRollup.event_type == event_type)
+    if group_columns:
+        query = query.group_by(*group_columns).order_by(*group_columns)
+    return [dict(row._mapping) for row in db.execute(query)]
+
+def get_delivery_attempts(db: Session, delivery_id: uuid.UUID, limit: Optional[int] = None, after: Optional[int] = None):
+    """Attempts of a delivery in order; ``after`` is the last attempt_number already seen"""
+    query = db.query(DeliveryAttempt).filter(DeliveryAttempt.delivery_id == delivery_id)
+    if after is not None:
+        query = query.filter(DeliveryAttempt.attempt_number > after)
+    query = query.order_by(DeliveryAttempt.attempt_number)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+def get_recent_delivery_attempts(db: Session, subscription_id: uuid.UUID, limit: int = 20, before: Optional[tuple] = None):
+    """Newest attempts for a subscription; ``before=(timestamp, id)`` continues from a previous page"""
+    query = db.query(DeliveryAttempt)\
         .join(WebhookDelivery, DeliveryAttempt.delivery_id == WebhookDelivery.id)\
-        .filter(WebhookDelivery.subscription_id == subscription_id)\
-        .order_by(DeliveryAttempt.timestamp.desc())\
+        .filter(WebhookDelivery.subscription_id == subscription_id)
+    if PARTITIONED:
+        # Bound both partition keys so Postgres only scans partitions inside retention
+        floor = retention_cutoff()
+        query = query.filter(DeliveryAttempt.timestamp >= floor, WebhookDelivery.created_at >= floor)
+    if before:
+        query = query.filter(tuple_(DeliveryAttempt.timestamp, DeliveryAttempt.id) < before)
+    return query\
+        .order_by(DeliveryAttempt.timestamp.desc(), DeliveryAttempt.id.desc())\
+        .limit(limit)\
+        .all()
+
+def get_subscription_deliveries(db: Session, subscription_id: uuid.UUID, limit: int = 20, before: Optional[tuple] = None):
+    """Newest deliveries for a subscription; ``before=(created_at, id)`` continues from a previous page"""
+    query = db.query(WebhookDelivery).filter(WebhookDelivery.subscription_id == subscription_id)
+    if PARTITIONED:
+        # Lets Postgres prune partitions outside the retention window
+        query = query.filter(WebhookDelivery.created_at >= retention_cutoff())
+    if before:
+        query = query.filter(tuple_(WebhookDelivery.created_at, WebhookDelivery.id) < before)
+    return query\
+        .order_by(WebhookDelivery.created_at.desc(), WebhookDelivery.id.desc())\
+        .limit(limit)\
+        .all()
+
+def get_attempts(db: Session, limit: int = 20, before: Optional[tuple] = None,
+                 min_latency_ms: Optional[float] = None, max_latency_ms: Optional[float] = None,
+                 subscription_id: Optional[uuid.UUID] = None, status: Optional[AttemptStatus] = None,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Newest attempts matching the filters; ``before=(timestamp, id)`` continues from a previous page.
+
+    Attempts recorded without a latency never match a latency bound.
+    """
+    query = db.query(DeliveryAttempt)
+    if subscription_id:
+        query = query.join(WebhookDelivery, DeliveryAttempt.delivery_id == WebhookDelivery.id)\
+            .filter(WebhookDelivery.subscription_id == subscription_id)
+    if min_latency_ms is not None:
+        query = query.filter(DeliveryAttempt.latency_ms >= min_latency_ms)
+    if max_latency_ms is not None:
+        query = query.filter(DeliveryAttempt.latency_ms <= max_latency_ms)
+    if status:
+        query = query.filter(DeliveryAttempt.status == status)
+    # The time bounds go on the indexed (timestamp, id) key, which is also the partition key
+    if start:
+        query = query.filter(DeliveryAttempt.timestamp >= start)
+    if end:
+        query = query.filter(DeliveryAttempt.timestamp < end)
+    if PARTITIONED and not start:
+        query = query.filter(DeliveryAttempt.timestamp >= retention_cutoff())
+    if before:
+        query = query.filter(tuple_(DeliveryAttempt.timestamp, DeliveryAttempt.id) < before)
+    return query\
+        .order_by(DeliveryAttempt.timestamp.desc(), DeliveryAttempt.id.desc())\
         .limit(limit)\
         .all()
 
 # Filter deliveries by event type
-def get_deliveries_by_event_type(db: Session, event_type: str, skip: int = 0, limit: int = 100):
-    """Get all webhook deliveries with a specific event type"""
-    return db.query(WebhookDelivery)\
-        .filter(WebhookDelivery.event_type == event_type)\
-        .order_by(WebhookDelivery.created_at.desc())\
-        .offset(skip)\
+def get_deliveries_by_event_type(db: Session, event_type: str, skip: int = 0, limit: int = 100, before: Optional[tuple] = None):
+    """Get webhook deliveries with a specific event type, newest first; prefer ``before=(created_at, id)`` over ``skip``"""
+    query = db.query(WebhookDelivery).filter(WebhookDelivery.event_type == event_type)
+    if before:
+        query = query.filter(tuple_(WebhookDelivery.created_at, WebhookDelivery.id) < before)
+    elif skip:
+        query = query.offset(skip)
+    return query\
+        .order_by(WebhookDelivery.created_at.desc(), WebhookDelivery.id.desc())\
         .limit(limit)\
         .all()
 
+# Log export queries (streamed with a server-side cursor by the export endpoint)
+def export_deliveries_query(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                            subscription_id: Optional[uuid.UUID] = None, event_type: Optional[str] = None,
+                            status: Optional[DeliveryStatus] = None):
+    """Deliveries created in ``[start, end)`` matching the filters, oldest first, as plain column rows"""
+    query = select(
+        WebhookDelivery.id, WebhookDelivery.subscription_id, WebhookDelivery.event_type,
+        WebhookDelivery.status, WebhookDelivery.attempts_count, WebhookDelivery.payload_hash,
+        WebhookDelivery.created_at, WebhookDelivery.expires_at
+    )
+    if start:
+        query = query.where(WebhookDelivery.created_at >= start)
+    if end:
+        query = query.where(WebhookDelivery.created_at < end)
+    if subscription_id:
+        query = query.where(WebhookDelivery.subscription_id == subscription_id)
+    if event_type:
+        query = query.where(WebhookDelivery.event_type == event_type)
+    if status:
+        query = query.where(WebhookDelivery.status == status)
+    return query.order_by(WebhookDelivery.created_at, WebhookDelivery.id)
+
+def export_attempts_query(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          subscription_id: Optional[uuid.UUID] = None, event_type: Optional[str] = None,
+                          status: Optional[AttemptStatus] = None):
+    """Attempts made in ``[start, end)`` with their delivery's subscription and event type, oldest first"""
+    query = select(
+        DeliveryAttempt.id, DeliveryAttempt.delivery_id, WebhookDelivery.subscription_id,
+        WebhookDelivery.event_type, DeliveryAttempt.attempt_number, DeliveryAttempt.status,
+        DeliveryAttempt.status_code, DeliveryAttempt.error, DeliveryAttempt.response,
+        DeliveryAttempt.next_retry_at, DeliveryAttempt.timestamp, DeliveryAttempt.started_at,
+        DeliveryAttempt.completed_at, DeliveryAttempt.latency_ms, DeliveryAttempt.request_bytes,
+        DeliveryAttempt.response_bytes
+    ).join(WebhookDelivery, DeliveryAttempt.delivery_id == WebhookDelivery.id)
+    if start:
+        query = query.where(DeliveryAttempt.timestamp >= start)
+    if end:
+        # A delivery is never created after its attempts, which also bounds its partitions
+        query = query.where(DeliveryAttempt.timestamp < end, WebhookDelivery.created_at < end)
+    if subscription_id:
+        query = query.where(WebhookDelivery.subscription_id == subscription_id)
+    if event_type:
+        query = query.where(WebhookDelivery.event_type == event_type)
+    if status:
+        query = query.where(DeliveryAttempt.status == status)
+    return query.order_by(DeliveryAttempt.timestamp, DeliveryAttempt.id)
+
 # Cleanup operations
-def cleanup_old_logs(db: Session):
-    cutoff_time = datetime.now() - timedelta(hours=settings.LOG_RETENTION_HOURS)
-    
-    # Get expired deliveries
-    expired_deliveries = db.query(WebhookDelivery).filter(
-        WebhookDelivery.expires_at < cutoff_time
-    ).all()
-    
-    # Delete their attempts first
-    for delivery in expired_deliveries:
-        db.query(DeliveryAttempt).filter(
-            DeliveryAttempt.delivery_id == delivery.id
-        ).delete()
-    
-    # Then delete the deliveries
-    db.query(WebhookDelivery).filter(
-        WebhookDelivery.expires_at < cutoff_time
-    ).delete()
-    
-    db.commit()
\ No newline at end of file
+def cleanup_old_logs(db: Session, batch_size: int = None, max_seconds: float = None):
+    """
+    Delete deliveries created before ``retention_cutoff`` (the cutoff at which
+    partitions are dropped too) and their attempts with set-based DELETEs in
+    chunks of ``batch_size`` deliveries, committing after each chunk so locks
+    are short-lived. Stops after ``max_seconds``; since every chunk is
+    committed, the next run simply resumes with whatever is still expired.
+    ``complete`` is False, and ``pending`` names the passes left unfinished,
+    when any pass ran out of time.
+    """
+    batch_size = batch_size or settings.CLEANUP_BATCH_SIZE
+    max_seconds = max_seconds or settings.CLEANUP_MAX_SECONDS
+    # One clock (UTC) for every cutoff below
+    now = utcnow()
+    cutoff_time = retention_cutoff(now)
+    started = time.monotonic()
+    stats = {
+        "deliveries_deleted": 0, "attempts_deleted": 0, "payloads_deleted": 0,
+        "idempotency_keys_deleted": 0, "rollups_deleted": 0, "chunks": 0
+    }
+    # Passes that haven't run out of expired rows yet
+    pending = ["deliveries", "payloads", "idempotency_keys", "rollups"]
+
+    while time.monotonic() - started < max_seconds:
+        delivery_ids = db.execute(
+            select(WebhookDelivery.id).where(WebhookDelivery.created_at < cutoff_time).limit(batch_size)
+        ).scalars().all()
+        if not delivery_ids:
+            pending.remove("deliveries")
+            break
+
+        # Delete their attempts first
+        stats["attempts_deleted"] += db.execute(
+            delete(DeliveryAttempt)
+            .where(DeliveryAttempt.delivery_id.in_(delivery_ids))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        # Then delete the deliveries
+        stats["deliveries_deleted"] += db.execute(
+            delete(WebhookDelivery)
+            .where(WebhookDelivery.id.in_(delivery_ids))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        stats["chunks"] += 1
+
+        if len(delivery_ids) < batch_size:
+            pending.remove("deliveries")
+            break
+
+    # Stored payloads whose last delivery has expired and is gone
+    while time.monotonic() - started < max_seconds:
+        payload_hashes = db.execute(
+            select(WebhookPayload.hash)
+            .where(
+                WebhookPayload.expires_at < now,
+                ~select(WebhookDelivery.id).where(WebhookDelivery.payload_hash == WebhookPayload.hash).exists()
+            )
+            .limit(batch_size)
+        ).scalars().all()
+        if payload_hashes:
+            stats["payloads_deleted"] += db.execute(
+                delete(WebhookPayload)
+                # Re-checked on delete: a new ingest of the same body pushes expires_at out
+                .where(WebhookPayload.hash.in_(payload_hashes), WebhookPayload.expires_at < now)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        if len(payload_hashes) < batch_size:
+            pending.remove("payloads")
+            break
+
+    # Idempotency keys past their dedup window
+    while time.monotonic() - started < max_seconds:
+        keys = db.execute(
+            select(IngestIdempotencyKey.scope, IngestIdempotencyKey.key)
+            .where(IngestIdempotencyKey.expires_at < now)
+            .limit(batch_size)
+        ).all()
+        if keys:
+            stats["idempotency_keys_deleted"] += db.execute(
+                delete(IngestIdempotencyKey)
+                .where(tuple_(IngestIdempotencyKey.scope, IngestIdempotencyKey.key).in_(keys))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        if len(keys) < batch_size:
+            pending.remove("idempotency_keys")
+            break
+
+    # Metrics rollups have their own, longer retention; chunked by row like the passes above
+    rollup_cutoff = now - timedelta(days=settings.METRICS_ROLLUP_RETENTION_DAYS)
+    rollup_key = tuple_(DeliveryMetricsRollup.subscription_id, DeliveryMetricsRollup.event_type, DeliveryMetricsRollup.bucket)
+    while time.monotonic() - started < max_seconds:
+        rollups = db.execute(
+            select(DeliveryMetricsRollup.subscription_id, DeliveryMetricsRollup.event_type, DeliveryMetricsRollup.bucket)
+            .where(DeliveryMetricsRollup.bucket < rollup_cutoff)
+            .limit(batch_size)
+        ).all()
+        if rollups:
+            stats["rollups_deleted"] += db.execute(
+                delete(DeliveryMetricsRollup)
+                .where(rollup_key.in_(rollups))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+        if len(rollups) < batch_size:
+            pending.remove("rollups")
+            break
+
+    stats["complete"] = not pending
+    stats["pending"] = pending
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    deleted = stats["deliveries_deleted"] + stats["attempts_deleted"] + stats["payloads_deleted"]
+    stats["rows_per_second"] = round(deleted / stats["seconds"], 1) if stats["seconds"] else deleted
+    return stats
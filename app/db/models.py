@@ -1,10 +1,20 @@
 import uuid
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Integer, Text, Enum, JSON
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, Boolean, DateTime, Float, ForeignKey, Integer, Text, Enum, JSON, Index, LargeBinary
 from app.db.types import GUID
 from sqlalchemy.sql import func
 from app.db.base import Base
+from app.db.partitions import is_enabled as partitioning_enabled
 import enum
 
+# Optional range partitioning of the log tables (see app/db/partitions.py). Postgres needs the
+# partition key in the table's primary key and can't point a foreign key at a partitioned
+# table by id alone, so both adapt when it's enabled; ORM identity stays the id column.
+PARTITIONED = partitioning_enabled()
+
+def _partition_by(column: str) -> dict:
+    return {"postgresql_partition_by": f"RANGE ({column})"} if PARTITIONED else {}
+
 class DeliveryStatus(str, enum.Enum):
     PENDING = "PENDING"
     PROCESSING = "PROCESSING"
@@ -15,6 +25,11 @@ class AttemptStatus(str, enum.Enum):
     SUCCESS = "SUCCESS"
     FAILED = "FAILED"
 
+def utcnow():
+    # Client-side default for keyset-paginated timestamps: SQLite's CURRENT_TIMESTAMP has no
+    # fractional seconds, so server-defaulted values wouldn't compare correctly with cursor values
+    return datetime.now(timezone.utc)
+
 class Subscription(Base):
     __tablename__ = "subscriptions"
     
@@ -22,34 +37,174 @@ class Subscription(Base):
     name = Column(String, nullable=False)
     target_url = Column(String, nullable=False)
     secret_key = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_active = Column(Boolean, default=True)
 
     event_types = Column(JSON, default=list)
+    # Optional delivery rate limit: tokens per second and bucket size (defaults to one second's worth)
+    rate_limit_per_second = Column(Float, nullable=True)
+    rate_limit_burst = Column(Integer, nullable=True)
+    # Share of delivery capacity under fair scheduling: deliveries per round-robin turn
+    delivery_weight = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # Keyset pagination of the subscription list
+        Index("ix_subscriptions_created_at_id", "created_at", "id"),
+    )
+
+# Matches every event type; stored for subscriptions with no event type preferences
+ALL_EVENT_TYPES = "*"
+
+class SubscriptionEventType(Base):
+    """Normalized event_type -> subscription routing table.
+
+    Mirrors ``Subscription.event_types`` so broadcast routing is an index
+    lookup instead of a scan over the JSON column.
+    """
+    __tablename__ = "subscription_event_types"
+
+    subscription_id = Column(GUID(), ForeignKey("subscriptions.id", ondelete="CASCADE"), primary_key=True)
+    event_type = Column(String, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_subscription_event_types_event_type", "event_type", "subscription_id"),
+    )
+
+class WebhookPayload(Base):
+    """Content-addressed payload store shared by every delivery of an event.
+
+    ``body`` holds the canonical JSON bytes, compressed per ``encoding`` for
+    large payloads. ``expires_at`` tracks the latest delivery referencing it.
+    """
+    __tablename__ = "webhook_payloads"
+
+    hash = Column(String(64), primary_key=True)  # SHA-256 of the canonical JSON bytes
+    encoding = Column(String(16), nullable=False, default="identity")
+    body = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)  # Uncompressed bytes
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    expires_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("ix_webhook_payloads_expires_at", "expires_at"),
+    )
 
 class WebhookDelivery(Base):
     __tablename__ = "webhook_deliveries"
     
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     subscription_id = Column(GUID(), ForeignKey("subscriptions.id"))
-    payload = Column(JSON, nullable=False)
+    # Inline payload of deliveries created before the payload store; newer rows reference it by hash
+    payload = Column(JSON, nullable=True)
+    payload_hash = Column(String(64), ForeignKey("webhook_payloads.hash"), nullable=True)
     status = Column(Enum(DeliveryStatus), default=DeliveryStatus.PENDING)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now(), primary_key=PARTITIONED)
     expires_at = Column(DateTime(timezone=True))
     attempts_count = Column(Integer, default=0)
 
     event_type = Column(String, nullable=True)
 
+    __table_args__ = (
+        # Keyset pagination of a subscription's / an event type's deliveries, newest first
+        Index("ix_webhook_deliveries_subscription_created", "subscription_id", "created_at", "id"),
+        Index("ix_webhook_deliveries_event_type_created", "event_type", "created_at", "id"),
+        # Retention cleanup scans deliveries created before the retention cutoff in chunks
+        Index("ix_webhook_deliveries_created_at", "created_at"),
+        # Payload cleanup checks that no delivery still references a payload
+        Index("ix_webhook_deliveries_payload_hash", "payload_hash"),
+        _partition_by("created_at"),
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
 class DeliveryAttempt(Base):
     __tablename__ = "delivery_attempts"
     
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    delivery_id = Column(GUID(), ForeignKey("webhook_deliveries.id"))
+    delivery_id = Column(GUID()) if PARTITIONED else Column(GUID(), ForeignKey("webhook_deliveries.id"))
     attempt_number = Column(Integer, nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), default=utcnow, server_default=func.now(), primary_key=PARTITIONED)
     status_code = Column(Integer, nullable=True)
     response = Column(Text, nullable=True)
     error = Column(Text, nullable=True)
     status = Column(Enum(AttemptStatus), nullable=False)
-    next_retry_at = Column(DateTime(timezone=True), nullable=True)
\ No newline at end of file
+    next_retry_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Timing and size of the HTTP exchange; null for attempts recorded before these existed
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    latency_ms = Column(Float, nullable=True)  # Request sent to response body prefix read
+    request_bytes = Column(Integer, nullable=True)
+    response_bytes = Column(Integer, nullable=True)  # Content-Length, or bytes read if the whole body fit
+
+    __table_args__ = (
+        # Attempts of a delivery in order, and the join from a subscription's deliveries
+        Index("ix_delivery_attempts_delivery_attempt", "delivery_id", "attempt_number"),
+        Index("ix_delivery_attempts_timestamp_id", "timestamp", "id"),
+        _partition_by("timestamp"),
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+class IngestIdempotencyKey(Base):
+    """Idempotency-Key -> deliveries created by the first ingest carrying it.
+
+    The primary key is the dedup index; it lives outside the (optionally partitioned)
+    deliveries table so uniqueness doesn't depend on the partition key.
+    """
+    __tablename__ = "ingest_idempotency_keys"
+
+    # Subscription id for single-subscription ingest, ALL_EVENT_TYPES for broadcast ingest
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    delivery_ids = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        # Expired keys are purged by the cleanup task
+        Index("ix_ingest_idempotency_keys_expires_at", "expires_at"),
+    )
+
+# Upper bounds (ms) of the latency histogram buckets in delivery_metrics; slower attempts land in latency_le_inf
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class DeliveryMetricsRollup(Base):
+    """Per-minute delivery attempt counters per subscription and event type.
+
+    Maintained incrementally as attempts are recorded (an upsert adding to the
+    counters), so analytics summaries read a handful of small rows instead of
+    scanning delivery_attempts. Latency is a fixed-bucket histogram
+    (``LATENCY_BUCKETS_MS``), from which percentiles are estimated.
+    """
+    __tablename__ = "delivery_metrics"
+
+    subscription_id = Column(GUID(), primary_key=True)
+    event_type = Column(String, primary_key=True)  # "" for deliveries without an event type
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # Start of the minute (UTC)
+
+    attempts = Column(Integer, nullable=False, default=0)
+    successes = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    status_2xx = Column(Integer, nullable=False, default=0)
+    status_3xx = Column(Integer, nullable=False, default=0)
+    status_4xx = Column(Integer, nullable=False, default=0)
+    status_5xx = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)  # Transport errors and timeouts, no status code
+
+    latency_count = Column(Integer, nullable=False, default=0)
+    latency_sum_ms = Column(Float, nullable=False, default=0)
+    latency_le_25 = Column(Integer, nullable=False, default=0)
+    latency_le_50 = Column(Integer, nullable=False, default=0)
+    latency_le_100 = Column(Integer, nullable=False, default=0)
+    latency_le_250 = Column(Integer, nullable=False, default=0)
+    latency_le_500 = Column(Integer, nullable=False, default=0)
+    latency_le_1000 = Column(Integer, nullable=False, default=0)
+    latency_le_2500 = Column(Integer, nullable=False, default=0)
+    latency_le_5000 = Column(Integer, nullable=False, default=0)
+    latency_le_10000 = Column(Integer, nullable=False, default=0)
+    latency_le_inf = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Time-range summaries across all subscriptions; retention cleanup
+        Index("ix_delivery_metrics_bucket", "bucket"),
+    )
@@ -0,0 +1,151 @@
+"""
+Optional time-based range partitioning of the delivery log tables (PostgreSQL only).
+
+With ``DB_PARTITIONING_ENABLED`` the models create ``webhook_deliveries`` and
+``delivery_attempts`` as partitioned parents (see ``app/db/models.py``). This
+module keeps a window of hourly or daily child partitions in place and applies
+retention by detaching and dropping whole partitions instead of deleting rows.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from app.config import settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Partitioned table -> partition key column
+PARTITIONED_TABLES = {
+    "webhook_deliveries": "created_at",
+    "delivery_attempts": "timestamp",
+}
+
+_INTERVALS = {
+    "hour": (timedelta(hours=1), "%Y%m%d%H"),
+    "day": (timedelta(days=1), "%Y%m%d"),
+}
+
+
+def is_enabled() -> bool:
+    return settings.DB_PARTITIONING_ENABLED and settings.DATABASE_URL.startswith("postgresql")
+
+
+def retention_cutoff(now: Optional[datetime] = None) -> datetime:
+    """
+    Oldest creation time still inside ``LOG_RETENTION_HOURS`` (UTC). Dropped
+    partitions and row-by-row cleanup both expire logs at this cutoff.
+    """
+    return (now or datetime.now(timezone.utc)) - timedelta(hours=settings.LOG_RETENTION_HOURS)
+
+
+def _interval():
+    return _INTERVALS[settings.DB_PARTITION_INTERVAL]
+
+
+def partition_start(moment: datetime) -> datetime:
+    """Truncate ``moment`` (UTC) to the start of its partition."""
+    moment = moment.astimezone(timezone.utc)
+    if settings.DB_PARTITION_INTERVAL == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start.strftime(_interval()[1])}"
+
+
+def parse_partition_start(table: str, name: str) -> Optional[datetime]:
+    """Start of a partition created by ``ensure_partitions``; None for anything else (e.g. the default)."""
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix):], _interval()[1]).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def expired_partitions(table: str, names: List[str], now: datetime) -> List[str]:
+    """Partitions whose whole range is older than the retention window."""
+    step = _interval()[0]
+    cutoff = retention_cutoff(now)
+    expired = []
+    for name in names:
+        start = parse_partition_start(table, name)
+        if start is not None and start + step <= cutoff:
+            expired.append(name)
+    return sorted(expired)
+
+
+def _child_partitions(conn, table: str) -> List[str]:
+    return list(conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table"
+    ), {"table": table}).scalars())
+
+
+def ensure_partitions(engine, now: Optional[datetime] = None) -> int:
+    """
+    Create the default partition plus one partition per interval from the start
+    of the retention window through ``DB_PARTITION_PREMAKE`` intervals ahead.
+    """
+    now = now or datetime.now(timezone.utc)
+    step = _interval()[0]
+    first = partition_start(retention_cutoff(now))
+    last = partition_start(now) + step * settings.DB_PARTITION_PREMAKE
+    created = 0
+
+    for table in PARTITIONED_TABLES:
+        with engine.begin() as conn:
+            existing = set(_child_partitions(conn, table))
+            # Rows outside every range land here instead of failing the insert
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+
+        start = first
+        while start <= last:
+            name = partition_name(table, start)
+            if name not in existing:
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text(
+                            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{(start + step).isoformat()}')"
+                        ))
+                    created += 1
+                except Exception as e:
+                    # Usually rows for this range already sit in the default partition
+                    logger.error(f"Failed to create partition {name}: {str(e)}")
+            start += step
+
+    if created:
+        logger.info(f"Created {created} log partitions")
+    return created
+
+
+def drop_expired_partitions(engine, now: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """Detach and drop partitions whose whole range is past retention."""
+    now = now or datetime.now(timezone.utc)
+    dropped = {}
+    for table in PARTITIONED_TABLES:
+        with engine.begin() as conn:
+            names = expired_partitions(table, _child_partitions(conn, table), now)
+        for name in names:
+            # One short transaction per partition; no row-by-row deletes
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+        if names:
+            logger.info(f"Dropped expired partitions of {table}: {', '.join(names)}")
+        dropped[table] = names
+    return dropped
+
+
+def maintain_partitions(engine) -> Dict:
+    """Premake upcoming partitions and drop expired ones."""
+    return {
+        "partitions_created": ensure_partitions(engine),
+        "partitions_dropped": drop_expired_partitions(engine),
+    }
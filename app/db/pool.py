@@ -0,0 +1,123 @@
+"""
+Connection pool policies per process role, plus pool metrics.
+
+Each process sizes its pool from ``DB_PROCESS_ROLE`` (``api``, ``worker`` or
+``beat``). With ``DB_EXTERNAL_POOLER`` the worker and beat processes hand every
+connection straight back to an external pooler such as PgBouncer (NullPool),
+and prepared statement caches are disabled so transaction pooling works.
+"""
+import threading
+import time
+from typing import Dict
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from app.config import settings
+
+ROLES = ("api", "worker", "beat")
+
+
+class PoolStats:
+    """Checkout wait-time counters for one pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+
+class _TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    # _do_get is where a checkout blocks when the pool and its overflow are exhausted
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _role() -> str:
+    role = settings.DB_PROCESS_ROLE.lower()
+    if role not in ROLES:
+        raise ValueError(f"DB_PROCESS_ROLE must be one of {', '.join(ROLES)}, got {settings.DB_PROCESS_ROLE!r}")
+    return role
+
+
+def engine_options(url, is_async: bool = False) -> Dict:
+    """``create_engine`` keyword arguments for this process's role."""
+    role = _role()
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    is_asyncpg = make_url(url).drivername == "postgresql+asyncpg"
+
+    if settings.DB_EXTERNAL_POOLER and is_asyncpg:
+        # Transaction pooling can hand each statement a different server connection
+        options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+
+    if settings.DB_EXTERNAL_POOLER and role != "api":
+        options["poolclass"] = NullPool
+        return options
+
+    pool_size = getattr(settings, f"DB_POOL_SIZE_{role.upper()}")
+    max_overflow = getattr(settings, f"DB_MAX_OVERFLOW_{role.upper()}")
+    if role == "worker":
+        # Every worker thread can hold a connection; never make one wait on the pool for it
+        max_overflow = max(max_overflow, settings.WORKER_CONCURRENCY - pool_size)
+
+    options.update({
+        "poolclass": TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    })
+    return options
+
+
+def pool_status(engine) -> Dict:
+    """Current size, checked-out and overflow counts plus wait-time counters for an engine's pool."""
+    pool = getattr(engine, "sync_engine", engine).pool
+    status = {"role": settings.DB_PROCESS_ROLE, "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    if isinstance(pool, _TimedPoolMixin):
+        status.update(pool.stats.as_dict())
+    return status
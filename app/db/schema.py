@@ -0,0 +1,82 @@
+"""
+Schema setup run once when the API starts, not on import.
+
+``create_all`` only creates missing tables, so this also adds columns and
+indexes introduced since existing tables were created, creates the log table
+partitions and backfills the event type routing table. On PostgreSQL the
+steps run under an advisory lock, so API processes starting side by side
+apply them one at a time instead of racing on the same DDL.
+
+Run it on its own (e.g. before a deploy) with ``python -m app.db.schema``.
+"""
+import logging
+from contextlib import contextmanager
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+from app.db.base import Base
+from app.db.crud import backfill_subscription_event_types
+from app.db import models, partitions  # noqa: F401 (models registers the tables)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key shared by every process that upgrades the schema
+SCHEMA_LOCK_ID = 0x77656268  # "webh"
+
+
+@contextmanager
+def _schema_lock(engine):
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": SCHEMA_LOCK_ID})
+
+
+def _add_missing_columns(engine):
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                    ))
+                elif column.nullable and not existing[column.name]["nullable"] and engine.dialect.name != "sqlite":
+                    # e.g. webhook_deliveries.payload, now optional with the payload store
+                    conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL"))
+
+
+def upgrade_schema(engine):
+    """Bring the database up to the models; safe to run repeatedly and from several processes."""
+    with _schema_lock(engine):
+        Base.metadata.create_all(bind=engine)
+        _add_missing_columns(engine)
+
+        # create_all only creates indexes along with new tables, so add any missing ones to existing tables
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+
+        # Partitioned log tables need child partitions before the first insert
+        if partitions.is_enabled():
+            partitions.ensure_partitions(engine)
+
+        # Populate the event type routing table for subscriptions created before it existed
+        with Session(engine) as db:
+            backfilled = backfill_subscription_event_types(db)
+    logger.info(f"Database schema is up to date ({backfilled} subscriptions backfilled)")
+
+
+if __name__ == "__main__":
+    from app.db.base import engine
+
+    logging.basicConfig(level=logging.INFO)
+    upgrade_schema(engine)
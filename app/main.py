@@ -1,13 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 
 from app.api.router import router
-from app.db.base import Base, engine
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from app.db.base import engine, async_engine, SessionLocal
+from app.db.schema import upgrade_schema
+from app.core.routing import start_router_listener
+from app.core.ingest_buffer import IngestFlusher
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.tasks.delivery import enqueue_deliveries
+from app.config import settings
 
 app = FastAPI(
     title="Webhook Delivery Service",
@@ -24,6 +27,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency by handler for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # API routes
 app.include_router(router, prefix="/api")
 
@@ -31,6 +37,41 @@ app.include_router(router, prefix="/api")
 if os.path.exists("app/static"):
     app.mount("/app", StaticFiles(directory="app/static", html=True), name="static")
 
+@app.on_event("startup")
+def prepare_database():
+    # Before the other startup hooks, which read the tables; serialized across processes
+    upgrade_schema(engine)
+
+@app.on_event("startup")
+def start_subscription_router():
+    # Load the in-process subscription router and follow changes over Redis pub/sub
+    if settings.SUBSCRIPTION_ROUTER_ENABLED:
+        app.state.router_stop = start_router_listener(SessionLocal)
+
+@app.on_event("shutdown")
+def stop_subscription_router():
+    if getattr(app.state, "router_stop", None):
+        app.state.router_stop.set()
+
+@app.on_event("startup")
+def start_ingest_flusher():
+    # Persist events accepted into the Redis Stream ingest buffer
+    if settings.INGEST_BUFFER_ENABLED:
+        app.state.ingest_flusher = IngestFlusher(SessionLocal, enqueue_deliveries)
+        app.state.ingest_flusher.start()
+
+@app.on_event("shutdown")
+def stop_ingest_flusher():
+    # Runs after uvicorn stops accepting requests, so nothing new is buffered while draining
+    if getattr(app.state, "ingest_flusher", None):
+        app.state.ingest_flusher.stop()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Sync handler: multiprocess mode reads every process's metric files from disk
+    body, content_type = render_metrics({"async": async_engine, "sync": engine})
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Webhook Delivery Service API"}
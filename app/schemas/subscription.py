@@ -1,4 +1,4 @@
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl
 from typing import Optional
 from uuid import UUID
 from datetime import datetime
@@ -7,13 +7,21 @@ class SubscriptionBase(BaseModel):
     name: str
     target_url: HttpUrl
     secret_key: Optional[str] = None
+    # Deliveries per second to this subscription, with bursts up to rate_limit_burst
+    rate_limit_per_second: Optional[float] = Field(None, gt=0)
+    rate_limit_burst: Optional[int] = Field(None, ge=1)
+    # Deliveries per turn under fair scheduling (FAIR_DEFAULT_WEIGHT when unset)
+    delivery_weight: Optional[int] = Field(None, ge=1, le=1000)
 
      # Method to convert HttpUrl to a string for database storage
     def to_dict(self):
         return {
             "name": self.name,
             "target_url": str(self.target_url),  # Convert HttpUrl to string
-            "secret_key": self.secret_key
+            "secret_key": self.secret_key,
+            "rate_limit_per_second": self.rate_limit_per_second,
+            "rate_limit_burst": self.rate_limit_burst,
+            "delivery_weight": self.delivery_weight
         }
 
 class SubscriptionCreate(SubscriptionBase):
@@ -24,6 +32,9 @@ class SubscriptionUpdate(BaseModel):
     target_url: Optional[HttpUrl] = None
     secret_key: Optional[str] = None
     is_active: Optional[bool] = None
+    rate_limit_per_second: Optional[float] = Field(None, gt=0)
+    rate_limit_burst: Optional[int] = Field(None, ge=1)
+    delivery_weight: Optional[int] = Field(None, ge=1, le=1000)
 
 
     # Method to convert HttpUrl to string for database storage
@@ -17,6 +17,11 @@ class AttemptStatus(str, Enum):
 class WebhookPayload(BaseModel):
     payload: Dict[str, Any]
 
+class BatchIngestItem(BaseModel):
+    event_type: Optional[str] = None
+    payload: Dict[str, Any]
+    subscription_id: Optional[UUID] = None
+
 class DeliveryResponse(BaseModel):
     id: UUID
     subscription_id: UUID
@@ -37,6 +42,11 @@ class DeliveryAttemptResponse(BaseModel):
     error: Optional[str] = None
     status: AttemptStatus
     next_retry_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    latency_ms: Optional[float] = None
+    request_bytes: Optional[int] = None
+    response_bytes: Optional[int] = None
 
     class Config:
         from_attributes = True
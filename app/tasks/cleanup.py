@@ -1,13 +1,21 @@
 from app.tasks.worker import celery_app
-from app.db.base import SessionLocal
+from app.db.base import SessionLocal, engine
 from app.db.crud import cleanup_old_logs
+from app.db import partitions
+
+@celery_app.task(bind=True, name="app.tasks.cleanup.cleanup_old_logs")
+def cleanup_old_logs_task(self):
+    """Clean up old webhook delivery logs in short chunked transactions."""
+    # With partitioned log tables, retention drops whole partitions; the row-based pass
+    # below then only has the default partition's stragglers left to delete
+    partition_stats = partitions.maintain_partitions(engine) if partitions.is_enabled() else {}
 
-@celery_app.task(name="app.tasks.cleanup.cleanup_old_logs")
-def cleanup_old_logs_task():
-    """Clean up old webhook delivery logs."""
     db = SessionLocal()
     try:
-        cleanup_old_logs(db)
-        return {"status": "success", "message": "Cleaned up old logs"}
+        stats = cleanup_old_logs(db)
+        if not stats["complete"]:
+            # Out of time before every pass finished; continue with the remaining expired rows
+            self.apply_async()
+        return {"status": "success", "message": "Cleaned up old logs", **partition_stats, **stats}
     finally:
         db.close()
\ No newline at end of file
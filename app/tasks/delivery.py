@@ -1,17 +1,30 @@
-import json
-import httpx
+import math
+import uuid
 import hmac
 import hashlib
+from collections import Counter
 from datetime import datetime, timedelta
+from celery import group
+from celery.exceptions import Retry
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown
 from app.tasks.worker import celery_app
 from app.db.base import SessionLocal
 from app.db.crud import (
     get_subscription, get_webhook_delivery, 
     update_delivery_status, create_delivery_attempt,
+    claim_deliveries, record_delivery_results,
+    get_delivery_payload, load_payloads, get_delivery_subscription_ids,
 )
-from app.db.models import DeliveryStatus, AttemptStatus, WebhookDelivery
+from app.db.models import DeliveryStatus, AttemptStatus, WebhookDelivery, utcnow
 from app.config import settings
-import time
+from app.core.cache import get_subscription_for_delivery, start_local_cache_invalidation
+from app.core.http import delivery_engine, is_receiver_failure, attempt_fields
+from app.core.circuit_breaker import host_for, check_circuit, record_outcome
+from app.core.rate_limit import subscription_limit, acquire, penalize, deferral_delays, retry_after_seconds
+from app.core.retries import schedule_retry, schedule_retries
+from app.core.fair_queue import push_deliveries, take_deliveries, complete_deliveries, delivery_id as fair_delivery_id
+from app.core.metrics import DELIVERY_RETRIES, record_attempt
+from redis.exceptions import RedisError
 from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
@@ -21,16 +34,52 @@ def calculate_backoff_delay(attempt_number: int) -> int:
     base_delays = [10, 30, 60, 300, 900]
     return base_delays[min(attempt_number - 1, len(base_delays) - 1)]
 
-def generate_signature(payload: dict, secret: str) -> str:
-    """Generate HMAC signature for webhook payload."""
-    payload_str = json.dumps(payload, sort_keys=True)
+def generate_signature(body: bytes, secret: str) -> str:
+    """HMAC-SHA256 of the exact body bytes that are sent, so receivers can verify the raw request body."""
     return hmac.new(
         secret.encode(),
-        payload_str.encode(),
+        body,
         hashlib.sha256
     ).hexdigest()
 
-@celery_app.task(bind=True, name="app.tasks.delivery.process_webhook", max_retries=5)
+def retry_delay(attempt_number: int, response=None) -> int:
+    """Backoff before the next attempt, stretched to a receiver's Retry-After."""
+    delay = calculate_backoff_delay(attempt_number)
+    retry_after = retry_after_seconds(response) if response is not None else None
+    return max(delay, math.ceil(retry_after)) if retry_after else delay
+
+def build_delivery_headers(body: bytes, secret_key: str = None) -> dict:
+    """Headers sent with every delivery, signed when the subscription has a secret."""
+    headers = {"Content-Type": "application/json"}
+    if secret_key:
+        headers["X-Webhook-Signature"] = generate_signature(body, secret_key)
+    return headers
+
+# Prefork children run tasks themselves (worker_process_init); the threads pool runs
+# them in the main worker process (worker_ready)
+@worker_process_init.connect
+@worker_ready.connect
+def start_subscription_cache_invalidation(**kwargs):
+    # Every process with a local cache tier needs its own listener
+    start_local_cache_invalidation()
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_delivery_engine(**kwargs):
+    delivery_engine.close()
+
+class DeliveryTask(celery_app.Task):
+    """Base task for deliveries that hands retries to the retry scheduler."""
+
+    def _schedule_retry(self, delivery_id: str, delay: int, reason: str = "failed", **result):
+        # Due retries live in a Redis sorted set that the beat-driven scheduler drains,
+        # instead of countdown tasks held by workers. Fall back to a countdown if Redis is down.
+        DELIVERY_RETRIES.labels(reason).inc()
+        if not schedule_retry(delivery_id, delay):
+            self.retry(countdown=delay)
+        return {"status": "retry_scheduled", "retry_in": delay, **result}
+
+@celery_app.task(bind=True, base=DeliveryTask, name="app.tasks.delivery.process_webhook", max_retries=5)
 def process_webhook(self, delivery_id: str):
     """Process webhook delivery with proper attempt tracking and retries."""
     db = SessionLocal()
@@ -46,49 +95,87 @@ def process_webhook(self, delivery_id: str):
             self.retry(countdown=60, max_retries=3)
             return {"status": "error", "message": "Delivery not found"}
 
+        # A retry can be enqueued more than once (at-least-once scheduler); don't resend finished deliveries
+        if delivery.status in (DeliveryStatus.DELIVERED, DeliveryStatus.FAILED):
+            return {"status": "skipped", "message": f"Delivery already {delivery.status.value}"}
+
+        # Get subscription details from the local/Redis cache, falling back to the DB
+        subscription = get_subscription_for_delivery(
+            delivery.subscription_id,
+            lambda: get_subscription(db, delivery.subscription_id)
+        )
+        if not subscription or not subscription["is_active"]:
+            # Finalize it; nothing would ever pick the delivery up again
+            delivery.status = DeliveryStatus.FAILED
+            db.commit()
+            message = "Subscription not found" if not subscription else "Subscription is not active"
+            return {"status": "error", "message": message}
+
+        # While the receiver's circuit is open, defer without sending or spending an attempt
+        host = host_for(subscription["target_url"])
+        defer_for = check_circuit(host)
+        if defer_for:
+            db.commit()  # Release the row lock
+            return self._schedule_retry(
+                delivery_id, defer_for, reason="circuit_open", status="deferred", message=f"Circuit open for {host}"
+            )
+
+        # Over the subscription's rate limit: defer until its next token, again without spending an attempt
+        limit = subscription_limit(subscription)
+        if limit:
+            granted, wait = acquire(delivery.subscription_id, *limit)
+            if not granted:
+                db.commit()  # Release the row lock
+                return self._schedule_retry(
+                    delivery_id, max(1, math.ceil(wait)), reason="rate_limited",
+                    status="deferred", message="Subscription rate limit reached"
+                )
+
         # Increment attempt count at start
         delivery.attempts_count += 1
         db.commit()
         db.refresh(delivery)
 
-        # Get subscription details (with caching in production)
-        subscription = get_subscription(db, delivery.subscription_id)
-        if not subscription:
-            return {"status": "error", "message": "Subscription not found"}
-
         # Prepare delivery attempt
         attempt_data = {
             "delivery_id": delivery_id,
             "attempt_number": delivery.attempts_count,
-            "started_at": datetime.utcnow()
         }
 
         # Prepare headers
-        headers = {"Content-Type": "application/json"}
-        if subscription.secret_key:
-            headers["X-Webhook-Signature"] = generate_signature(
-                delivery.payload, 
-                subscription.secret_key
-            )
+        body = get_delivery_payload(db, delivery)
+        headers = build_delivery_headers(body, subscription["secret_key"])
+        # Persisted on the attempt: started_at, completed_at, latency_ms, request_bytes, response_bytes
+        timing = {"started_at": utcnow(), "request_bytes": len(body)}
+
+        # Give the connection back to the pool while the receiver answers; the session
+        # checks out a new one to record the outcome. Worker threads outnumber connections.
+        db.close()
 
         # Execute delivery
         try:
-            start_time = time.monotonic()
-            response = httpx.post(
-                subscription.target_url,
-                json=delivery.payload,
+            # Pooled keep-alive connection from the shared async client
+            response = delivery_engine.send(
+                subscription["target_url"],
+                content=body,
                 headers=headers,
                 timeout=settings.WEBHOOK_TIMEOUT
             )
-            duration = time.monotonic() - start_time
+            record_outcome(host, not is_receiver_failure(response))
+            record_attempt(response.status_code, response.is_success)
+            if response.status_code == 429 and limit:
+                # The receiver's own limit wins: hold every worker's deliveries to it until Retry-After
+                retry_after = retry_after_seconds(response)
+                if retry_after:
+                    penalize(delivery.subscription_id, retry_after, *limit)
 
+            fields = attempt_fields(response)
             attempt_data.update({
                 "status": AttemptStatus.SUCCESS if response.is_success else AttemptStatus.FAILED,
-                "status_code": response.status_code,
-                "response": response.text[:1000],
-                "duration": duration,
-                "completed_at": datetime.utcnow()
+                "status_code": fields.pop("status_code"),
+                "response": fields.pop("response"),
             })
+            timing.update(fields)
 
             if response.is_success:
                 update_delivery_status(db, delivery_id, DeliveryStatus.DELIVERED)
@@ -99,13 +186,15 @@ def process_webhook(self, delivery_id: str):
                     status=attempt_data["status"],
                     status_code=attempt_data.get("status_code"),
                     response=attempt_data.get("response"),
-                    next_retry_at=attempt_data.get("next_retry_at")
+                    next_retry_at=attempt_data.get("next_retry_at"),
+                    delivery=delivery,
+                    **timing
                 )
                 return {"status": "success", "status_code": response.status_code}
 
             # Handle failed delivery with retry
             if delivery.attempts_count < settings.MAX_RETRY_ATTEMPTS:
-                delay = calculate_backoff_delay(delivery.attempts_count)
+                delay = retry_delay(delivery.attempts_count, response)
                 attempt_data["next_retry_at"] = datetime.utcnow() + timedelta(seconds=delay)
 
                 create_delivery_attempt(
@@ -115,10 +204,12 @@ def process_webhook(self, delivery_id: str):
                     status=attempt_data["status"],
                     status_code=attempt_data.get("status_code"),
                     response=attempt_data.get("response"),
-                    next_retry_at=attempt_data.get("next_retry_at")
+                    next_retry_at=attempt_data.get("next_retry_at"),
+                    delivery=delivery,
+                    **timing
                 )
 
-                self.retry(countdown=delay)
+                return self._schedule_retry(delivery_id, delay, status_code=response.status_code)
 
             # Final creation if not retrying
             create_delivery_attempt(
@@ -128,18 +219,29 @@ def process_webhook(self, delivery_id: str):
                 status=attempt_data["status"],
                 status_code=attempt_data.get("status_code"),
                 response=attempt_data.get("response"),
-                next_retry_at=attempt_data.get("next_retry_at")
+                next_retry_at=attempt_data.get("next_retry_at"),
+                delivery=delivery,
+                **timing
             )
+            update_delivery_status(db, delivery_id, DeliveryStatus.FAILED)
             return {"status": "error", "status_code": response.status_code}
 
-
+        except Retry:
+            # Countdown fallback from _schedule_retry; the attempt is already recorded
+            raise
         except Exception as e:
             # Handle delivery exceptions
+            record_outcome(host, False)
+            record_attempt(None, False)
             attempt_data.update({
                 "status": AttemptStatus.FAILED,
                 "error": str(e)[:1000],
-                "completed_at": datetime.utcnow()
             })
+            timing["completed_at"] = utcnow()
+
+            if delivery.attempts_count < settings.MAX_RETRY_ATTEMPTS:
+                delay = calculate_backoff_delay(delivery.attempts_count)
+                attempt_data["next_retry_at"] = datetime.utcnow() + timedelta(seconds=delay)
 
             # Log the attempt before retrying
             create_delivery_attempt(
@@ -148,15 +250,14 @@ def process_webhook(self, delivery_id: str):
                 attempt_number=attempt_data["attempt_number"],
                 status=attempt_data["status"],
                 error=attempt_data.get("error"),
-                next_retry_at=attempt_data.get("next_retry_at")
+                next_retry_at=attempt_data.get("next_retry_at"),
+                delivery=delivery,
+                **timing
             )
 
             if delivery.attempts_count < settings.MAX_RETRY_ATTEMPTS:
-                delay = calculate_backoff_delay(delivery.attempts_count)
-                attempt_data["next_retry_at"] = datetime.utcnow() + timedelta(seconds=delay)
-                
                 # Retry after the specified delay
-                self.retry(countdown=delay)
+                return self._schedule_retry(delivery_id, delay, message=str(e))
 
             # Final creation if not retrying
             if delivery.attempts_count >= settings.MAX_RETRY_ATTEMPTS:
@@ -170,6 +271,234 @@ def process_webhook(self, delivery_id: str):
     finally:
         db.close()
 
+def enqueue_deliveries(delivery_ids: list, subscription_ids: list = None):
+    """Publish delivery tasks for ``delivery_ids`` as a single batch.
+
+    A Celery group reuses one producer connection for every message instead
+    of acquiring a connection per ``.delay()`` call. In batch mode the ids are
+    split into ``DELIVERY_BATCH_SIZE`` chunks, one process_webhook_batch task each.
+
+    With fair scheduling the ids go to per-subscription queues instead
+    (``subscription_ids`` in the same order, looked up when not given) and
+    the tasks take deliveries round-robin. If Redis can't take them they are
+    published directly.
+    """
+    if not delivery_ids:
+        return None
+    delivery_ids = [str(delivery_id) for delivery_id in delivery_ids]
+    if settings.FAIR_SCHEDULING_ENABLED:
+        if subscription_ids is None:
+            with SessionLocal() as db:
+                owners = get_delivery_subscription_ids(db, [uuid.UUID(delivery_id) for delivery_id in delivery_ids])
+            subscription_ids = [owners.get(uuid.UUID(delivery_id)) for delivery_id in delivery_ids]
+        pairs = [(sub_id, delivery_id) for sub_id, delivery_id in zip(subscription_ids, delivery_ids) if sub_id]
+        if push_deliveries(pairs):
+            return publish_fair_tokens(len(pairs))
+    if settings.DELIVERY_BATCH_MODE:
+        size = settings.DELIVERY_BATCH_SIZE
+        return group(
+            process_webhook_batch.s(delivery_ids[i:i + size]) for i in range(0, len(delivery_ids), size)
+        ).apply_async()
+    return group(process_webhook.s(delivery_id) for delivery_id in delivery_ids).apply_async()
+
+def publish_fair_tokens(count: int):
+    """One task per ``count`` fairly queued deliveries (per DELIVERY_BATCH_SIZE in batch mode)."""
+    if not count:
+        return None
+    if settings.DELIVERY_BATCH_MODE:
+        return group(
+            process_next_webhook_batch.s() for _ in range(0, count, settings.DELIVERY_BATCH_SIZE)
+        ).apply_async()
+    return group(process_next_webhook.s() for _ in range(count)).apply_async()
+
+@celery_app.task(bind=True, name="app.tasks.delivery.process_next_webhook")
+def process_next_webhook(self):
+    """Deliver whichever fairly queued delivery is next in the round-robin."""
+    try:
+        entries = take_deliveries(1)
+    except RedisError as e:
+        raise self.retry(exc=e, countdown=5, max_retries=None)
+    if not entries:
+        return {"status": "idle"}
+    result = process_webhook(fair_delivery_id(entries[0]))
+    # Only finished deliveries leave the in-flight set; anything else is reclaimed later
+    complete_deliveries(entries)
+    return result
+
+@celery_app.task(bind=True, name="app.tasks.delivery.process_next_webhook_batch")
+def process_next_webhook_batch(self):
+    """Deliver the next DELIVERY_BATCH_SIZE fairly queued deliveries as one batch."""
+    try:
+        entries = take_deliveries(settings.DELIVERY_BATCH_SIZE)
+    except RedisError as e:
+        raise self.retry(exc=e, countdown=5, max_retries=None)
+    if not entries:
+        return {"status": "idle"}
+    result = process_webhook_batch([fair_delivery_id(entry) for entry in entries])
+    complete_deliveries(entries)
+    return result
+
+@celery_app.task(bind=True, name="app.tasks.delivery.process_webhook_batch")
+def process_webhook_batch(self, delivery_ids: list):
+    """
+    Deliver a batch of webhooks concurrently and record the results with
+    one bulk INSERT of attempts and one bulk UPDATE of delivery statuses.
+    """
+    db = SessionLocal()
+    try:
+        deliveries = claim_deliveries(db, delivery_ids)
+        # One query for the batch's distinct stored payloads (usually one per fan-out)
+        payloads = load_payloads(db, [delivery.payload_hash for delivery in deliveries if delivery.payload_hash])
+        signed_headers = {}
+
+        requests = []
+        sent = []
+        statuses = []
+        deferred = []
+        circuits = {}
+        # One token bucket call per rate-limited subscription, for all of its deliveries in the batch
+        batch_counts = Counter(delivery.subscription_id for delivery in deliveries)
+        limits = {}
+        buckets = {}
+        for delivery in deliveries:
+            subscription = get_subscription_for_delivery(
+                delivery.subscription_id,
+                lambda: get_subscription(db, delivery.subscription_id)
+            )
+            if not subscription or not subscription["is_active"]:
+                # Nothing to send it to, as in process_webhook; nothing was sent, so give back the attempt
+                statuses.append({
+                    "id": delivery.id,
+                    "status": DeliveryStatus.FAILED,
+                    "attempts_count": delivery.attempts_count - 1
+                })
+                continue
+
+            # Defer deliveries to open circuits without sending; give back the claimed attempt
+            # Only open circuits are remembered for the batch: a half-open circuit admits one
+            # probe per check, so every other delivery to that host is checked (and deferred) too
+            host = host_for(subscription["target_url"])
+            defer_for, reason = circuits.get(host) or check_circuit(host), "circuit_open"
+            if defer_for:
+                circuits[host] = defer_for
+            if not defer_for:
+                limit = limits[delivery.subscription_id] = subscription_limit(subscription)
+                if limit:
+                    if delivery.subscription_id not in buckets:
+                        count = batch_counts[delivery.subscription_id]
+                        granted, wait = acquire(delivery.subscription_id, *limit, count=count)
+                        buckets[delivery.subscription_id] = iter(deferral_delays(granted, wait, limit[0], count))
+                    defer_for, reason = next(buckets[delivery.subscription_id]), "rate_limited"
+            if defer_for:
+                statuses.append({
+                    "id": delivery.id,
+                    "status": DeliveryStatus.PENDING,
+                    "attempts_count": delivery.attempts_count - 1
+                })
+                deferred.append((str(delivery.id), defer_for, reason))
+                continue
+
+            # Rows from before the payload store keep their payload inline
+            body = payloads.get(delivery.payload_hash) or get_delivery_payload(db, delivery)
+            # Sign each (body, secret) pair once per batch
+            signature_key = (delivery.payload_hash or delivery.id, subscription["secret_key"])
+            if signature_key not in signed_headers:
+                signed_headers[signature_key] = build_delivery_headers(body, subscription["secret_key"])
+            requests.append({
+                "url": subscription["target_url"],
+                "content": body,
+                "headers": signed_headers[signature_key],
+                "timeout": settings.WEBHOOK_TIMEOUT,
+            })
+            sent.append(delivery)
+
+        responses = delivery_engine.send_many(requests) if requests else []
+
+        attempts = []
+        rollups = []
+        retries = {}
+        penalized = set()
+        for delivery, request, response in zip(sent, requests, responses):
+            if isinstance(response, Exception):
+                record_outcome(host_for(request["url"]), False)
+            else:
+                record_outcome(host_for(request["url"]), not is_receiver_failure(response))
+                limit = limits.get(delivery.subscription_id)
+                if response.status_code == 429 and limit and delivery.subscription_id not in penalized:
+                    retry_after = retry_after_seconds(response)
+                    if retry_after:
+                        penalize(delivery.subscription_id, retry_after, *limit)
+                        penalized.add(delivery.subscription_id)
+
+            attempt = {
+                "id": uuid.uuid4(),
+                "delivery_id": delivery.id,
+                "attempt_number": delivery.attempts_count,
+                "status_code": None,
+                "response": None,
+                "error": None,
+                "next_retry_at": None,
+                "started_at": None,
+                "completed_at": None,
+                "latency_ms": None,
+                "request_bytes": len(request["content"]),
+                "response_bytes": None,
+            }
+            if isinstance(response, Exception):
+                attempt.update(status=AttemptStatus.FAILED, error=str(response)[:1000])
+            else:
+                attempt.update(
+                    status=AttemptStatus.SUCCESS if response.is_success else AttemptStatus.FAILED,
+                    **attempt_fields(response)
+                )
+
+            if attempt["status"] == AttemptStatus.SUCCESS:
+                status = DeliveryStatus.DELIVERED
+            elif delivery.attempts_count < settings.MAX_RETRY_ATTEMPTS:
+                delay = retry_delay(delivery.attempts_count, None if isinstance(response, Exception) else response)
+                attempt["next_retry_at"] = datetime.utcnow() + timedelta(seconds=delay)
+                retries.setdefault(delay, []).append(str(delivery.id))
+                status = DeliveryStatus.PENDING
+            else:
+                status = DeliveryStatus.FAILED
+
+            attempts.append(attempt)
+            statuses.append({"id": delivery.id, "status": status})
+            record_attempt(attempt["status_code"], attempt["status"] == AttemptStatus.SUCCESS)
+            rollups.append({
+                "subscription_id": delivery.subscription_id,
+                "event_type": delivery.event_type,
+                "status": attempt["status"],
+                "status_code": attempt["status_code"],
+                "latency": attempt["latency_ms"] / 1000 if attempt["latency_ms"] is not None else None,
+            })
+
+        record_delivery_results(db, attempts, statuses, rollups)
+
+        DELIVERY_RETRIES.labels("failed").inc(sum(len(ids) for ids in retries.values()))
+        for delivery_id, delay, reason in deferred:
+            DELIVERY_RETRIES.labels(reason).inc()
+            retries.setdefault(delay, []).append(delivery_id)
+
+        # Hand retries to the retry scheduler in one round trip; fall back to
+        # countdown tasks (one per shared backoff delay) if Redis is unavailable
+        if not schedule_retries((delivery_id, delay) for delay, ids in retries.items() for delivery_id in ids):
+            for delay, retry_ids in retries.items():
+                process_webhook_batch.apply_async((retry_ids,), countdown=delay)
+
+        return {
+            "status": "success",
+            "delivered": sum(1 for item in statuses if item["status"] == DeliveryStatus.DELIVERED),
+            "retrying": sum(len(ids) for ids in retries.values()) - len(deferred),
+            "deferred": len(deferred),
+            "failed": sum(1 for item in statuses if item["status"] == DeliveryStatus.FAILED),
+        }
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 @celery_app.task(bind=True, name="app.tasks.delivery.retry_webhook_delivery", max_retries=5)
 def retry_webhook_delivery(self, delivery_id: str):
     """Retry a failed webhook delivery."""
@@ -0,0 +1,41 @@
+import time
+from app.tasks.worker import celery_app
+from app.tasks.delivery import enqueue_deliveries, publish_fair_tokens
+from app.core.retries import get_due_retries, remove_retries
+from app.core.fair_queue import reclaim_stalled, weights_loaded, load_subscription_weights
+from app.db.base import SessionLocal
+from app.db.crud import get_subscription_weights
+from app.config import settings
+
+@celery_app.task(name="app.tasks.scheduler.enqueue_due_retries")
+def enqueue_due_retries():
+    """Move due retries from the Redis retry schedule onto the delivery queue in bulk."""
+    enqueued = 0
+    while enqueued < settings.RETRY_SCHEDULER_MAX_PER_RUN:
+        now = time.time()
+        delivery_ids = get_due_retries(settings.RETRY_SCHEDULER_BATCH_SIZE, now)
+        if not delivery_ids:
+            break
+
+        # Enqueue before removing: a crash in between re-sends a retry rather than losing it.
+        # Only entries still due at ``now`` are removed, so a retry a worker scheduled
+        # after the enqueue survives.
+        enqueue_deliveries(delivery_ids)
+        remove_retries(delivery_ids, now)
+        enqueued += len(delivery_ids)
+
+        if len(delivery_ids) < settings.RETRY_SCHEDULER_BATCH_SIZE:
+            break
+
+    return {"status": "success", "enqueued": enqueued}
+
+@celery_app.task(name="app.tasks.scheduler.reclaim_fair_deliveries")
+def reclaim_fair_deliveries():
+    """Requeue fairly scheduled deliveries whose worker took them but never finished."""
+    # Weights exist only in Redis; put them back if it was flushed or failed over
+    if not weights_loaded():
+        with SessionLocal() as db:
+            load_subscription_weights(get_subscription_weights(db))
+    reclaimed = reclaim_stalled(settings.RETRY_SCHEDULER_BATCH_SIZE)
+    publish_fair_tokens(reclaimed)
+    return {"status": "success", "reclaimed": reclaimed}
@@ -1,9 +1,16 @@
 # app/tasks/worker.py
 
 from celery import Celery
-from celery.signals import after_setup_logger
+from celery.signals import after_setup_logger, before_task_publish, task_prerun, worker_ready, worker_process_shutdown
 from app.config import settings
+from app.db.base import engine
+from app.core.metrics import (
+    ENQUEUED_AT_HEADER, TASK_QUEUE_WAIT, mark_process_dead, start_worker_exporter
+)
 import logging
+import os
+import time
+from datetime import datetime
 
 # Initialize Celery application
 celery_app = Celery(
@@ -12,7 +19,8 @@ celery_app = Celery(
     backend=settings.REDIS_URL,
     include=[
         "app.tasks.delivery",
-        "app.tasks.cleanup"
+        "app.tasks.cleanup",
+        "app.tasks.scheduler"
     ]
 )
 
@@ -20,6 +28,7 @@ celery_app = Celery(
 celery_app.conf.task_routes = {
     "app.tasks.delivery.*": {"queue": "deliveries"},
     "app.tasks.cleanup.*": {"queue": "cleanup"},
+    "app.tasks.scheduler.*": {"queue": "scheduler"},
 }
 
 # Enhanced worker configuration
@@ -27,6 +36,7 @@ celery_app.conf.update(
     # Reliability settings
     task_acks_late=True,
     worker_prefetch_multiplier=1,
+    worker_concurrency=settings.WORKER_CONCURRENCY,  # The DB pool is sized from this too
     broker_connection_retry=True,
     broker_connection_retry_on_startup=True,
     broker_connection_max_retries=10,
@@ -60,8 +70,27 @@ celery_app.conf.beat_schedule = {
             "expires": 3600,
         }
     },
+    "enqueue-due-retries": {
+        "task": "app.tasks.scheduler.enqueue_due_retries",
+        "schedule": settings.RETRY_SCHEDULER_INTERVAL,
+        "options": {
+            "queue": "scheduler",
+            # Skip stale ticks instead of piling them up behind a slow run
+            "expires": settings.RETRY_SCHEDULER_INTERVAL,
+        }
+    },
 }
 
+if settings.FAIR_SCHEDULING_ENABLED:
+    celery_app.conf.beat_schedule["reclaim-fair-deliveries"] = {
+        "task": "app.tasks.scheduler.reclaim_fair_deliveries",
+        "schedule": settings.FAIR_RECLAIM_INTERVAL,
+        "options": {
+            "queue": "scheduler",
+            "expires": settings.FAIR_RECLAIM_INTERVAL,
+        }
+    }
+
 # Configure logging
 @after_setup_logger.connect
 def setup_loggers(logger, *args, **kwargs):
@@ -70,6 +99,31 @@ def setup_loggers(logger, *args, **kwargs):
     handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
     logger.addHandler(handler)
 
+# Metrics: stamp published tasks so the worker can time how long they sat in the queue
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    if headers is not None:
+        headers[ENQUEUED_AT_HEADER] = time.time()
+
+@task_prerun.connect
+def observe_queue_wait(task=None, **kwargs):
+    enqueued_at = task.request.get(ENQUEUED_AT_HEADER) if task else None
+    if not enqueued_at:
+        return
+    # Countdown tasks are meant to wait; count only the time past their ETA
+    eta = task.request.eta
+    if eta:
+        enqueued_at = max(enqueued_at, datetime.fromisoformat(eta).timestamp() if isinstance(eta, str) else eta.timestamp())
+    TASK_QUEUE_WAIT.labels(task.name).observe(max(time.time() - enqueued_at, 0))
+
+@worker_ready.connect
+def start_metrics_exporter(**kwargs):
+    start_worker_exporter({"sync": engine})
+
+@worker_process_shutdown.connect
+def remove_process_metrics(**kwargs):
+    mark_process_dead(os.getpid())
+
 # Final task discovery
 celery_app.autodiscover_tasks(["app.tasks"], force=True)
 
@@ -0,0 +1,148 @@
+"""
+Mock webhook receiver for benchmarks.
+
+Accepts deliveries on ``POST /hooks/{subscription}`` after a configurable
+latency, fails a fraction of them with 500, and can stream a large response
+body slowly to exercise the workers' bounded response read. Every successful
+delivery of a benchmark event (a payload carrying ``bench_seq`` and
+``sent_at``) is timed from the moment the load generator sent it, which gives
+end-to-end delivery latency without touching the service's database.
+
+Run it on its own with ``python -m benchmarks.receiver --port 9000``;
+``GET /stats`` returns what it has received and ``POST /reset`` clears it.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+@dataclass
+class ReceiverConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    slow_body_bytes: int = 0  # Response body size; 0 answers with a short JSON body
+    slow_body_ms: float = 0.0  # Time spent streaming it
+    seed: Optional[int] = None
+
+
+@dataclass
+class ReceiverStats:
+    received: int = 0
+    errors: int = 0
+    duplicates: int = 0
+    # (subscription, bench_seq) -> seconds from send to first successful delivery
+    delivered: Dict[Tuple[str, int], float] = field(default_factory=dict)
+    first_at: Optional[float] = None
+    last_at: Optional[float] = None
+
+    def record(self, subscription: str, payload: dict, now: float):
+        key = (subscription, payload["bench_seq"])
+        if key in self.delivered:
+            self.duplicates += 1
+            return
+        self.delivered[key] = now - payload["sent_at"]
+        self.first_at = now if self.first_at is None else self.first_at
+        self.last_at = now
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "errors": self.errors,
+            "duplicates": self.duplicates,
+            "delivered": len(self.delivered),
+            "first_at": self.first_at,
+            "last_at": self.last_at,
+            "latencies": list(self.delivered.values()),
+        }
+
+
+def create_receiver(config: ReceiverConfig) -> Starlette:
+    stats = ReceiverStats()
+    rng = random.Random(config.seed)
+
+    async def slow_body():
+        chunks = 16
+        size, remainder = divmod(config.slow_body_bytes, chunks)
+        for index in range(chunks):
+            await asyncio.sleep(config.slow_body_ms / 1000 / chunks)
+            yield b"x" * (size + (remainder if index == chunks - 1 else 0))
+
+    async def hook(request: Request) -> Response:
+        body = await request.body()
+        stats.received += 1
+        delay = config.latency_ms + (rng.uniform(-config.jitter_ms, config.jitter_ms) if config.jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if rng.random() < config.error_rate:
+            stats.errors += 1
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict) and "bench_seq" in payload and "sent_at" in payload:
+            stats.record(request.path_params["subscription"], payload, time.time())
+        if config.slow_body_bytes:
+            return StreamingResponse(slow_body(), media_type="text/plain")
+        return JSONResponse({"status": "ok"})
+
+    async def get_stats(request: Request) -> Response:
+        return JSONResponse(stats.as_dict())
+
+    async def reset(request: Request) -> Response:
+        stats.__init__()
+        return JSONResponse({"status": "reset"})
+
+    app = Starlette(routes=[
+        Route("/hooks/{subscription}", hook, methods=["POST"]),
+        Route("/stats", get_stats, methods=["GET"]),
+        Route("/reset", reset, methods=["POST"]),
+    ])
+    app.state.stats = stats
+    return app
+
+
+def add_receiver_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_argument_group("mock receiver")
+    group.add_argument("--latency-ms", type=float, default=0.0, help="Time before the receiver answers")
+    group.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter around --latency-ms")
+    group.add_argument("--error-rate", type=float, default=0.0, help="Fraction of deliveries answered with 500")
+    group.add_argument("--slow-body-bytes", type=int, default=0, help="Stream a response body of this size")
+    group.add_argument("--slow-body-ms", type=float, default=0.0, help="Time taken to stream that body")
+    group.add_argument("--seed", type=int, default=None)
+
+
+def receiver_config(args: argparse.Namespace) -> ReceiverConfig:
+    return ReceiverConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        slow_body_bytes=args.slow_body_bytes,
+        slow_body_ms=args.slow_body_ms,
+        seed=args.seed,
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock webhook receiver for benchmarks")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    add_receiver_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(create_receiver(receiver_config(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
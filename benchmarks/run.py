@@ -0,0 +1,326 @@
+"""
+Ingest and delivery benchmark.
+
+Starts the mock receiver, creates benchmark subscriptions pointing at it,
+drives one of the ingest scenarios at a fixed concurrency and waits until the
+receiver has seen every delivery. Reports ingest throughput, p50/p99 ingest
+latency (request sent to 202) and end-to-end delivery latency (request sent to
+first successful delivery, retries included).
+
+Scenarios:
+
+- ``ingest``: ``POST /api/webhooks/ingest/{subscription_id}``, round-robin over
+  the subscriptions; one delivery per request.
+- ``fanout``: ``POST /api/webhooks/ingest?event_type=...``; one delivery per
+  subscription per request.
+
+Against a running stack (docker compose, with the receiver reachable from the
+workers through ``--receiver-url``)::
+
+    python -m benchmarks.run --scenario fanout --subscriptions 20 --requests 2000
+
+Or let it start the API, a worker and beat locally against SQLite or Postgres
+and a local Redis::
+
+    python -m benchmarks.run --spawn --database-url postgresql://... --env DELIVERY_BATCH_MODE=true
+
+``--output`` saves the results as JSON; ``--baseline`` compares against a saved
+run and exits non-zero when throughput or p99 latency regress by more than
+``--max-regression``.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence
+import httpx
+from benchmarks.receiver import add_receiver_arguments, create_receiver, receiver_config
+
+SCENARIOS = ("ingest", "fanout")
+
+# Result keys compared against a baseline: higher is better for throughput, lower for latency
+THROUGHPUT_KEYS = ("ingest_rps", "delivery_rps")
+LATENCY_KEYS = ("ingest_p99_ms", "e2e_p99_ms")
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """Linearly interpolated percentile of ``values``, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    lower = math.floor(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def summarize_run(
+    scenario: str,
+    ingest_latencies: List[float],
+    ingest_errors: int,
+    load_seconds: float,
+    expected_deliveries: int,
+    receiver: dict,
+    started_at: float
+) -> Dict[str, object]:
+    e2e = receiver["latencies"]
+    delivery_seconds = (receiver["last_at"] - started_at) if receiver["last_at"] else None
+    return {
+        "scenario": scenario,
+        "requests": len(ingest_latencies) + ingest_errors,
+        "ingest_errors": ingest_errors,
+        "ingest_rps": round(len(ingest_latencies) / load_seconds, 1) if load_seconds else None,
+        "ingest_p50_ms": _ms(percentile(ingest_latencies, 50)),
+        "ingest_p99_ms": _ms(percentile(ingest_latencies, 99)),
+        "expected_deliveries": expected_deliveries,
+        "delivered": receiver["delivered"],
+        "receiver_errors": receiver["errors"],
+        "duplicates": receiver["duplicates"],
+        "delivery_rps": round(receiver["delivered"] / delivery_seconds, 1) if delivery_seconds else None,
+        "e2e_p50_ms": _ms(percentile(e2e, 50)),
+        "e2e_p99_ms": _ms(percentile(e2e, 99)),
+    }
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Regressions of ``results`` against ``baseline`` beyond the allowed fraction."""
+    regressions = []
+    for key in THROUGHPUT_KEYS:
+        if results.get(key) and baseline.get(key) and results[key] < baseline[key] * (1 - max_regression):
+            regressions.append(f"{key}: {results[key]} < {baseline[key]}")
+    for key in LATENCY_KEYS:
+        if results.get(key) and baseline.get(key) and results[key] > baseline[key] * (1 + max_regression):
+            regressions.append(f"{key}: {results[key]} > {baseline[key]}")
+    if results["delivered"] < results["expected_deliveries"]:
+        regressions.append(f"delivered {results['delivered']} of {results['expected_deliveries']}")
+    return regressions
+
+
+class LocalStack:
+    """API, Celery worker and beat started as subprocesses for the duration of a run."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.log_dir = tempfile.mkdtemp(prefix="webhook-bench-")
+        self.processes: List[subprocess.Popen] = []
+
+    def _env(self, role: str) -> dict:
+        env = dict(os.environ, DATABASE_URL=self.args.database_url, REDIS_URL=self.args.redis_url, DB_PROCESS_ROLE=role)
+        # Leave the exporter port free; several benchmark workers may run side by side
+        env.setdefault("METRICS_WORKER_PORT", "0")
+        # The worker sizes its DB pool from this, so it matches --concurrency
+        env["WORKER_CONCURRENCY"] = str(self.args.worker_concurrency)
+        env.update(item.split("=", 1) for item in self.args.env)
+        return env
+
+    def _start(self, name: str, role: str, command: List[str]):
+        log = open(os.path.join(self.log_dir, f"{name}.log"), "wb")
+        self.processes.append(subprocess.Popen(command, env=self._env(role), stdout=log, stderr=subprocess.STDOUT))
+
+    def start(self):
+        port = httpx.URL(self.args.api_url).port or 80
+        self._start("api", "api", [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--port", str(port), "--workers", str(self.args.api_workers), "--log-level", "warning"
+        ])
+        self._start("worker", "worker", [
+            sys.executable, "-m", "celery", "-A", "app.tasks.worker", "worker",
+            "-Q", "deliveries,cleanup,scheduler", "--pool", "threads",
+            "--concurrency", str(self.args.worker_concurrency), "--loglevel", "warning"
+        ])
+        self._start("beat", "beat", [
+            sys.executable, "-m", "celery", "-A", "app.tasks.worker", "beat",
+            "-s", os.path.join(self.log_dir, "celerybeat-schedule"), "--loglevel", "warning"
+        ])
+        print(f"Started API, worker and beat; logs in {self.log_dir}")
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def _wait_for_api(client: httpx.AsyncClient, timeout: float):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            (await client.get("/")).raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.5)
+
+
+async def _create_subscriptions(client: httpx.AsyncClient, args: argparse.Namespace, run_id: str, event_type: str) -> List[str]:
+    subscription_ids = []
+    for index in range(args.subscriptions):
+        response = await client.post("/api/subscriptions/", json={
+            "name": f"bench-{run_id}-{index}",
+            "target_url": f"{args.receiver_url.rstrip('/')}/hooks/{index}",
+        })
+        response.raise_for_status()
+        subscription_id = response.json()["id"]
+        (await client.put(f"/api/subscriptions/{subscription_id}/event-types", json=[event_type])).raise_for_status()
+        subscription_ids.append(subscription_id)
+    return subscription_ids
+
+
+async def _drive(client: httpx.AsyncClient, args: argparse.Namespace, subscription_ids: List[str], event_type: str):
+    """Send ``args.requests`` ingests with ``args.concurrency`` in flight. Returns latencies and the error count."""
+    latencies: List[float] = []
+    errors = [0]
+    sequence = iter(range(args.requests))
+    filler = "x" * args.payload_bytes
+
+    async def sender():
+        for seq in sequence:
+            if args.scenario == "ingest":
+                path = f"/api/webhooks/ingest/{subscription_ids[seq % len(subscription_ids)]}"
+            else:
+                path = "/api/webhooks/ingest"
+            body = json.dumps({"bench_seq": seq, "sent_at": time.time(), "data": filler})
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    path, params={"event_type": event_type}, content=body,
+                    headers={"Content-Type": "application/json"}
+                )
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                errors[0] += 1
+
+    await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+    return latencies, errors[0]
+
+
+async def _wait_for_deliveries(receiver: httpx.AsyncClient, expected: int, timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        stats = (await receiver.get("/stats")).json()
+        if stats["delivered"] >= expected or time.monotonic() > deadline:
+            return stats
+        await asyncio.sleep(0.5)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    server = None
+    if not args.external_receiver:
+        import uvicorn
+
+        server = uvicorn.Server(uvicorn.Config(
+            create_receiver(receiver_config(args)), host=args.receiver_host,
+            port=args.receiver_port, log_level="warning"
+        ))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+    run_id = uuid.uuid4().hex[:8]
+    event_type = f"bench.{run_id}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=args.api_url, limits=limits, timeout=60) as client, \
+                httpx.AsyncClient(base_url=args.receiver_url, timeout=30) as receiver:
+            await _wait_for_api(client, args.startup_timeout)
+            (await receiver.post("/reset")).raise_for_status()
+            subscription_ids = await _create_subscriptions(client, args, run_id, event_type)
+            # Give every API process's subscription router time to pick up the new subscriptions
+            await asyncio.sleep(args.settle_seconds)
+            try:
+                started_at = time.time()
+                load_started = time.perf_counter()
+                latencies, errors = await _drive(client, args, subscription_ids, event_type)
+                load_seconds = time.perf_counter() - load_started
+                per_request = 1 if args.scenario == "ingest" else len(subscription_ids)
+                expected = len(latencies) * per_request
+                stats = await _wait_for_deliveries(receiver, expected, args.drain_timeout)
+            finally:
+                for subscription_id in subscription_ids:
+                    await client.delete(f"/api/subscriptions/{subscription_id}")
+    finally:
+        if server:
+            server.should_exit = True
+            await server_task
+    return summarize_run(args.scenario, latencies, errors, load_seconds, expected, stats, started_at)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark webhook ingest and delivery")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="fanout")
+    parser.add_argument("--requests", type=int, default=1000, help="Ingest requests to send")
+    parser.add_argument("--concurrency", type=int, default=50, help="Ingest requests in flight")
+    parser.add_argument("--subscriptions", type=int, default=10)
+    parser.add_argument("--payload-bytes", type=int, default=256, help="Filler added to each event payload")
+    parser.add_argument("--api-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--settle-seconds", type=float, default=1.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="How long to wait for deliveries")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed fraction of throughput/p99 regression")
+
+    group = parser.add_argument_group("receiver placement")
+    group.add_argument("--receiver-host", default="0.0.0.0")
+    group.add_argument("--receiver-port", type=int, default=9000)
+    group.add_argument("--receiver-url", help="Receiver URL as the workers reach it (default: http://127.0.0.1:PORT)")
+    group.add_argument("--external-receiver", action="store_true", help="Use a receiver started with benchmarks.receiver")
+    add_receiver_arguments(parser)
+
+    group = parser.add_argument_group("local stack (--spawn)")
+    group.add_argument("--spawn", action="store_true", help="Start the API, a Celery worker and beat locally")
+    group.add_argument("--database-url", default="sqlite:///./benchmark.db")
+    group.add_argument("--redis-url", default="redis://localhost:6379/0")
+    group.add_argument("--api-workers", type=int, default=2)
+    group.add_argument("--worker-concurrency", type=int, default=64)
+    group.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra settings for spawned processes")
+
+    args = parser.parse_args(argv)
+    args.receiver_url = args.receiver_url or f"http://127.0.0.1:{args.receiver_port}"
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    stack = LocalStack(args) if args.spawn else None
+    if stack:
+        stack.start()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if stack:
+            stack.stop()
+
+    width = max(len(key) for key in results)
+    for key, value in results.items():
+        print(f"{key.ljust(width)}  {value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
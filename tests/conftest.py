@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.base import Base
+
+@pytest.fixture
+def session_factory():
+    """Session factory bound to a fresh in-memory SQLite database"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+@pytest.fixture
+def db(session_factory):
+    """In-memory SQLite session with a fresh schema"""
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,13 @@
+from app.db.base import _async_url
+
+
+def test_async_url_postgres_uses_asyncpg():
+    url = _async_url("postgresql://user:pw@db.example.com/webhooks?sslmode=require")
+
+    assert url.drivername == "postgresql+asyncpg"
+    assert url.query == {"ssl": "require"}
+    assert url.database == "webhooks"
+
+
+def test_async_url_sqlite_uses_aiosqlite():
+    assert _async_url("sqlite:///./test.db").render_as_string() == "sqlite+aiosqlite:///./test.db"
@@ -0,0 +1,42 @@
+import json
+import time
+from starlette.testclient import TestClient
+from benchmarks.receiver import ReceiverConfig, create_receiver
+from benchmarks.run import compare, percentile
+
+def test_receiver_times_first_successful_delivery():
+    client = TestClient(create_receiver(ReceiverConfig()))
+    body = json.dumps({"bench_seq": 7, "sent_at": time.time() - 0.5})
+    
+    assert client.post("/hooks/0", content=body).status_code == 200
+    assert client.post("/hooks/0", content=body).status_code == 200
+    assert client.post("/hooks/1", content=body).status_code == 200
+    
+    stats = client.get("/stats").json()
+    assert stats["received"] == 3
+    assert stats["delivered"] == 2
+    assert stats["duplicates"] == 1
+    assert all(latency >= 0.5 for latency in stats["latencies"])
+    
+    client.post("/reset")
+    assert client.get("/stats").json()["received"] == 0
+
+def test_receiver_injects_failures_and_slow_bodies():
+    failing = TestClient(create_receiver(ReceiverConfig(error_rate=1.0)))
+    response = failing.post("/hooks/0", content=json.dumps({"bench_seq": 1, "sent_at": time.time()}))
+    assert response.status_code == 500
+    assert failing.get("/stats").json()["delivered"] == 0
+    
+    slow = TestClient(create_receiver(ReceiverConfig(slow_body_bytes=10000, slow_body_ms=20)))
+    assert len(slow.post("/hooks/0", content=b"{}").content) == 10000
+
+def test_percentile_and_regression_check():
+    assert percentile([], 50) is None
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile(list(range(101)), 99) == 99
+    
+    baseline = {"ingest_rps": 100, "delivery_rps": 100, "ingest_p99_ms": 10, "e2e_p99_ms": 100}
+    results = dict(baseline, delivered=10, expected_deliveries=10)
+    assert compare(results, baseline, 0.2) == []
+    results.update(ingest_rps=70, e2e_p99_ms=150, delivered=9)
+    assert len(compare(results, baseline, 0.2)) == 3
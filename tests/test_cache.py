@@ -0,0 +1,42 @@
+import uuid
+from unittest.mock import MagicMock
+from app.core import cache
+from app.core.cache import LocalTTLCache, get_subscription_for_delivery, invalidate_subscription_cache
+
+def test_local_ttl_cache_evicts_lru_and_expired():
+    local = LocalTTLCache(maxsize=2, ttl=60)
+    local.set("a", 1)
+    local.set("b", 2)
+    local.get("a")
+    local.set("c", 3)
+    
+    assert local.get("b") is None
+    assert local.get("a") == 1
+    
+    expired = LocalTTLCache(maxsize=2, ttl=-1)
+    expired.set("a", 1)
+    assert expired.get("a") is None
+
+def test_subscription_read_through(monkeypatch):
+    # Redis tier unavailable: only the local tier and the loader are exercised
+    monkeypatch.setattr(cache, "get_cached_subscription", lambda subscription_id: None)
+    monkeypatch.setattr(cache, "cache_subscription", lambda *args, **kwargs: None)
+    subscription_id = str(uuid.uuid4())
+    subscription = MagicMock(
+        target_url="https://example.com/hook", secret_key="s3cret", is_active=True,
+        rate_limit_per_second=None, rate_limit_burst=None
+    )
+    loader = MagicMock(return_value=subscription)
+    
+    first = get_subscription_for_delivery(subscription_id, loader)
+    second = get_subscription_for_delivery(subscription_id, loader)
+    
+    assert first == second == {
+        "target_url": "https://example.com/hook", "secret_key": "s3cret", "is_active": True,
+        "rate_limit_per_second": None, "rate_limit_burst": None
+    }
+    loader.assert_called_once()
+    
+    invalidate_subscription_cache(subscription_id)
+    get_subscription_for_delivery(subscription_id, loader)
+    assert loader.call_count == 2
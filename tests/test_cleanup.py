@@ -0,0 +1,61 @@
+import itertools
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from app.config import settings
+from app.db import crud, partitions
+from app.db.models import WebhookDelivery, DeliveryAttempt, AttemptStatus
+from app.db.crud import create_subscription, create_webhook_deliveries, create_delivery_attempt, cleanup_old_logs
+
+def test_cleanup_deletes_expired_rows_in_chunks(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    expired = create_webhook_deliveries(db, [subscription.id] * 5, {}, None)
+    [fresh] = create_webhook_deliveries(db, [subscription.id], {}, None)
+    long_ago = datetime.now() - timedelta(hours=settings.LOG_RETENTION_HOURS * 3)
+    db.query(WebhookDelivery).filter(WebhookDelivery.id.in_(expired)).update(
+        {"created_at": long_ago}, synchronize_session=False
+    )
+    db.commit()
+    for delivery_id in expired + [fresh]:
+        create_delivery_attempt(db, delivery_id, 1, AttemptStatus.FAILED)
+    
+    stats = cleanup_old_logs(db, batch_size=2)
+    
+    assert stats["complete"] is True
+    assert stats["chunks"] == 3
+    assert (stats["deliveries_deleted"], stats["attempts_deleted"]) == (5, 5)
+    assert [d.id for d in db.query(WebhookDelivery).all()] == [fresh]
+    assert db.query(DeliveryAttempt).count() == 1
+
+def test_cleanup_stops_at_time_budget(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    create_webhook_deliveries(db, [subscription.id] * 3, {}, None)
+    db.query(WebhookDelivery).update({"created_at": datetime(2000, 1, 1)})
+    db.commit()
+    
+    stats = cleanup_old_logs(db, batch_size=1, max_seconds=1e-9)
+    
+    assert stats["complete"] is False
+    assert db.query(WebhookDelivery).count() == 3
+
+def test_cleanup_is_incomplete_when_a_later_pass_runs_out_of_time(db, monkeypatch):
+    # Each clock read is a second later: the deliveries and payload passes finish, the rest don't start
+    clock = itertools.count()
+    monkeypatch.setattr(crud, "time", SimpleNamespace(monotonic=lambda: next(clock)))
+    
+    stats = cleanup_old_logs(db, batch_size=10, max_seconds=2.5)
+    
+    assert stats["complete"] is False
+    assert stats["pending"] == ["idempotency_keys", "rollups"]
+
+def test_row_cleanup_expires_at_the_partition_retention_cutoff(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    old, recent = create_webhook_deliveries(db, [subscription.id] * 2, {}, None)
+    cutoff = partitions.retention_cutoff()
+    db.get(WebhookDelivery, old).created_at = cutoff - timedelta(minutes=1)
+    db.get(WebhookDelivery, recent).created_at = cutoff + timedelta(minutes=1)
+    db.commit()
+    
+    cleanup_old_logs(db)
+    
+    # The same window partition drops use, not the retention counted twice
+    assert [d.id for d in db.query(WebhookDelivery).all()] == [recent]
@@ -0,0 +1,345 @@
+import hashlib
+import hmac
+import uuid
+import httpx
+import pytest
+from unittest.mock import patch
+from app.config import settings
+from app.core import cache
+from app.core.http import DeliveryEngine
+from app.core.metrics import DELIVERY_RETRIES
+from app.core.rate_limit import retry_after_seconds
+from app.db.models import WebhookDelivery, DeliveryAttempt, DeliveryMetricsRollup, DeliveryStatus, AttemptStatus
+from app.db.crud import (
+    create_subscription, create_webhook_deliveries, create_delivery_attempt, get_attempts, claim_deliveries
+)
+from app.tasks import delivery as delivery_tasks
+
+@pytest.fixture(autouse=True)
+def task_session(session_factory, monkeypatch):
+    """Run the tasks against the test database, bypassing the Redis cache tier"""
+    monkeypatch.setattr(delivery_tasks, "SessionLocal", session_factory)
+    monkeypatch.setattr(cache, "get_cached_subscription", lambda subscription_id: None)
+    monkeypatch.setattr(cache, "cache_subscription", lambda *args, **kwargs: None)
+    cache.local_subscription_cache.clear()
+
+class FakeCircuits:
+    """Circuit breaker stand-in: hosts are closed unless opened or half-opened"""
+    
+    def __init__(self):
+        self.open = {}  # host -> seconds until the next probe
+        self.half_open = set()
+        self.outcomes = []
+    
+    def check(self, host):
+        if host in self.half_open:
+            # This check takes the probe; the rest wait for its outcome
+            self.half_open.discard(host)
+            self.open[host] = 10
+            return 0
+        return self.open.get(host, 0)
+    
+    def record(self, host, success):
+        self.outcomes.append((host, success))
+        return "closed" if success else "open"
+
+@pytest.fixture(autouse=True)
+def circuits(monkeypatch):
+    fake = FakeCircuits()
+    monkeypatch.setattr(delivery_tasks, "check_circuit", fake.check)
+    monkeypatch.setattr(delivery_tasks, "record_outcome", fake.record)
+    return fake
+
+class FakeBuckets:
+    """Rate limit stand-in: grants every token unless ``granted`` caps it"""
+    
+    def __init__(self):
+        self.granted = None
+        self.wait = 0.0
+        self.calls = []
+    
+    def acquire(self, subscription_id, rate, burst, count=1):
+        self.calls.append((rate, burst, count))
+        granted = count if self.granted is None else min(count, self.granted)
+        return granted, self.wait if granted < count else 0.0
+
+@pytest.fixture(autouse=True)
+def buckets(monkeypatch):
+    fake = FakeBuckets()
+    monkeypatch.setattr(delivery_tasks, "acquire", fake.acquire)
+    return fake
+
+@pytest.fixture(autouse=True)
+def retries(monkeypatch):
+    """Retries handed to the retry scheduler as (delivery_id, delay), instead of Redis"""
+    scheduled = []
+    def schedule_retries(pairs):
+        scheduled.extend(pairs)
+        return True
+    
+    monkeypatch.setattr(delivery_tasks, "schedule_retries", schedule_retries)
+    monkeypatch.setattr(delivery_tasks, "schedule_retry", lambda delivery_id, delay: schedule_retries([(delivery_id, delay)]))
+    return scheduled
+
+@pytest.fixture
+def receivers(monkeypatch):
+    """Mock receivers: ok.test accepts, down.test returns 503"""
+    def handler(request):
+        return httpx.Response(200 if request.url.host == "ok.test" else 503, text="body")
+    
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(delivery_tasks, "delivery_engine", engine)
+    yield engine
+    engine.close()
+
+def test_process_webhook_batch_bulk_records_results(session_factory, receivers, circuits, retries):
+    db = session_factory()
+    ok = create_subscription(db, "ok", "https://ok.test/hook", secret_key="s")
+    down = create_subscription(db, "down", "https://down.test/hook")
+    ids = create_webhook_deliveries(db, [ok.id, down.id], {"order_id": 1}, "order.created")
+    
+    result = delivery_tasks.process_webhook_batch.run([str(i) for i in ids])
+    
+    assert result == {"status": "success", "delivered": 1, "retrying": 1, "deferred": 0, "failed": 0}
+    assert retries == [(str(ids[1]), delivery_tasks.calculate_backoff_delay(1))]
+    assert sorted(circuits.outcomes) == [("down.test", False), ("ok.test", True)]
+    
+    db.expire_all()
+    statuses = {d.id: (d.status, d.attempts_count) for d in db.query(WebhookDelivery).all()}
+    assert statuses == {ids[0]: (DeliveryStatus.DELIVERED, 1), ids[1]: (DeliveryStatus.PENDING, 1)}
+    attempts = {a.delivery_id: a for a in db.query(DeliveryAttempt).all()}
+    assert attempts[ids[0]].status == AttemptStatus.SUCCESS
+    assert attempts[ids[1]].status_code == 503
+    assert (attempts[ids[0]].response, attempts[ids[0]].response_bytes) == ("body", 4)
+    assert attempts[ids[0]].latency_ms is not None and attempts[ids[0]].request_bytes == len(b'{"order_id":1}')
+    assert attempts[ids[1]].next_retry_at is not None
+    rollups = {r.subscription_id: r for r in db.query(DeliveryMetricsRollup).all()}
+    assert (rollups[ok.id].status_2xx, rollups[down.id].status_5xx, rollups[down.id].latency_count) == (1, 1, 1)
+    db.close()
+
+def test_process_webhook_batch_fails_after_max_attempts(session_factory, receivers, retries):
+    db = session_factory()
+    down = create_subscription(db, "down", "https://down.test/hook")
+    [delivery_id] = create_webhook_deliveries(db, [down.id], {}, None)
+    db.query(WebhookDelivery).update({"attempts_count": settings.MAX_RETRY_ATTEMPTS - 1})
+    db.commit()
+    
+    result = delivery_tasks.process_webhook_batch.run([str(delivery_id)])
+    # Finished deliveries are not claimed again
+    delivery_tasks.process_webhook_batch.run([str(delivery_id)])
+    
+    assert result["failed"] == 1
+    assert retries == []
+    assert db.query(DeliveryAttempt).count() == 1
+    db.close()
+
+def test_claim_deliveries_claims_each_pending_row_once(db):
+    subscription = create_subscription(db, "ok", "https://ok.test/hook")
+    ids = create_webhook_deliveries(db, [subscription.id] * 2, {}, None)
+    
+    first = claim_deliveries(db, ids[:1])
+    # A second worker handed the same ids only gets the row nobody holds
+    second = claim_deliveries(db, ids)
+    
+    assert [d.id for d in first] == [ids[0]] and [d.id for d in second] == [ids[1]]
+    db.expire_all()
+    assert [d.attempts_count for d in db.query(WebhookDelivery).all()] == [1, 1]
+
+def test_process_webhook_batch_fails_deliveries_of_inactive_subscriptions(session_factory, receivers, retries):
+    db = session_factory()
+    inactive = create_subscription(db, "gone", "https://ok.test/hook")
+    inactive.is_active = False
+    db.commit()
+    [delivery_id] = create_webhook_deliveries(db, [inactive.id], {}, None)
+    
+    result = delivery_tasks.process_webhook_batch.run([str(delivery_id)])
+    
+    assert result["failed"] == 1 and retries == []
+    db.expire_all()
+    delivery = db.get(WebhookDelivery, delivery_id)
+    assert (delivery.status, delivery.attempts_count) == (DeliveryStatus.FAILED, 0)
+    db.close()
+
+def test_process_webhook_batch_falls_back_to_countdowns_without_redis(session_factory, receivers, monkeypatch):
+    monkeypatch.setattr(delivery_tasks, "schedule_retries", lambda pairs: False)
+    db = session_factory()
+    down = create_subscription(db, "down", "https://down.test/hook")
+    ids = create_webhook_deliveries(db, [down.id, down.id], {}, None)
+    
+    with patch.object(delivery_tasks.process_webhook_batch, "apply_async") as retry:
+        delivery_tasks.process_webhook_batch.run([str(i) for i in ids])
+    
+    # One countdown task per shared backoff delay
+    [call] = retry.call_args_list
+    assert sorted(call.args[0][0]) == sorted(str(i) for i in ids)
+    assert call.kwargs == {"countdown": delivery_tasks.calculate_backoff_delay(1)}
+    db.close()
+
+def test_process_webhook_batch_defers_open_circuits(session_factory, receivers, circuits, retries):
+    circuits.open["down.test"] = 30
+    db = session_factory()
+    ok = create_subscription(db, "ok", "https://ok.test/hook")
+    down = create_subscription(db, "down", "https://down.test/hook")
+    ids = create_webhook_deliveries(db, [ok.id, down.id], {}, None)
+    
+    result = delivery_tasks.process_webhook_batch.run([str(i) for i in ids])
+    
+    assert result["delivered"] == 1 and result["deferred"] == 1 and result["retrying"] == 0
+    assert retries == [(str(ids[1]), 30)]
+    
+    db.expire_all()
+    deferred = db.get(WebhookDelivery, ids[1])
+    assert (deferred.status, deferred.attempts_count) == (DeliveryStatus.PENDING, 0)
+    assert db.query(DeliveryAttempt).filter(DeliveryAttempt.delivery_id == ids[1]).count() == 0
+    db.close()
+
+def test_process_webhook_batch_sends_one_probe_to_a_half_open_circuit(session_factory, receivers, circuits, retries):
+    circuits.half_open.add("ok.test")
+    db = session_factory()
+    ok = create_subscription(db, "ok", "https://ok.test/hook")
+    other = create_subscription(db, "other", "https://ok.test/other")
+    ids = create_webhook_deliveries(db, [ok.id, ok.id, other.id], {}, None)
+    
+    result = delivery_tasks.process_webhook_batch.run([str(i) for i in ids])
+    
+    # One probe per host, whichever subscription it belongs to
+    assert circuits.outcomes == [("ok.test", True)]
+    assert (result["delivered"], result["deferred"]) == (1, 2)
+    assert [delay for _, delay in retries] == [10, 10]
+    db.close()
+
+def test_process_webhook_batch_defers_over_the_rate_limit(session_factory, receivers, buckets, retries):
+    buckets.granted, buckets.wait = 1, 0.5
+    db = session_factory()
+    limited = create_subscription(db, "limited", "https://ok.test/hook", rate_limit_per_second=1.0)
+    ids = [create_webhook_deliveries(db, [limited.id], {"n": n}, None)[0] for n in range(3)]
+    
+    result = delivery_tasks.process_webhook_batch.run([str(i) for i in ids])
+    
+    # One bucket call for the whole batch; the excess comes back one token interval apart
+    assert buckets.calls == [(1.0, 1, 3)]
+    assert result["delivered"] == 1 and result["deferred"] == 2
+    assert sorted(delay for _, delay in retries) == [1, 2]
+    db.expire_all()
+    assert sorted(d.attempts_count for d in db.query(WebhookDelivery).all()) == [0, 0, 1]
+    db.close()
+
+def test_process_webhook_defers_when_rate_limited(session_factory, receivers, buckets, retries):
+    buckets.granted, buckets.wait = 0, 2.5
+    db = session_factory()
+    limited = create_subscription(db, "limited", "https://ok.test/hook", rate_limit_per_second=0.5)
+    [delivery_id] = create_webhook_deliveries(db, [limited.id], {}, None)
+    deferrals = DELIVERY_RETRIES.labels("rate_limited")._value.get()
+    
+    result = delivery_tasks.process_webhook.run(str(delivery_id))
+    
+    # Deferred to the next token without sending or spending an attempt
+    assert (result["status"], result["retry_in"]) == ("deferred", 3)
+    assert retries == [(str(delivery_id), 3)]
+    assert DELIVERY_RETRIES.labels("rate_limited")._value.get() == deferrals + 1
+    db.expire_all()
+    assert db.get(WebhookDelivery, delivery_id).attempts_count == 0
+    assert db.query(DeliveryAttempt).count() == 0
+    db.close()
+
+def test_retry_after_feeds_the_bucket(session_factory, retries, monkeypatch):
+    penalties = []
+    monkeypatch.setattr(delivery_tasks, "penalize", lambda subscription_id, seconds, rate, burst: penalties.append(seconds))
+    engine = DeliveryEngine(transport=httpx.MockTransport(
+        lambda request: httpx.Response(429, headers={"Retry-After": "120"})
+    ))
+    monkeypatch.setattr(delivery_tasks, "delivery_engine", engine)
+    db = session_factory()
+    limited = create_subscription(db, "limited", "https://busy.test/hook", rate_limit_per_second=5.0, rate_limit_burst=10)
+    [delivery_id] = create_webhook_deliveries(db, [limited.id], {}, None)
+    
+    delivery_tasks.process_webhook_batch.run([str(delivery_id)])
+    
+    assert penalties == [120.0]
+    assert retries == [(str(delivery_id), 120)]
+    assert retry_after_seconds(httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retry_after_seconds(httpx.Response(429, headers={"Retry-After": "soon"})) is None
+    engine.close()
+    db.close()
+
+def test_process_webhook_releases_its_connection_during_the_send(session_factory, retries, monkeypatch):
+    sessions, open_during_send = [], []
+    def session_local():
+        sessions.append(session_factory())
+        return sessions[-1]
+    def handler(request):
+        open_during_send.append(any(session.in_transaction() for session in sessions))
+        return httpx.Response(503)
+    
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(delivery_tasks, "delivery_engine", engine)
+    monkeypatch.setattr(delivery_tasks, "SessionLocal", session_local)
+    db = session_factory()
+    down = create_subscription(db, "down", "https://down.test/hook")
+    [delivery_id] = create_webhook_deliveries(db, [down.id], {}, None)
+    
+    result = delivery_tasks.process_webhook.run(str(delivery_id))
+    
+    # The outcome is still recorded once the receiver has answered
+    assert open_during_send == [False]
+    assert result["status"] == "retry_scheduled" and result["status_code"] == 503
+    assert retries == [(str(delivery_id), delivery_tasks.calculate_backoff_delay(1))]
+    assert db.query(DeliveryAttempt).filter(DeliveryAttempt.delivery_id == delivery_id).one().status_code == 503
+    engine.close()
+    db.close()
+
+def test_process_webhook_batch_signs_the_sent_bytes(session_factory, monkeypatch):
+    seen = []
+    def handler(request):
+        seen.append((request.content, request.headers["X-Webhook-Signature"]))
+        return httpx.Response(200)
+    
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(delivery_tasks, "delivery_engine", engine)
+    db = session_factory()
+    subscription = create_subscription(db, "ok", "https://ok.test/hook", secret_key="s")
+    body = b'{"order_id": 1, "note": "caf\xc3\xa9"}'
+    ids = create_webhook_deliveries(db, [subscription.id], body, "order.created")
+    
+    delivery_tasks.process_webhook_batch.run([str(i) for i in ids])
+    
+    [(content, signature)] = seen
+    assert content == body
+    assert signature == hmac.new(b"s", body, hashlib.sha256).hexdigest()
+    engine.close()
+    db.close()
+
+def test_get_attempts_filters_by_latency(db):
+    subscription = create_subscription(db, "ok", "https://ok.test/hook")
+    [delivery_id] = create_webhook_deliveries(db, [subscription.id], {}, None)
+    for number, latency_ms in enumerate([12.5, 2500.0, None], start=1):
+        create_delivery_attempt(db, delivery_id, number, AttemptStatus.FAILED, latency_ms=latency_ms)
+    
+    slow = get_attempts(db, min_latency_ms=1000, subscription_id=subscription.id)
+    
+    assert [attempt.attempt_number for attempt in slow] == [2]
+    assert [attempt.attempt_number for attempt in get_attempts(db, max_latency_ms=100)] == [1]
+
+def test_fair_scheduling_queues_per_subscription(session_factory, receivers, monkeypatch):
+    monkeypatch.setattr(settings, "FAIR_SCHEDULING_ENABLED", True)
+    pushed, completed = [], []
+    monkeypatch.setattr(delivery_tasks, "push_deliveries", lambda pairs: pushed.extend(pairs) or True)
+    monkeypatch.setattr(delivery_tasks, "complete_deliveries", completed.extend)
+    db = session_factory()
+    ok = create_subscription(db, "ok", "https://ok.test/hook")
+    ids = [str(i) for i in create_webhook_deliveries(db, [ok.id, ok.id], {}, None)]
+    
+    # Subscriptions are looked up when the caller doesn't pass them; one token task per delivery
+    with patch.object(delivery_tasks, "group") as tokens:
+        delivery_tasks.enqueue_deliveries(ids)
+    assert pushed == [(ok.id, ids[0]), (ok.id, ids[1])]
+    assert len(list(tokens.call_args.args[0])) == 2
+    
+    # A token delivers whichever delivery the round-robin hands it
+    entry = f"{ok.id}:{ids[1]}"
+    monkeypatch.setattr(delivery_tasks, "take_deliveries", lambda count: [entry])
+    assert delivery_tasks.process_next_webhook.run()["status"] == "success"
+    assert completed == [entry]
+    db.expire_all()
+    assert db.get(WebhookDelivery, uuid.UUID(ids[1])).status == DeliveryStatus.DELIVERED
+    db.close()
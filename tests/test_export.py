@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.api import analytics
+from app.db.base import Base
+from app.db.models import DeliveryStatus, AttemptStatus
+from app.db.crud import create_subscription, create_webhook_deliveries, create_delivery_attempt, update_delivery_status
+
+client = TestClient(app)
+
+@pytest.fixture
+def export_db(tmp_path, monkeypatch):
+    """File-backed SQLite shared by a sync session for setup and the async engine the export streams from"""
+    path = tmp_path / "export.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    monkeypatch.setattr(analytics, "AsyncSessionLocal", async_sessionmaker(async_engine, expire_on_commit=False))
+    monkeypatch.setattr(analytics.settings, "EXPORT_YIELD_PER", 2)
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+def test_export_deliveries_ndjson_filters_by_status(export_db):
+    orders = create_subscription(export_db, "orders", "https://example.com/a")
+    ids = create_webhook_deliveries(export_db, [orders.id] * 5, {"a": 1}, "order.created")
+    update_delivery_status(export_db, ids[0], DeliveryStatus.DELIVERED)
+    
+    response = client.get("/api/analytics/export", params={"status": "pending", "subscription_id": str(orders.id)})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(record["id"] for record in records) == sorted(str(i) for i in ids[1:])
+    assert {record["status"] for record in records} == {"PENDING"}
+
+def test_export_attempts_csv(export_db):
+    orders = create_subscription(export_db, "orders", "https://example.com/a")
+    [delivery_id] = create_webhook_deliveries(export_db, [orders.id], {}, "order.created")
+    create_delivery_attempt(export_db, delivery_id, 1, AttemptStatus.FAILED, status_code=503, error="boom, again")
+    create_delivery_attempt(export_db, delivery_id, 2, AttemptStatus.SUCCESS, status_code=200)
+    
+    response = client.get("/api/analytics/export", params={"kind": "attempts", "format": "csv"})
+    
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["attempt_number"], row["status_code"], row["error"]) for row in rows] == [
+        ("1", "503", "boom, again"), ("2", "200", "")
+    ]
+    assert rows[0]["subscription_id"] == str(orders.id)
+
+def test_export_rejects_unknown_status():
+    response = client.get("/api/analytics/export", params={"kind": "attempts", "status": "PENDING"})
+    
+    assert response.status_code == 400
@@ -0,0 +1,83 @@
+import asyncio
+import httpx
+from app.config import settings
+from app.core.http import DeliveryEngine, attempt_fields
+
+def test_delivery_engine_limits_concurrency_per_host(monkeypatch):
+    monkeypatch.setattr(settings, "DELIVERY_PER_HOST_CONCURRENCY", 2)
+    monkeypatch.setattr(settings, "DELIVERY_PER_HOST_MAX_CONCURRENCY", 2)
+    in_flight = {}
+    peak = {}
+    
+    async def handler(request):
+        host = request.url.host
+        in_flight[host] = in_flight.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+        return httpx.Response(200, json={"ok": True})
+    
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    try:
+        requests = [{"url": f"https://{host}/hook", "json": {"n": i}} for i in range(10) for host in ("a.test", "b.test")]
+        responses = engine.send_many(requests)
+        
+        assert [r.status_code for r in responses] == [200] * 20
+        assert peak == {"a.test": 2, "b.test": 2}
+        assert engine.send("https://a.test/hook", json={}).status_code == 200
+    finally:
+        engine.close()
+
+def test_delivery_engine_returns_errors_in_place():
+    def handler(request):
+        if request.url.host == "down.test":
+            raise httpx.ConnectError("connection refused")
+        return httpx.Response(204)
+    
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    try:
+        ok, failed = engine.send_many([{"url": "https://up.test/"}, {"url": "https://down.test/"}])
+        
+        assert ok.status_code == 204
+        assert isinstance(failed, httpx.ConnectError)
+    finally:
+        engine.close()
+
+def test_adaptive_limit_backs_off_and_recovers():
+    from app.core.http import AdaptiveLimit
+    limit = AdaptiveLimit(initial=8, minimum=1, maximum=10)
+    
+    for _ in range(5):
+        limit.record(False)
+    assert int(limit.limit) == 1
+    
+    for _ in range(10):
+        limit.record(True)
+    assert int(limit.limit) > 1
+
+def test_delivery_engine_reads_a_bounded_response_prefix(monkeypatch):
+    monkeypatch.setattr(settings, "DELIVERY_RESPONSE_MAX_BYTES", 1024)
+    monkeypatch.setattr(settings, "DELIVERY_RESPONSE_TEXT_LIMIT", 100)
+    sent_chunks = []
+    
+    async def huge_error_page():
+        for _ in range(1000):
+            sent_chunks.append(1)
+            yield b"x" * 512
+    
+    async def handler(request):
+        return httpx.Response(500, content=huge_error_page())
+    
+    engine = DeliveryEngine(transport=httpx.MockTransport(handler))
+    try:
+        response = engine.send("https://big.test/hook", content=b"{}")
+    finally:
+        engine.close()
+    
+    fields = attempt_fields(response)
+    assert len(sent_chunks) < 10
+    assert fields["status_code"] == 500
+    assert fields["response"] == "x" * 100
+    assert fields["response_bytes"] is None
+    assert fields["latency_ms"] >= 0
+    assert fields["started_at"] <= fields["completed_at"]
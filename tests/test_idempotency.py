@@ -0,0 +1,38 @@
+from datetime import timedelta
+from app.db.models import WebhookDelivery, IngestIdempotencyKey, utcnow
+from app.db.crud import create_subscription, create_idempotent_deliveries, cleanup_old_logs
+
+def test_repeated_key_returns_original_deliveries(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    
+    first, created = create_idempotent_deliveries(db, str(subscription.id), "evt-1", [subscription.id], {"a": 1})
+    again, created_again = create_idempotent_deliveries(db, str(subscription.id), "evt-1", [subscription.id], {"a": 1})
+    
+    assert created is True and created_again is False
+    assert again == first
+    assert db.query(WebhookDelivery).count() == 1
+
+def test_key_is_reusable_after_dedup_window(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    first, _ = create_idempotent_deliveries(db, str(subscription.id), "evt-1", [subscription.id], {})
+    db.query(IngestIdempotencyKey).update({"expires_at": utcnow() - timedelta(seconds=1)})
+    db.commit()
+    
+    second, created = create_idempotent_deliveries(db, str(subscription.id), "evt-1", [subscription.id], {})
+    
+    assert created is True
+    assert second != first
+
+def test_cleanup_purges_expired_keys(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    create_idempotent_deliveries(db, str(subscription.id), "old", [subscription.id], {})
+    create_idempotent_deliveries(db, str(subscription.id), "new", [subscription.id], {})
+    db.query(IngestIdempotencyKey).filter(IngestIdempotencyKey.key == "old").update(
+        {"expires_at": utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+    
+    stats = cleanup_old_logs(db)
+    
+    assert stats["idempotency_keys_deleted"] == 1
+    assert [row.key for row in db.query(IngestIdempotencyKey).all()] == ["new"]
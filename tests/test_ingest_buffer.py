@@ -0,0 +1,145 @@
+import uuid
+from datetime import datetime
+from redis.exceptions import ConnectionError
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app.db import crud
+from app.core import ingest_buffer
+from app.db.models import WebhookDelivery, DeliveryStatus
+from app.db.crud import get_delivery_payload, create_subscription
+
+class FakeStream:
+    """Just enough of the Redis Streams consumer group API for the ingest buffer"""
+    def __init__(self):
+        self.entries = []
+        self.pending = {}
+        self.last_id = 0
+        self.dead_letters = []
+    
+    def xadd(self, key, fields, maxlen=None, approximate=True):
+        if key == ingest_buffer.INGEST_DEAD_LETTER_KEY:
+            self.dead_letters.append(fields)
+            return b"0-1"
+        self.last_id += 1
+        entry_id = f"{self.last_id}-0".encode()
+        self.entries.append((entry_id, {k.encode(): v if isinstance(v, bytes) else v.encode() for k, v in fields.items()}))
+        return entry_id
+    
+    def xgroup_create(self, key, group, id="0", mkstream=False):
+        pass
+    
+    def xautoclaim(self, key, group, consumer, min_idle_time, start_id="0-0", count=None):
+        return [b"0-0", [], []]
+    
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        if streams[ingest_buffer.INGEST_STREAM_KEY] == "0":
+            entries = [entry for entry in self.entries if entry[0] in self.pending]
+        else:
+            entries = [entry for entry in self.entries if entry[0] not in self.pending]
+            self.pending.update({entry[0]: consumer for entry in entries})
+        return [[ingest_buffer.INGEST_STREAM_KEY.encode(), entries[:count]]] if entries else []
+    
+    def xack(self, key, group, *ids):
+        for entry_id in ids:
+            self.pending.pop(entry_id, None)
+    
+    def xdel(self, key, *ids):
+        self.entries = [entry for entry in self.entries if entry[0] not in ids]
+
+def test_buffered_deliveries_are_persisted_then_enqueued(monkeypatch, session_factory, db):
+    stream = FakeStream()
+    monkeypatch.setattr(ingest_buffer, "redis_client", stream)
+    subscription_ids = [uuid.uuid4(), uuid.uuid4()]
+    
+    delivery_ids = ingest_buffer.buffer_deliveries(subscription_ids, b'{"order_id": 1}', "order.created")
+    
+    enqueued = []
+    flusher = ingest_buffer.IngestFlusher(session_factory, enqueued.extend, consumer="test")
+    assert flusher.flush_once() == 1
+    
+    rows = db.query(WebhookDelivery).order_by(WebhookDelivery.subscription_id).all()
+    assert sorted(str(row.id) for row in rows) == sorted(delivery_ids)
+    assert all(row.status == DeliveryStatus.PENDING and get_delivery_payload(db, row) == b'{"order_id": 1}' for row in rows)
+    assert enqueued == delivery_ids
+    assert stream.entries == [] and stream.pending == {}
+
+def test_unacked_entry_is_replayed_without_duplicates(monkeypatch, session_factory, db):
+    stream = FakeStream()
+    monkeypatch.setattr(ingest_buffer, "redis_client", stream)
+    ingest_buffer.buffer_deliveries([uuid.uuid4()], b'{"a": 1}', None)
+    
+    def broker_down(ids):
+        raise ConnectionError("broker down")
+    
+    # Rows are committed but the enqueue fails, so the entry stays pending
+    flusher = ingest_buffer.IngestFlusher(session_factory, broker_down, consumer="test")
+    try:
+        flusher.flush_once()
+    except ConnectionError:
+        pass
+    assert len(stream.pending) == 1
+    
+    enqueued = []
+    flusher.enqueue = enqueued.extend
+    assert flusher.drain(timeout=5) == 1
+    
+    assert db.query(WebhookDelivery).count() == 1
+    assert len(enqueued) == 1
+    assert stream.pending == {}
+
+def test_rejected_entry_is_dead_lettered_without_blocking_the_batch(monkeypatch, session_factory, db):
+    stream = FakeStream()
+    monkeypatch.setattr(ingest_buffer, "redis_client", stream)
+    db.execute(text("PRAGMA foreign_keys=ON"))
+    subscription = create_subscription(db, "kept", "https://example.com/hook")
+    [kept_id] = ingest_buffer.buffer_deliveries([subscription.id], b'{"a": 1}', None)
+    # Its subscription was deleted while the event sat in the stream
+    ingest_buffer.buffer_deliveries([uuid.uuid4()], b'{"a": 2}', None)
+    
+    enqueued = []
+    flusher = ingest_buffer.IngestFlusher(session_factory, enqueued.extend, consumer="test")
+    assert flusher.flush_once() == 2
+    
+    assert [str(row.id) for row in db.query(WebhookDelivery).all()] == [kept_id]
+    assert enqueued == [kept_id]
+    assert len(stream.dead_letters) == 1 and b"error" in stream.dead_letters[0]
+    assert stream.entries == [] and stream.pending == {}
+
+def test_database_outage_leaves_the_batch_pending(monkeypatch, session_factory):
+    stream = FakeStream()
+    monkeypatch.setattr(ingest_buffer, "redis_client", stream)
+    ingest_buffer.buffer_deliveries([uuid.uuid4()], b'{"a": 1}', None)
+    def database_down(db, rows):
+        raise OperationalError("INSERT", {}, Exception("connection refused"))
+    monkeypatch.setattr(ingest_buffer, "insert_buffered_deliveries", database_down)
+    
+    enqueued = []
+    flusher = ingest_buffer.IngestFlusher(session_factory, enqueued.extend, consumer="test")
+    try:
+        flusher.flush_once()
+    except OperationalError:
+        pass
+    
+    # Nothing is dead-lettered or acknowledged; the entry is flushed once the database is back
+    assert stream.dead_letters == [] and enqueued == []
+    assert len(stream.pending) == 1 and len(stream.entries) == 1
+
+def test_replayed_entry_is_skipped_without_on_conflict(monkeypatch, db):
+    monkeypatch.setattr(crud, "_dialect_insert", lambda db: None)
+    subscription = create_subscription(db, "orders", "https://example.com/hook")
+    rows = [{"id": uuid.uuid4(), "subscription_id": subscription.id, "payload": b"{}", "event_type": None,
+             "created_at": datetime.utcnow()}]
+    
+    crud.insert_buffered_deliveries(db, rows)
+    crud.insert_buffered_deliveries(db, rows)
+    
+    assert db.query(WebhookDelivery).count() == 1
+
+def test_buffer_reports_unavailable_redis(monkeypatch):
+    class DownRedis:
+        def xadd(self, key, fields):
+            raise ConnectionError("down")
+    
+    monkeypatch.setattr(ingest_buffer, "redis_client", DownRedis())
+    
+    assert ingest_buffer.buffer_deliveries([uuid.uuid4()], b'{}', None) is None
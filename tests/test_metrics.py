@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app.main import app
+from app.tasks import worker
+
+client = TestClient(app)
+
+def test_metrics_endpoint_reports_request_latency_and_pools():
+    client.get("/")
+    
+    response = client.get("/metrics")
+    
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{handler="root",method="GET",status="200"}' in response.text
+    assert 'db_pool_size{engine="sync",role="api"}' in response.text
+
+def test_queue_wait_counts_time_since_publish():
+    headers = {}
+    worker.stamp_enqueued_at(headers=headers)
+    task = SimpleNamespace(
+        name="app.tasks.delivery.process_webhook",
+        request=SimpleNamespace(eta=None, get=lambda key: headers[key] - 2)
+    )
+    labels = {"task": task.name}
+    before = REGISTRY.get_sample_value("celery_task_queue_wait_seconds_sum", labels) or 0
+    
+    worker.observe_queue_wait(task=task)
+    
+    waited = REGISTRY.get_sample_value("celery_task_queue_wait_seconds_sum", labels) - before
+    assert 2 <= waited < 3
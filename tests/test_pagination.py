@@ -0,0 +1,49 @@
+import pytest
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from app.core.pagination import encode_cursor, decode_cursor, next_cursor
+from app.db.models import WebhookDelivery
+from app.db.crud import create_subscription, create_webhook_deliveries, get_subscription_deliveries, get_subscriptions
+
+def test_cursor_round_trip():
+    created_at = datetime(2025, 5, 2, 17, 12, 49)
+    
+    assert decode_cursor(encode_cursor(created_at, "abc")) == (created_at, "abc")
+    with pytest.raises(HTTPException):
+        decode_cursor("not-a-cursor")
+    
+    # Typed cursors reject well-formed tokens with the wrong values
+    assert decode_cursor(encode_cursor(3), int) == (3,)
+    for token in (encode_cursor("abc"), encode_cursor(3, 4)):
+        with pytest.raises(HTTPException) as error:
+            decode_cursor(token, int)
+        assert error.value.status_code == 400
+
+def test_keyset_pages_cover_every_delivery_once(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    ids = create_webhook_deliveries(db, [subscription.id] * 7, {}, None)
+    # Two rows share a created_at so the id tiebreak is exercised
+    base = datetime(2025, 1, 1)
+    for offset, delivery_id in enumerate(ids):
+        db.get(WebhookDelivery, delivery_id).created_at = base + timedelta(seconds=min(offset, 5))
+    db.commit()
+    
+    seen = []
+    cursor = None
+    while True:
+        page = get_subscription_deliveries(db, subscription.id, limit=3, before=decode_cursor(cursor))
+        seen.extend(delivery.id for delivery in page)
+        cursor = next_cursor(page, 3, "created_at", "id")
+        if not cursor:
+            break
+    
+    assert sorted(seen, key=str) == sorted(ids, key=str)
+    assert len(seen) == len(set(seen))
+
+def test_subscription_keyset_page(db):
+    created = [create_subscription(db, f"sub-{i}", "https://example.com/a") for i in range(3)]
+    
+    first = get_subscriptions(db, limit=2)
+    rest = get_subscriptions(db, limit=2, after=decode_cursor(next_cursor(first, 2, "created_at", "id")))
+    
+    assert {s.id for s in first + rest} == {s.id for s in created}
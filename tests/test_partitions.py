@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from app.config import settings
+from app.db import partitions
+
+def test_partition_names_round_trip(monkeypatch):
+    monkeypatch.setattr(settings, "DB_PARTITION_INTERVAL", "hour")
+    start = partitions.partition_start(datetime(2025, 5, 2, 17, 12, 49, tzinfo=timezone.utc))
+    name = partitions.partition_name("webhook_deliveries", start)
+    
+    assert name == "webhook_deliveries_p2025050217"
+    assert partitions.parse_partition_start("webhook_deliveries", name) == start
+    assert partitions.parse_partition_start("webhook_deliveries", "webhook_deliveries_default") is None
+
+def test_only_fully_expired_partitions_are_dropped(monkeypatch):
+    monkeypatch.setattr(settings, "DB_PARTITION_INTERVAL", "day")
+    monkeypatch.setattr(settings, "LOG_RETENTION_HOURS", 72)
+    now = datetime(2025, 5, 10, 12, 0, tzinfo=timezone.utc)
+    names = [
+        "delivery_attempts_default",
+        "delivery_attempts_p20250506",  # ends May 7 00:00, before the May 7 12:00 cutoff
+        "delivery_attempts_p20250507",  # still holds rows inside retention
+        "delivery_attempts_p20250510",
+    ]
+    
+    assert partitions.expired_partitions("delivery_attempts", names, now) == ["delivery_attempts_p20250506"]
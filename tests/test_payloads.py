@@ -0,0 +1,55 @@
+from datetime import datetime
+from app.core.payloads import GZIP, IDENTITY, serialize_payload
+from app.db.models import WebhookDelivery, WebhookPayload
+from app.db.crud import create_subscription, create_webhook_deliveries, create_batch_deliveries, get_delivery_payload, cleanup_old_logs
+
+def test_fan_out_stores_payload_once(db):
+    subscriptions = [create_subscription(db, f"sub-{i}", "https://example.com/a") for i in range(3)]
+    payload = {"items": ["x" * 100] * 50}
+    
+    ids = create_webhook_deliveries(db, [s.id for s in subscriptions], payload, "order.created")
+    create_webhook_deliveries(db, [subscriptions[0].id], payload, "order.created")
+    
+    [stored] = db.query(WebhookPayload).all()
+    assert stored.encoding == GZIP
+    assert len(stored.body) < stored.size
+    delivery = db.get(WebhookDelivery, ids[0])
+    assert delivery.payload is None
+    assert get_delivery_payload(db, delivery) == serialize_payload(payload)
+
+def test_small_payloads_are_stored_uncompressed(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    create_webhook_deliveries(db, [subscription.id], {"a": 1}, None)
+    
+    assert db.query(WebhookPayload).one().encoding == IDENTITY
+
+def test_cleanup_deletes_unreferenced_payloads(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    create_webhook_deliveries(db, [subscription.id], {"old": True}, None)
+    [kept] = create_webhook_deliveries(db, [subscription.id], {"new": True}, None)
+    db.query(WebhookDelivery).update({"created_at": datetime(2000, 1, 1)})
+    db.query(WebhookPayload).update({"expires_at": datetime(2000, 1, 1)})
+    # The newer delivery is still within retention and keeps its payload alive
+    db.query(WebhookDelivery).filter(WebhookDelivery.id == kept).update({"created_at": datetime.utcnow()})
+    db.commit()
+    
+    stats = cleanup_old_logs(db)
+    
+    assert (stats["deliveries_deleted"], stats["payloads_deleted"]) == (1, 1)
+    assert get_delivery_payload(db, db.get(WebhookDelivery, kept)) == b'{"new":true}'
+
+def test_raw_body_is_stored_verbatim(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a")
+    body = b'{ "b": 2, "a": 1 }'
+    [delivery_id] = create_webhook_deliveries(db, [subscription.id], body, None)
+    
+    assert get_delivery_payload(db, db.get(WebhookDelivery, delivery_id)) == body
+
+def test_batch_stores_each_distinct_payload_once(db):
+    a, b = [create_subscription(db, f"sub-{i}", "https://example.com/a") for i in range(2)]
+    
+    created = create_batch_deliveries(db, [([a.id, b.id], b"{}", "x"), ([a.id], b"{}", "y"), ([], b"[]", None)])
+    
+    assert [len(ids) for ids in created] == [2, 1, 0]
+    assert db.query(WebhookDelivery).count() == 3
+    assert db.query(WebhookPayload).count() == 2
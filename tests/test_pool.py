@@ -0,0 +1,47 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from app.config import settings
+from app.db.pool import engine_options, pool_status, TimedQueuePool, TimedAsyncAdaptedQueuePool
+
+
+def test_engine_options_use_role_pool_size(monkeypatch):
+    monkeypatch.setattr(settings, "DB_PROCESS_ROLE", "worker")
+    monkeypatch.setattr(settings, "DB_POOL_SIZE_WORKER", 7)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW_WORKER", 3)
+    monkeypatch.setattr(settings, "WORKER_CONCURRENCY", 8)
+
+    options = engine_options("postgresql://db/webhooks")
+
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_size"] == 7
+    assert options["max_overflow"] == 3
+    assert options["pool_pre_ping"] is True
+
+    # Overflow covers every worker thread
+    monkeypatch.setattr(settings, "WORKER_CONCURRENCY", 64)
+    assert engine_options("postgresql://db/webhooks")["max_overflow"] == 57
+
+
+def test_external_pooler_uses_null_pool_outside_api(monkeypatch):
+    monkeypatch.setattr(settings, "DB_EXTERNAL_POOLER", True)
+    monkeypatch.setattr(settings, "DB_PROCESS_ROLE", "beat")
+    assert engine_options("postgresql://db/webhooks")["poolclass"] is NullPool
+
+    # The API keeps its pool but drops asyncpg's prepared statement caches
+    monkeypatch.setattr(settings, "DB_PROCESS_ROLE", "api")
+    options = engine_options("postgresql+asyncpg://db/webhooks", is_async=True)
+    assert options["poolclass"] is TimedAsyncAdaptedQueuePool
+    assert options["connect_args"]["statement_cache_size"] == 0
+
+
+def test_pool_status_reports_checkouts(tmp_path):
+    url = f"sqlite:///{tmp_path}/pool.db"
+    engine = create_engine(url, **engine_options(url))
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        status = pool_status(engine)
+
+    assert status["checked_out"] == 1
+    assert status["checkouts"] == 1
+    assert status["timeouts"] == 0
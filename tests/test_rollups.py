@@ -0,0 +1,68 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from app.core.rollups import COUNTER_COLUMNS, rollup_rows, summarize
+from app.db.models import AttemptStatus, DeliveryMetricsRollup
+from app.db.crud import record_attempt_rollups, get_metrics_rollups, cleanup_old_logs
+
+def sample(subscription_id, status_code, latency, event_type="order.created", minute=0):
+    return {
+        "subscription_id": subscription_id,
+        "event_type": event_type,
+        "status": AttemptStatus.SUCCESS if status_code and status_code < 300 else AttemptStatus.FAILED,
+        "status_code": status_code,
+        "latency": latency,
+        "timestamp": datetime(2025, 1, 1, 12, minute, 30, tzinfo=timezone.utc),
+    }
+
+def test_rollup_rows_aggregate_per_minute():
+    subscription_id = uuid.uuid4()
+    
+    rows = rollup_rows([
+        sample(subscription_id, 200, 0.02),
+        sample(subscription_id, 503, 0.3),
+        sample(subscription_id, None, None),
+        sample(subscription_id, 200, 0.04, minute=1),
+    ])
+    
+    assert len(rows) == 2
+    first = rows[0]
+    assert (first["attempts"], first["successes"], first["failures"]) == (3, 1, 2)
+    assert (first["status_2xx"], first["status_5xx"], first["errors"]) == (1, 1, 1)
+    assert (first["latency_count"], first["latency_le_25"], first["latency_le_500"]) == (2, 1, 1)
+
+def test_summarize_estimates_percentiles_from_buckets():
+    rows = rollup_rows([sample(uuid.uuid4(), 200, 0.06) for _ in range(99)] + [sample(uuid.uuid4(), 200, 3.0)])
+    totals = {column: sum(row[column] for row in rows) for column in COUNTER_COLUMNS}
+    
+    summary = summarize(totals)
+    
+    assert summary["success_rate"] == 1.0
+    assert 50 < summary["latency_ms"]["p50"] <= 100
+    assert summary["latency_ms"]["p99"] <= 100
+    assert summary["latency_ms"]["histogram"]["le_5000"] == 1
+
+def test_rollups_accumulate_across_upserts(db):
+    a, b = uuid.uuid4(), uuid.uuid4()
+    record_attempt_rollups(db, [sample(a, 200, 0.01), sample(b, 500, 0.2)])
+    db.commit()
+    record_attempt_rollups(db, [sample(a, 404, 0.01, event_type=None)])
+    record_attempt_rollups(db, [sample(a, 200, 0.01)])
+    db.commit()
+    
+    assert db.query(DeliveryMetricsRollup).count() == 3
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    groups = get_metrics_rollups(db, start, start + timedelta(days=1), a, group_by=["event_type"])
+    assert [(group["event_type"], group["attempts"], group["status_4xx"]) for group in groups] == [("", 1, 1), ("order.created", 2, 0)]
+    [totals] = get_metrics_rollups(db, start, start + timedelta(days=1))
+    assert (totals["attempts"], totals["failures"]) == (4, 2)
+
+def test_expired_rollups_are_deleted_in_row_batches(db):
+    # Three rows share one expired minute; batches are bounded by rows, not buckets
+    record_attempt_rollups(db, [sample(uuid.uuid4(), 200, 0.01) for _ in range(3)])
+    record_attempt_rollups(db, [{**sample(uuid.uuid4(), 200, 0.01), "timestamp": datetime.now(timezone.utc)}])
+    db.commit()
+    
+    stats = cleanup_old_logs(db, batch_size=2)
+    
+    assert stats["rollups_deleted"] == 3 and stats["complete"] is True
+    assert db.query(DeliveryMetricsRollup).count() == 1
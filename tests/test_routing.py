@@ -0,0 +1,65 @@
+from app.db.models import Subscription
+from app.db.crud import (
+    create_subscription, get_subscriptions_for_event_type,
+    update_subscription_event_types, backfill_subscription_event_types
+)
+
+def test_event_type_routing_is_exact(db):
+    orders = create_subscription(db, "orders", "https://example.com/a", event_types=["order.created"])
+    prefixed = create_subscription(db, "prefixed", "https://example.com/b", event_types=["x.order.created.v2"])
+    catch_all = create_subscription(db, "all", "https://example.com/c")
+    
+    matched = {s.id for s in get_subscriptions_for_event_type(db, "order.created")}
+    
+    assert matched == {orders.id, catch_all.id}
+    assert prefixed.id not in matched
+
+def test_update_event_types_maintains_routing(db):
+    subscription = create_subscription(db, "orders", "https://example.com/a", event_types=["order.created"])
+    
+    update_subscription_event_types(db, subscription.id, ["invoice.paid"])
+    
+    assert get_subscriptions_for_event_type(db, "order.created") == []
+    assert [s.id for s in get_subscriptions_for_event_type(db, "invoice.paid")] == [subscription.id]
+
+def test_backfill_existing_subscriptions(db):
+    legacy = Subscription(name="legacy", target_url="https://example.com/a", event_types=["order.created"])
+    db.add(legacy)
+    db.commit()
+    
+    assert get_subscriptions_for_event_type(db, "order.created") == []
+    assert backfill_subscription_event_types(db) == 1
+    assert [s.id for s in get_subscriptions_for_event_type(db, "order.created")] == [legacy.id]
+
+def test_router_incremental_updates():
+    from app.core.routing import SubscriptionRouter
+    router = SubscriptionRouter()
+    router.ready = True
+    
+    router.apply_message({"id": "00000000-0000-0000-0000-000000000001", "target_url": "https://example.com/a",
+                          "is_active": True, "event_types": ["order.created"]})
+    router.apply_message({"id": "00000000-0000-0000-0000-000000000002", "target_url": "https://example.com/b",
+                          "is_active": True, "event_types": []})
+    
+    assert [r.target_url for r in router.route("order.created")] == ["https://example.com/a", "https://example.com/b"]
+    assert [r.target_url for r in router.route("invoice.paid")] == ["https://example.com/b"]
+    
+    # Deactivation and deletion drop the subscription from every route
+    router.apply_message({"id": "00000000-0000-0000-0000-000000000001", "target_url": "https://example.com/a",
+                          "is_active": False, "event_types": ["order.created"]})
+    router.apply_message({"id": "00000000-0000-0000-0000-000000000002", "deleted": True})
+    
+    assert router.route("order.created") == ()
+    assert router.get("00000000-0000-0000-0000-000000000001") is None
+
+def test_router_returns_each_subscription_once():
+    from app.core.routing import SubscriptionRouter
+    router = SubscriptionRouter()
+    router.ready = True
+    
+    for number, event_types in enumerate([["a", "a"], ["a", "*"], []], start=1):
+        router.apply_message({"id": f"00000000-0000-0000-0000-00000000000{number}", "target_url": "https://example.com/a",
+                              "is_active": True, "event_types": event_types})
+    
+    assert sorted(route.id.int for route in router.route("a")) == [1, 2, 3]
+    assert sorted(route.id.int for route in router.route(None)) == [2, 3]
@@ -0,0 +1,100 @@
+from unittest.mock import patch
+from app.core import fair_queue, retries
+from app.db.crud import create_subscription
+from app.tasks import scheduler
+
+class FakeSortedSet:
+    """Just enough of the Redis sorted set API for the retry schedule"""
+    def __init__(self):
+        self.items = {}
+    
+    def zadd(self, key, mapping):
+        self.items.update(mapping)
+    
+    def zrangebyscore(self, key, low, high, start=0, num=None):
+        due = sorted((score, member) for member, score in self.items.items() if score <= high)
+        return [member.encode() for score, member in due][start:start + num]
+    
+    def zrem(self, key, *members):
+        for member in members:
+            self.items.pop(member, None)
+    
+    def zcard(self, key):
+        return len(self.items)
+    
+    def evalsha(self, sha, numkeys, key, due_before, *members):
+        # The remove-if-still-due script
+        due = [member for member in members if self.items.get(member, float("inf")) <= due_before]
+        self.zrem(key, *due)
+        return len(due)
+
+def test_due_retries_are_enqueued_in_bulk(monkeypatch):
+    fake = FakeSortedSet()
+    monkeypatch.setattr(retries, "redis_client", fake)
+    monkeypatch.setattr(scheduler.settings, "RETRY_SCHEDULER_BATCH_SIZE", 2)
+    
+    assert retries.schedule_retries([("due-1", -10), ("due-2", -5), ("due-3", -1), ("later", 600)])
+    
+    with patch.object(scheduler, "enqueue_deliveries") as enqueue:
+        result = scheduler.enqueue_due_retries.run()
+    
+    assert result == {"status": "success", "enqueued": 3}
+    assert [call.args[0] for call in enqueue.call_args_list] == [["due-1", "due-2"], ["due-3"]]
+    assert retries.pending_retry_count() == 1
+
+def test_retry_rescheduled_during_enqueue_is_kept(monkeypatch):
+    fake = FakeSortedSet()
+    monkeypatch.setattr(retries, "redis_client", fake)
+    retries.schedule_retries([("due-1", -10), ("due-2", -5)])
+    
+    # A worker runs due-1 straight away, fails and schedules its next attempt
+    def enqueue(delivery_ids):
+        retries.schedule_retry("due-1", 30)
+    
+    with patch.object(scheduler, "enqueue_deliveries", side_effect=enqueue):
+        result = scheduler.enqueue_due_retries.run()
+    
+    assert result["enqueued"] == 2
+    assert list(fake.items) == ["due-1"]
+
+class FakeHashes:
+    """Just enough of the Redis hash API for the fair-scheduling weights"""
+    def __init__(self):
+        self.hashes = {}
+        self.strings = {}
+    
+    def exists(self, key):
+        return int(key in self.hashes or key in self.strings)
+    
+    def hsetnx(self, key, field, value):
+        self.hashes.setdefault(key, {}).setdefault(field, value)
+    
+    def set(self, key, value):
+        self.strings[key] = value
+    
+    def pipeline(self):
+        return self
+    
+    def execute(self):
+        pass
+
+def test_missing_fair_weights_are_loaded_from_the_database(monkeypatch, session_factory, db):
+    redis = FakeHashes()
+    monkeypatch.setattr(fair_queue, "redis_client", redis)
+    monkeypatch.setattr(scheduler, "SessionLocal", session_factory)
+    monkeypatch.setattr(scheduler, "reclaim_stalled", lambda limit: 0)
+    heavy = create_subscription(db, "heavy", "https://example.com/a", delivery_weight=5)
+    edited = create_subscription(db, "edited", "https://example.com/b", delivery_weight=2)
+    create_subscription(db, "default", "https://example.com/c")
+    # Written after the flush, before the tick: the newer weight wins
+    redis.hashes[fair_queue.WEIGHTS_KEY] = {str(edited.id): 8}
+    
+    scheduler.reclaim_fair_deliveries()
+    
+    assert redis.hashes[fair_queue.WEIGHTS_KEY] == {str(heavy.id): 5, str(edited.id): 8}
+    assert fair_queue.weights_loaded()
+    
+    # Loaded once; later ticks leave the hash alone
+    redis.hashes[fair_queue.WEIGHTS_KEY].pop(str(heavy.id))
+    scheduler.reclaim_fair_deliveries()
+    assert str(heavy.id) not in redis.hashes[fair_queue.WEIGHTS_KEY]
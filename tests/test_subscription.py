@@ -5,9 +5,16 @@ from sqlalchemy.orm import Session
 from app.main import app
 from app.db.models import Subscription
 from app.db.crud import create_subscription, get_subscription
+from app.db.base import engine
+from app.db.schema import upgrade_schema
 
 client = TestClient(app)
 
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    """The client doesn't run startup hooks, so bring the app's database up to date here"""
+    upgrade_schema(engine)
+
 @pytest.fixture
 def db_session(monkeypatch):
     """Create a test database session"""
@@ -72,7 +79,7 @@ def db_session(monkeypatch):
             mock_session.close()
             
     monkeypatch.setattr("app.db.base.get_db", override_get_db)
-    monkeypatch.setattr("app.api.subscriptions.get_db", override_get_db)
+    monkeypatch.setattr("app.api.subscriptions.get_async_db", override_get_db)
     
     return mock_session
 
@@ -4,7 +4,8 @@ from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from app.main import app
-from app.db.models import Subscription, WebhookDelivery, DeliveryStatus
+from app.api import webhooks
+from app.db.models import Subscription, WebhookDelivery, DeliveryStatus, ALL_EVENT_TYPES
 
 client = TestClient(app)
 
@@ -44,6 +45,12 @@ def mock_db():
             return delivery
         return None
     
+    # Mock create_webhook_deliveries (bulk fan-out)
+    def mock_create_webhook_deliveries(db, subscription_ids, payload, event_type=None):
+        delivery.payload = payload
+        delivery.event_type = event_type
+        return [delivery.id for sub_id in subscription_ids if sub_id == subscription_id]
+    
     # Mock get_subscriptions_for_event_type
     def mock_get_subscriptions_for_event_type(db, event_type=None):
         if event_type is None or event_type in subscription.event_types:
@@ -60,14 +67,15 @@ def mock_db():
     # Apply mocks
     with patch("app.api.webhooks.get_subscription", mock_get_subscription), \
          patch("app.api.webhooks.create_webhook_delivery", mock_create_webhook_delivery), \
+         patch("app.api.webhooks.create_webhook_deliveries", mock_create_webhook_deliveries), \
          patch("app.api.webhooks.get_subscriptions_for_event_type", mock_get_subscriptions_for_event_type), \
          patch("app.api.webhooks.update_subscription_event_types", mock_update_subscription_event_types), \
-         patch("app.api.webhooks.process_webhook.delay") as mock_process:
+         patch("app.api.webhooks.enqueue_deliveries") as mock_enqueue:
          
         mock_data = {
             "subscription": subscription,
             "delivery": delivery,
-            "process_webhook_mock": mock_process
+            "enqueue_deliveries_mock": mock_enqueue
         }
         
         yield mock_data
@@ -88,7 +96,7 @@ def test_ingest_webhook(mock_db):
     assert "delivery_id" in data
     
     # Verify background task was added
-    mock_db["process_webhook_mock"].assert_called_once_with(str(mock_db["delivery"].id))
+    mock_db["enqueue_deliveries_mock"].assert_called_once_with([str(mock_db["delivery"].id)], [subscription_id])
 
 def test_ingest_webhook_inactive_subscription(mock_db):
     subscription_id = mock_db["subscription"].id
@@ -121,8 +129,21 @@ def test_ingest_webhook_to_all(mock_db):
     assert data["delivery_count"] == 1
     assert len(data["delivery_ids"]) == 1
     
-    # Verify background task was added
-    mock_db["process_webhook_mock"].assert_called_once_with(str(mock_db["delivery"].id))
+    # Verify all deliveries were queued as one batch
+    mock_db["enqueue_deliveries_mock"].assert_called_once_with([str(mock_db["delivery"].id)], [mock_db["subscription"].id])
+
+def test_ingest_webhook_to_all_reaches_catch_all_subscriptions_without_router(mock_db):
+    subscription = mock_db["subscription"]
+    subscription.event_types = [ALL_EVENT_TYPES, "customer.updated"]
+    
+    # The DB returns subscriptions with a '*' row for any event type
+    with patch("app.api.webhooks.get_subscriptions_for_event_type", lambda db, event_type=None: [subscription]), \
+         patch.object(webhooks.subscription_router, "ready", False):
+        response = client.post("/api/webhooks/ingest", json={"order_id": 1}, params={"event_type": "order.shipped"})
+    
+    assert response.status_code == 202
+    assert response.json()["delivery_count"] == 1
+    mock_db["enqueue_deliveries_mock"].assert_called_once_with([str(mock_db["delivery"].id)], [subscription.id])
 
 def test_update_subscription_event_types(mock_db):
     subscription_id = mock_db["subscription"].id
@@ -136,4 +157,64 @@ def test_update_subscription_event_types(mock_db):
     assert response.status_code == 200
     data = response.json()
     assert data["id"] == str(subscription_id)
-    assert data["event_types"] == new_event_types
\ No newline at end of file
+    assert data["event_types"] == new_event_types
+def test_ingest_webhook_duplicate_idempotency_key(mock_db):
+    subscription_id = mock_db["subscription"].id
+    
+    with patch("app.api.webhooks.claim_idempotency_key", return_value=["original-delivery"]):
+        response = client.post(
+            f"/api/webhooks/ingest/{subscription_id}",
+            json={"order_id": "12345"},
+            params={"event_type": "order.created"},
+            headers={"Idempotency-Key": "order-12345"}
+        )
+    
+    assert response.status_code == 202
+    assert response.json() == {"status": "accepted", "delivery_id": "original-delivery", "duplicate": True}
+    mock_db["enqueue_deliveries_mock"].assert_not_called()
+
+def test_ingest_webhook_batch_ndjson(mock_db):
+    subscription = mock_db["subscription"]
+    created = []
+    
+    def mock_create_batch_deliveries(db, events):
+        created.extend(events)
+        return [[uuid.uuid4() for _ in subscription_ids] for subscription_ids, _, _ in events]
+    
+    body = "\n".join([
+        '{"event_type": "order.created", "payload": {"order_id": 1}}',
+        '{"event_type": "order.created", "payload": {"order_id": 2}}',
+        'not json',
+        f'{{"event_type": "invoice.paid", "payload": {{}}, "subscription_id": "{subscription.id}"}}',
+        '{"event_type": "order.created"}',
+    ])
+    with patch("app.api.webhooks.create_batch_deliveries", mock_create_batch_deliveries), \
+         patch("app.api.webhooks.get_subscriptions_by_ids", lambda db, ids: [subscription]), \
+         patch.object(webhooks.subscription_router, "ready", False):
+        response = client.post(
+            "/api/webhooks/ingest/batch",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+    
+    assert response.status_code == 202
+    data = response.json()
+    assert [result["status"] for result in data["results"]] == ["accepted", "accepted", "rejected", "skipped", "rejected"]
+    assert (data["accepted"], data["delivery_count"]) == (2, 2)
+    assert created == [
+        ([subscription.id], b'{"order_id":1}', "order.created"),
+        ([subscription.id], b'{"order_id":2}', "order.created"),
+    ]
+    mock_db["enqueue_deliveries_mock"].assert_called_once()
+
+def test_ingest_webhook_batch_untyped_event_skips_typed_subscriptions_without_router(mock_db):
+    # The DB fallback returns every active subscription for a missing event type
+    with patch("app.api.webhooks.create_batch_deliveries") as create, \
+         patch.object(webhooks.subscription_router, "ready", False):
+        response = client.post("/api/webhooks/ingest/batch", json=[{"payload": {"order_id": 1}}])
+    
+    assert response.status_code == 202
+    assert response.json()["results"] == [
+        {"index": 0, "status": "accepted", "delivery_ids": [], "message": "No matching subscriptions"}
+    ]
+    mock_db["enqueue_deliveries_mock"].assert_not_called()